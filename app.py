@@ -1,18 +1,28 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
-import calendar
-import os
-import json
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-import base64
-from io import BytesIO
+import functools
+import json
 import uuid
-from google.ads.googleads.client import GoogleAdsClient
-from google.ads.googleads.errors import GoogleAdsException
+from share_of_search.aggregation import month_range
+from share_of_search.brand_import import BRAND_COLORS, IMPORT_EXTENSIONS, brands_to_table, import_brand_file, merge_brands
+from share_of_search.cache import KeywordMetricsCache
+from share_of_search.charts import (
+    DEFAULT_MAX_CHART_BRANDS, market_share_chart_figure, share_chart_figure, volume_chart_figure
+)
+from share_of_search.fetch import DEFAULT_MAX_WORKERS
+from share_of_search.export import EXPORT_FORMATS, export_results
+from share_of_search.geo import default_geo_index
+from share_of_search.jobs import CANCELLED, DEFAULT_JOB_WORKERS, DONE, QUEUED, JobQueue, pooled_google_ads_client
+from share_of_search.keyword_planner import load_google_ads_client
+from share_of_search.planner import brand_keywords
+from share_of_search.pool import PooledGoogleAdsClient, DEFAULT_KEEPALIVE_SECONDS, DEFAULT_POOL_SIZE
+from share_of_search.scheduler import DEFAULT_REQUESTS_PER_SECOND, RequestScheduler
+from share_of_search.tracing import Tracer, set_active_tracer, span
+from share_of_search.matrix import (
+    aggregate_matrix, slice_months, stack_brand_volumes, to_results_frame, concat_location_frames, pivot_results
+)
+from share_of_search.variants import discover_brand_variants
 
 # Set page configuration
 st.set_page_config(
@@ -26,436 +36,336 @@ st.set_page_config(
 def get_google_ads_client():
     """Create and return a Google Ads API client using credentials from Streamlit secrets."""
     try:
-        # Load credentials from Streamlit secrets
-        credentials = {
-            "developer_token": st.secrets["GOOGLE_DEVELOPER_TOKEN"],
-            "client_id": st.secrets["GOOGLE_CLIENT_ID"],
-            "client_secret": st.secrets["GOOGLE_CLIENT_SECRET"],
-            "refresh_token": st.secrets["GOOGLE_REFRESH_TOKEN"],
-            "login_customer_id": st.secrets["GOOGLE_LOGIN_CUSTOMER_ID"],
-            "use_proto_plus": True
-        }
-        
-        # Create the Google Ads client
-        client = GoogleAdsClient.load_from_dict(credentials)
-        return client
+        # One client per server process; its service stubs and gRPC channels are pooled across sessions
+        with span("google_ads.client"):
+            return PooledGoogleAdsClient(
+                load_google_ads_client(st.secrets),
+                size=int(st.secrets.get("KEYWORD_PLANNER_CHANNELS", DEFAULT_POOL_SIZE)),
+                keepalive_seconds=float(st.secrets.get("KEYWORD_PLANNER_KEEPALIVE_SECONDS", DEFAULT_KEEPALIVE_SECONDS))
+            )
     except Exception as e:
         st.error(f"Error initializing Google Ads client: {str(e)}")
         return None
 
-# Dictionary of countries and their geo target IDs
-COUNTRY_MAPPING = {
-    "All Countries": "all",
-    "Afghanistan": "2004",
-    "Albania": "2008",
-    "Algeria": "2012",
-    "American Samoa": "2016",
-    "Andorra": "2020",
-    "Angola": "2024",
-    "Anguilla": "2660",
-    "Antarctica": "2010",
-    "Antigua and Barbuda": "2028",
-    "Argentina": "2032",
-    "Armenia": "2051",
-    "Aruba": "2533",
-    "Australia": "2036",
-    "Austria": "2040",
-    "Azerbaijan": "2031",
-    "Bahamas": "2044",
-    "Bahrain": "2048",
-    "Bangladesh": "2050",
-    "Barbados": "2052",
-    "Belarus": "2112",
-    "Belgium": "2056",
-    "Belize": "2084",
-    "Benin": "2204",
-    "Bermuda": "2060",
-    "Bhutan": "2064",
-    "Bolivia": "2068",
-    "Bosnia and Herzegovina": "2070",
-    "Botswana": "2072",
-    "Bouvet Island": "2074",
-    "Brazil": "2076",
-    "British Indian Ocean Territory": "2086",
-    "Brunei": "2096",
-    "Bulgaria": "2100",
-    "Burkina Faso": "2854",
-    "Burundi": "2108",
-    "Cambodia": "2116",
-    "Cameroon": "2120",
-    "Canada": "2124",
-    "Cape Verde": "2132",
-    "Cayman Islands": "2136",
-    "Central African Republic": "2140",
-    "Chad": "2148",
-    "Chile": "2152",
-    "China": "2156",
-    "Christmas Island": "2162",
-    "Cocos (Keeling) Islands": "2166",
-    "Colombia": "2170",
-    "Comoros": "2174",
-    "Congo": "2178",
-    "Cook Islands": "2184",
-    "Costa Rica": "2188",
-    "Croatia": "2191",
-    "Cuba": "2192",
-    "Cyprus": "2196",
-    "Czech Republic": "2203",
-    "Denmark": "2208",
-    "Djibouti": "2262",
-    "Dominica": "2212",
-    "Dominican Republic": "2214",
-    "East Timor": "2626",
-    "Ecuador": "2218",
-    "Egypt": "2818",
-    "El Salvador": "2222",
-    "Equatorial Guinea": "2226",
-    "Eritrea": "2232",
-    "Estonia": "2233",
-    "Ethiopia": "2231",
-    "Falkland Islands": "2238",
-    "Faroe Islands": "2234",
-    "Fiji": "2242",
-    "Finland": "2246",
-    "France": "2250",
-    "French Guiana": "2254",
-    "French Polynesia": "2258",
-    "French Southern Territories": "2260",
-    "Gabon": "2266",
-    "Gambia": "2270",
-    "Georgia": "2268",
-    "Germany": "2276",
-    "Ghana": "2288",
-    "Gibraltar": "2292",
-    "Greece": "2300",
-    "Greenland": "2304",
-    "Grenada": "2308",
-    "Guadeloupe": "2312",
-    "Guam": "2316",
-    "Guatemala": "2320",
-    "Guinea": "2324",
-    "Guinea-Bissau": "2624",
-    "Guyana": "2328",
-    "Haiti": "2332",
-    "Heard Island and McDonald Islands": "2334",
-    "Honduras": "2340",
-    "Hong Kong": "2344",
-    "Hungary": "2348",
-    "Iceland": "2352",
-    "India": "2356",
-    "Indonesia": "2360",
-    "Iran": "2364",
-    "Iraq": "2368",
-    "Ireland": "2372",
-    "Israel": "2376",
-    "Italy": "2380",
-    "Ivory Coast": "2384",
-    "Jamaica": "2388",
-    "Japan": "2392",
-    "Jordan": "2400",
-    "Kazakhstan": "2398",
-    "Kenya": "2404",
-    "Kiribati": "2296",
-    "Kuwait": "2414",
-    "Kyrgyzstan": "2417",
-    "Laos": "2418",
-    "Latvia": "2428",
-    "Lebanon": "2422",
-    "Lesotho": "2426",
-    "Liberia": "2430",
-    "Libya": "2434",
-    "Liechtenstein": "2438",
-    "Lithuania": "2440",
-    "Luxembourg": "2442",
-    "Macau": "2446",
-    "Macedonia": "2807",
-    "Madagascar": "2450",
-    "Malawi": "2454",
-    "Malaysia": "2458",
-    "Maldives": "2462",
-    "Mali": "2466",
-    "Malta": "2470",
-    "Marshall Islands": "2584",
-    "Martinique": "2474",
-    "Mauritania": "2478",
-    "Mauritius": "2480",
-    "Mayotte": "2175",
-    "Mexico": "2484",
-    "Micronesia": "2583",
-    "Moldova": "2498",
-    "Monaco": "2492",
-    "Mongolia": "2496",
-    "Montenegro": "2499",
-    "Montserrat": "2500",
-    "Morocco": "2504",
-    "Mozambique": "2508",
-    "Myanmar": "2104",
-    "Namibia": "2516",
-    "Nauru": "2520",
-    "Nepal": "2524",
-    "Netherlands": "2528",
-    "Netherlands Antilles": "2530",
-    "New Caledonia": "2540",
-    "New Zealand": "2554",
-    "Nicaragua": "2558",
-    "Niger": "2562",
-    "Nigeria": "2566",
-    "Niue": "2570",
-    "Norfolk Island": "2574",
-    "North Korea": "2408",
-    "Northern Mariana Islands": "2580",
-    "Norway": "2578",
-    "Oman": "2512",
-    "Pakistan": "2586",
-    "Palau": "2585",
-    "Palestine": "2275",
-    "Panama": "2591",
-    "Papua New Guinea": "2598",
-    "Paraguay": "2600",
-    "Peru": "2604",
-    "Philippines": "2608",
-    "Pitcairn": "2612",
-    "Poland": "2616",
-    "Portugal": "2620",
-    "Puerto Rico": "2630",
-    "Qatar": "2634",
-    "Reunion": "2638",
-    "Romania": "2642",
-    "Russia": "2643",
-    "Rwanda": "2646",
-    "Saint Helena": "2654",
-    "Saint Kitts and Nevis": "2659",
-    "Saint Lucia": "2662",
-    "Saint Pierre and Miquelon": "2666",
-    "Saint Vincent and the Grenadines": "2670",
-    "Samoa": "2882",
-    "San Marino": "2674",
-    "Sao Tome and Principe": "2678",
-    "Saudi Arabia": "2682",
-    "Senegal": "2686",
-    "Serbia": "2688",
-    "Seychelles": "2690",
-    "Sierra Leone": "2694",
-    "Singapore": "2702",
-    "Slovakia": "2703",
-    "Slovenia": "2705",
-    "Solomon Islands": "2090",
-    "Somalia": "2706",
-    "South Africa": "2710",
-    "South Georgia and the South Sandwich Islands": "2239",
-    "South Korea": "2410",
-    "Spain": "2724",
-    "Sri Lanka": "2144",
-    "Sudan": "2736",
-    "Suriname": "2740",
-    "Svalbard and Jan Mayen": "2744",
-    "Swaziland": "2748",
-    "Sweden": "2752",
-    "Switzerland": "2756",
-    "Syria": "2760",
-    "Taiwan": "2158",
-    "Tajikistan": "2762",
-    "Tanzania": "2834",
-    "Thailand": "2764",
-    "Togo": "2768",
-    "Tokelau": "2772",
-    "Tonga": "2776",
-    "Trinidad and Tobago": "2780",
-    "Tunisia": "2788",
-    "Turkey": "2792",
-    "Turkmenistan": "2795",
-    "Turks and Caicos Islands": "2796",
-    "Tuvalu": "2798",
-    "Uganda": "2800",
-    "Ukraine": "2804",
-    "United Arab Emirates": "2784",
-    "United Kingdom": "2826",
-    "United States": "2840",
-    "United States Minor Outlying Islands": "2581",
-    "Uruguay": "2858",
-    "Uzbekistan": "2860",
-    "Vanuatu": "2548",
-    "Vatican": "2336",
-    "Venezuela": "2862",
-    "Vietnam": "2704",
-    "Virgin Islands, British": "2092",
-    "Virgin Islands, U.S.": "2850",
-    "Wallis and Futuna": "2876",
-    "Western Sahara": "2732",
-    "Yemen": "2887",
-    "Zambia": "2894",
-    "Zimbabwe": "2716"
-}
-
-# Function to get search volumes from Google Ads API using GenerateKeywordIdeas
-def get_search_volumes(brands, settings, client):
-    """Retrieve search volume data from Google Ads API for specified brands and keywords using Keyword Ideas API."""
-    if not client:
-        st.error("Google Ads client not initialized. Please check your credentials.")
-        return []
+# Shared on-disk cache of keyword monthly volumes
+@st.cache_resource
+def get_keyword_cache():
+    """Open the keyword metrics cache once per server process and drop expired recent months."""
+    cache = KeywordMetricsCache()
+    cache.evict_expired()
+    return cache
+
+# Process-wide report job queue shared by all sessions; its workers split one rate limit and daily budget
+# and deduplicate identical reports, and their jobs outlive the script runs and sessions that started them
+@st.cache_resource
+def get_job_queue():
+    """Start the report job queue from optional secrets, restarting jobs a previous server left unfinished."""
+    daily_operations = st.secrets.get("KEYWORD_PLANNER_DAILY_OPERATIONS")
+    return JobQueue(
+        functools.partial(
+            pooled_google_ads_client,
+            st.secrets.to_dict(),
+            size=int(st.secrets.get("KEYWORD_PLANNER_CHANNELS", DEFAULT_POOL_SIZE)),
+            keepalive_seconds=float(st.secrets.get("KEYWORD_PLANNER_KEEPALIVE_SECONDS", DEFAULT_KEEPALIVE_SECONDS))
+        ),
+        st.secrets["GOOGLE_CUSTOMER_ID"],
+        workers=int(st.secrets.get("REPORT_JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+        processes=bool(st.secrets.get("REPORT_JOB_PROCESSES", True)),
+        requests_per_second=float(st.secrets.get("KEYWORD_PLANNER_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND)),
+        daily_operations=int(daily_operations) if daily_operations else None,
+        max_concurrent=int(st.secrets.get("KEYWORD_PLANNER_MAX_CONCURRENT_REQUESTS", DEFAULT_MAX_WORKERS))
+    )
+
+# Rate limiter of the Keyword Planner requests the script sends itself (brand variant discovery);
+# report fetches go through the job queue's workers
+@st.cache_resource
+def get_request_scheduler():
+    """Create the Keyword Planner request scheduler from optional secrets."""
+    daily_operations = st.secrets.get("KEYWORD_PLANNER_DAILY_OPERATIONS")
+    return RequestScheduler(
+        requests_per_second=float(st.secrets.get("KEYWORD_PLANNER_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND)),
+        daily_operations=int(daily_operations) if daily_operations else None,
+        max_concurrent=int(st.secrets.get("KEYWORD_PLANNER_MAX_CONCURRENT_REQUESTS", DEFAULT_MAX_WORKERS))
+    )
+
+# Geo target index shared by all sessions; a session only queries the handful of targets it shows
+@st.cache_resource
+def get_geo_index():
+    """Open the geo target index, building it from the geo targets CSV on first use."""
+    return default_geo_index()
+
+# Countries of the location picker, listed once per process
+@st.cache_resource
+def get_country_choices():
+    """Return the country locations of the picker and the position of each, built once per process."""
+    countries = ["All Countries"] + [target.location for target in get_geo_index().countries()]
+    return countries, {location: i for i, location in enumerate(countries)}
+
+# Function to describe a location in the pickers
+def location_label(location):
+    """Return a country as is and a region or city with its type and parents."""
+    if location in get_country_choices()[1]:
+        return location
+    target = get_geo_index().resolve(location)
+    return target.label if target is not None else location
+
+# Function to list the locations of a run: the selected one plus any compared markets
+def selected_locations(settings):
+    """Return the primary location followed by the extra locations chosen for comparison."""
+    extra = [location for location in settings.get("compareLocations", []) if location != settings["location"]]
+    return [settings["location"]] + extra
+
+# Function to build the key that decides whether stored monthly volumes can be reused
+def volume_fetch_key(brands, settings):
+    """Return the brands, keywords, locations, network and endpoint that a fetch depends on."""
+    return (
+        tuple((brand["name"], tuple(brand_keywords(brand))) for brand in brands),
+        tuple(selected_locations(settings)),
+        settings["network"],
+        settings.get("backend", "ideas")
+    )
+
+# Function to check whether stored monthly volumes can answer the current settings
+def volume_data_covers(volume_data, brands, settings, allow_errors=False):
+    """Return True when the stored fetch has the same brands and targeting and its range contains the selected one.
+
+    A fetch in which some brands failed only counts with ``allow_errors``, so
+    generating the report again retries the failed brands.
+    """
+    return (
+        volume_data is not None
+        and (allow_errors or not volume_data["errors"])
+        and volume_data["key"] == volume_fetch_key(brands, settings)
+        and volume_data["dateFrom"] <= settings["dateFrom"]
+        and settings["dateTo"] <= volume_data["dateTo"]
+    )
+
+# Function to stack the streamed brand volumes of each location in the order the brands were entered
+def brand_volume_matrices(arrived, brands, settings):
+    """Build {location: matrix} from the BrandVolumes records fetched so far, leaving out failed brands."""
+    order = {brand["name"]: index for index, brand in enumerate(brands)}
+    months = month_range(settings["dateFrom"], settings["dateTo"])
+    matrices = {}
+    for location in selected_locations(settings):
+        fetched = sorted(
+            (record for record in arrived if record.location == location and record.error is None),
+            key=lambda record: order.get(record.brand, len(order))
+        )
+        matrices[location] = stack_brand_volumes(
+            [record.brand for record in fetched], [record.volumes for record in fetched], months
+        )
+    return matrices
+
+# Function to turn the records of a finished report job into the monthly volumes kept in the session
+def job_volume_data(job, records):
+    """Build the stored monthly volumes, errors, request counts and fetch times of a report job."""
+    errors = []
+    for record in records:
+        if record.error is not None and not any(record.error is error for error in errors):
+            errors.append(record.error)
+    return {
+        "key": volume_fetch_key(job.brands, job.settings),
+        "dateFrom": job.settings["dateFrom"],
+        "dateTo": job.settings["dateTo"],
+        "matrices": brand_volume_matrices(records, job.brands, job.settings),
+        "errors": errors,
+        "requests": job.requests,
+        "latencies": brand_latency_table(records)
+    }
+
+# Function to load the outcome of a finished report job into the session
+def finish_report_job(job):
+    """Keep a finished job's volumes and results, or the reason it has none, and rerun the whole script."""
+    del st.session_state["report_job"]
+    st.session_state["loaded_job"] = job.id
+    if job.status == CANCELLED:
+        st.session_state["job_message"] = ("info", "The report was cancelled.")
+    elif job.status != DONE:
+        st.session_state["job_message"] = ("error", f"The report failed: {job.error}")
+    else:
+        # The fetch spans were recorded by the worker; add them to this session's debug timings
+        tracer = st.session_state.get("tracer")
+        if tracer is not None:
+            for record in job.spans or []:
+                tracer.record(record)
+        volume_data = job_volume_data(job, get_job_queue().records(job.id))
+        st.session_state["volume_data"] = volume_data
+        results = aggregate_volume_data(volume_data, job.brands, job.settings)
+        if results.empty:
+            st.session_state["job_message"] = ("error", "No data found for the selected parameters.")
+        else:
+            st.session_state["results"] = results
+            st.session_state["show_results"] = True
+    st.rerun()
+
+# Polls the session's report job once a second without rerunning the rest of the script
+@st.fragment(run_every=1.0)
+def show_report_job():
+    """Show the running job's progress, a share chart of the brands fetched so far and their fetch times.
     
-    results = []
+    Cancel asks the worker to stop after the brand it is fetching; the
+    session picks the outcome up on the next poll.
+    """
+    queue = get_job_queue()
+    job = queue.job(st.session_state["report_job"])
+    if job is None:
+        del st.session_state["report_job"]
+        return
+    if job.finished:
+        finish_report_job(job)
     
-    # Parse date range from settings
-    start_date = datetime.strptime(settings["dateFrom"], "%Y-%m")
-    end_date = datetime.strptime(settings["dateTo"], "%Y-%m")
+    records = queue.records(job.id)
+    status = "Waiting for a free report worker..." if job.status == QUEUED else (
+        f"Fetched {job.fetched} of {job.total} brands" + (f" ({records[-1].brand}: {records[-1].seconds:.1f}s)" if records else "")
+    )
+    st.progress(job.fetched / job.total if job.total else 0.0, text=status)
+    if job.cancel_requested:
+        st.caption("Cancelling...")
+    elif st.button("✖ Cancel", key="cancel_fetch"):
+        queue.cancel(job.id)
     
-    # Generate time periods based on granularity
-    periods = []
-    current_date = start_date
+    if records:
+        brand_colors = {brand["name"]: brand["color"] for brand in job.brands}
+        partial = aggregate_volume_data(
+            {"key": volume_fetch_key(job.brands, job.settings), "matrices": brand_volume_matrices(records, job.brands, job.settings)},
+            job.brands,
+            job.settings
+        )
+        if not partial.empty:
+            with span("chart.render", chart="partial share", brands=len(records)):
+                st.plotly_chart(
+                    share_chart_figure(partial, brand_colors, *chart_brand_limit(job.brands, job.settings)),
+                    use_container_width=True
+                )
+        st.dataframe(brand_latency_table(records), use_container_width=True, hide_index=True)
+
+# Function to decide which brands the charts draw separately
+def chart_brand_limit(brands, settings):
+    """Return the chart brand limit and the own brand names that are never grouped into "Other"."""
+    return (
+        settings.get("maxChartBrands", DEFAULT_MAX_CHART_BRANDS),
+        tuple(brand["name"] for brand in brands if brand["isOwnBrand"] and brand["name"])
+    )
+
+# Function to list how long each brand took to fetch
+def brand_latency_table(arrived):
+    """Return one row per fetched brand with its location, fetch time and status."""
+    return pd.DataFrame({
+        "Brand": [record.brand for record in arrived],
+        "Location": [record.location for record in arrived],
+        "Seconds": [round(record.seconds, 2) for record in arrived],
+        "Status": ["failed" if record.error is not None else "ok" for record in arrived]
+    })
+
+# Function to turn stored monthly volumes into results without calling the API
+def aggregate_volume_data(volume_data, brands, settings):
+    """Aggregate the stored monthly matrices for the selected date window and granularity.
     
-    if settings["granularity"] == "monthly":
-        while current_date <= end_date:
-            periods.append((current_date.year, current_date.month, current_date.strftime("%Y-%m")))
-            # Add one month
-            month = current_date.month + 1
-            year = current_date.year
-            if month > 12:
-                month = 1
-                year += 1
-            current_date = current_date.replace(year=year, month=month, day=1)
-    elif settings["granularity"] == "quarterly":
-        while current_date <= end_date:
-            quarter = (current_date.month - 1) // 3 + 1
-            # Include incomplete quarters
-            periods.append((current_date.year, quarter, f"{current_date.year}-Q{quarter}"))
-            # Add one quarter (3 months)
-            month = current_date.month + 3
-            year = current_date.year
-            if month > 12:
-                month = month - 12
-                year += 1
-            current_date = current_date.replace(year=year, month=month, day=1)
-    else:  # yearly
-        while current_date.year <= end_date.year:
-            # Include incomplete years
-            periods.append((current_date.year, None, str(current_date.year)))
-            current_date = current_date.replace(year=current_date.year + 1, month=1, day=1)
+    A single location gives the usual results table; several locations give one
+    long table with a leading location column.
+    """
+    if volume_data is None:
+        return to_results_frame(pd.DataFrame(), [])
     
-    # Get location ID
-    location_id = COUNTRY_MAPPING.get(settings["location"], "2840")  # Default to US if not found
+    brand_colors = {brand["name"]: brand["color"] for brand in brands}
+    frames = {}
+    for location, matrix in volume_data["matrices"].items():
+        matrix = slice_months(matrix, settings["dateFrom"], settings["dateTo"])
+        frames[location] = to_results_frame(
+            aggregate_matrix(matrix, settings["granularity"]),
+            [brand_colors.get(name, "#7f7f7f") for name in matrix.index]
+        )
     
-    # Get customer ID from secrets
-    customer_id = st.secrets["GOOGLE_CUSTOMER_ID"]
+    if len(volume_data["key"][1]) == 1:
+        return next(iter(frames.values()), to_results_frame(pd.DataFrame(), []))
+    return concat_location_frames(frames)
+
+# Function to drop the widget state of a brand's editor after its brand dict was changed in code,
+# so the inputs pick up the new values instead of writing their old ones back
+def forget_brand_widgets(brand_id):
+    """Remove the name, colour and keyword widget values of one brand editor."""
+    for prefix in ("own", "comp"):
+        for field in ("name", "color", "keywords"):
+            st.session_state.pop(f"{prefix}_{field}_{brand_id}", None)
+
+# Function to add the brand variants ticked in the discovery table to their brands' keywords
+def add_variant_keywords(variants):
+    """Append the selected variant keywords to their brands and return how many were added."""
+    added = 0
+    for brand in st.session_state["brands"]:
+        keywords = list(variants.loc[variants["brand"] == brand["name"], "keyword"])
+        new_keywords = [k for k in keywords if k not in brand_keywords(brand)]
+        if new_keywords:
+            brand["keywords"] = [k for k in brand["keywords"] if k.strip()] + new_keywords
+            added += len(new_keywords)
+            forget_brand_widgets(brand["id"])
+    return added
+
+# Editor of one brand. It is a fragment, so typing in it reruns only this expander rather than the whole
+# page with every other brand, the location lists and the Results tab; removing the brand, or a change that
+# makes it valid or invalid for a report, reruns the page
+@st.fragment
+def brand_editor(brand_id, title, prefix):
+    """Render the name, colour, keywords and remove button of the brand with ``brand_id``."""
+    brand = next((b for b in st.session_state["brands"] if b["id"] == brand_id), None)
+    if brand is None:
+        return
+    was_valid = bool(brand["name"]) and any(k.strip() for k in brand["keywords"])
     
-    # Process each brand and its keywords
-    for brand in brands:
-        if not brand["name"] or not any(k.strip() for k in brand["keywords"]):
-            continue
+    with st.expander(f"{title}: {brand['name'] or 'Unnamed'}", expanded=brand["name"] == ""):
+        # Brand name
+        new_name = st.text_input("Brand Name", brand["name"], key=f"{prefix}_name_{brand_id}")
+        if new_name != brand["name"]:
+            brand["name"] = new_name
         
-        brand_keywords = [k.strip() for k in brand["keywords"] if k.strip()]
+        # Brand color
+        new_color = st.color_picker("Brand Color", brand["color"], key=f"{prefix}_color_{brand_id}")
+        if new_color != brand["color"]:
+            brand["color"] = new_color
         
-        try:
-            # Create keyword plan idea service
-            keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
-            googleads_service = client.get_service("GoogleAdsService")
-            
-            # Create request for keyword ideas
-            request = client.get_type("GenerateKeywordIdeasRequest")
-            request.customer_id = customer_id
-            
-            # Set up keyword seed
-            request.keyword_seed.keywords.extend(brand_keywords)
-            
-            # Add geo target constants if not "All Countries"
-            if settings["location"] != "All Countries":
-                request.geo_target_constants.append(googleads_service.geo_target_constant_path(location_id))
-            
-            # Set network based on settings
-            if settings["network"] == "GOOGLE_SEARCH":
-                request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH
-            else:  # GOOGLE_SEARCH_AND_PARTNERS
-                request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH_AND_PARTNERS
-
-            historical_metrics_options = request.historical_metrics_options
-            year_month_range = historical_metrics_options.year_month_range
-
-            historical_metrics_options = request.historical_metrics_options
-            year_month_range = historical_metrics_options.year_month_range
-
-            year_month_range.start.year = start_date.year
-            month_enum_name = calendar.month_name[start_date.month].upper()
-            year_month_range.start.month = client.enums.MonthOfYearEnum[month_enum_name]
-
-            # End date +1 logic
-            end_month = end_date.month + 1
-            end_year = end_date.year
-            if end_month > 12:
-                end_month = 1
-                end_year += 1
-            end_month_enum_name = calendar.month_name[end_month].upper()
-            year_month_range.end.year = end_year
-            year_month_range.end.month = client.enums.MonthOfYearEnum[end_month_enum_name]
-            
-            # Execute the request
-            response = keyword_plan_idea_service.generate_keyword_ideas(request=request)
-            
-            # Process the response for each period
-            for period_year, period_month_or_quarter, period_label in periods:
-                brand_volume = 0
-                
-                # Process each result
-                for result in response:
-                    if result.text.lower() in [k.lower() for k in brand_keywords]:
-                        keyword_metrics = result.keyword_idea_metrics
-                        
-                        if settings["granularity"] == "monthly" and period_month_or_quarter is not None:
-                            for monthly_search_volume in keyword_metrics.monthly_search_volumes:
-                                # ✨ Fix: Align using 1-based period_month_or_quarter
-                                if (monthly_search_volume.year == period_year and 
-                                    monthly_search_volume.month.value - 1 == period_month_or_quarter):
-                                    brand_volume += monthly_search_volume.monthly_searches
-                        
-                        elif settings["granularity"] == "quarterly" and period_month_or_quarter is not None:
-                            quarter_start_month = (period_month_or_quarter - 1) * 3 + 1
-                            quarter_end_month = min(quarter_start_month + 2, end_date.month) if period_year == end_date.year else quarter_start_month + 2
-                            for monthly_search_volume in keyword_metrics.monthly_search_volumes:
-                                # ✨ Fix: Compare directly with value (1-based)
-                                if (monthly_search_volume.year == period_year and 
-                                    quarter_start_month <= monthly_search_volume.month.value - 1 <= quarter_end_month):
-                                    brand_volume += monthly_search_volume.monthly_searches
-                        
-                        elif settings["granularity"] == "yearly":
-                            for monthly_search_volume in keyword_metrics.monthly_search_volumes:
-                                if monthly_search_volume.year == period_year:
-                                    # For the end year, only include months up to the selected end month
-                                    if period_year == end_date.year and monthly_search_volume.month.value - 1 > end_date.month:
-                                        continue
-                                    brand_volume += monthly_search_volume.monthly_searches
-                
-                if brand_volume > 0:
-                    results.append({
-                        "brand": brand["name"],
-                        "period": period_label,
-                        "volume": brand_volume,
-                        "share": 0,
-                        "color": brand["color"]
-                    })
-        
-        except GoogleAdsException as ex:
-            st.error(f"Google Ads API error for brand {brand['name']}: {ex}")
-            for error in ex.failure.errors:
-                st.error(f"Error details: {error.message}")
-            continue
-        
-        except Exception as e:
-            st.error(f"Error retrieving search volume for {brand['name']}: {str(e)}")
-            continue
-    
-    # Calculate total volume and share percentages for each period
-    period_totals = {}
-    for result in results:
-        period = result["period"]
-        if period not in period_totals:
-            period_totals[period] = 0
-        period_totals[period] += result["volume"]
-    
-    for result in results:
-        period = result["period"]
-        if period_totals[period] > 0:
-            result["share"] = round((result["volume"] / period_totals[period]) * 100, 1)
+        # Keywords
+        st.write("Keywords (one per line):")
+        keywords_text = "\n".join(brand["keywords"])
+        new_keywords = st.text_area("", keywords_text, key=f"{prefix}_keywords_{brand_id}")
+        if new_keywords != keywords_text:
+            brand["keywords"] = [k.strip() for k in new_keywords.split("\n") if k.strip()]
+            if not brand["keywords"]:
+                brand["keywords"] = [""]
+        
+        # Remove brand button
+        if st.button("Remove Brand", key=f"remove_{prefix}_{brand_id}"):
+            st.session_state["brands"] = [b for b in st.session_state["brands"] if b["id"] != brand_id]
+            st.rerun()
     
-    return results
+    if was_valid != (bool(brand["name"]) and any(k.strip() for k in brand["keywords"])):
+        st.rerun()
+
+# Cached builders for the Results tab; st.cache_data keys them on the content of the
+# result set, the brand colour map and the chart brand limit, so reruns with unchanged data reuse the output
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_share_chart(results, brand_colors, max_brands, keep):
+    """Return the share chart of a complete result set; the progress view draws partial charts directly."""
+    return share_chart_figure(results, brand_colors, max_brands, keep)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_market_share_chart(results, brand_colors, max_brands, keep):
+    """Build the stacked bar chart comparing each brand's share of the whole window across locations."""
+    return market_share_chart_figure(results, brand_colors, max_brands, keep)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_volume_chart(results, brand_colors, max_brands, keep):
+    """Build the line chart of absolute search volumes, one panel per location when there are several."""
+    return volume_chart_figure(results, brand_colors, max_brands, keep)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_pivot_table(results):
+    """Build the period x brand volume and share table."""
+    return pivot_results(results)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_export(results, export_format):
+    """Encode the result set as CSV, Parquet or Arrow IPC bytes for download."""
+    return export_results(results, export_format)
 
 # App title and introduction
 st.title("📊 Share of Brand Search Tool")
@@ -464,6 +374,12 @@ This tool helps you analyze brand search volumes from Google Ads and visualize m
 Compare your brands against competitors to gain insights into search performance.
 """)
 
+# Record timing spans for this run when debug timings are enabled; they accumulate until the next Generate
+if st.session_state.get("settings", {}).get("debugTimings"):
+    set_active_tracer(st.session_state.setdefault("tracer", Tracer()))
+else:
+    set_active_tracer(None)
+
 # Initialize Google Ads client
 google_ads_client = get_google_ads_client()
 
@@ -485,15 +401,30 @@ if "settings" not in st.session_state:
         "network": "GOOGLE_SEARCH",
         "dateFrom": start_date.strftime("%Y-%m"),  # Last year
         "dateTo": end_date.strftime("%Y-%m"),  # Current month - 1
-        "granularity": "monthly"
+        "granularity": "monthly",
+        "maxConcurrentRequests": DEFAULT_MAX_WORKERS,
+        "useCache": True,
+        "backend": "ideas",
+        "compareLocations": [],
+        "maxChartBrands": DEFAULT_MAX_CHART_BRANDS,
+        "debugTimings": False
     }
 
 if "results" not in st.session_state:
-    st.session_state["results"] = []
+    st.session_state["results"] = to_results_frame(pd.DataFrame(), [])
 
 if "show_results" not in st.session_state:
     st.session_state["show_results"] = False
 
+# The report job in the URL survives closed tabs and reconnects: a new session picks it up with its brands and settings
+job_param = st.query_params.get("job")
+if job_param and google_ads_client and job_param not in (st.session_state.get("report_job"), st.session_state.get("loaded_job")):
+    restored_job = get_job_queue().job(job_param)
+    if restored_job is not None:
+        st.session_state["brands"] = restored_job.brands
+        st.session_state["settings"] = {**st.session_state["settings"], **restored_job.settings}
+        st.session_state["report_job"] = restored_job.id
+
 # Main application interface
 tabs = st.tabs(["Input Parameters", "Results"] if st.session_state["show_results"] else ["Input Parameters"])
 
@@ -508,16 +439,13 @@ with tabs[0]:
         
         # Function to add a new brand
         def add_brand(is_own_brand):
-            colors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", 
-                      "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
-            
             brand_count = len([b for b in st.session_state["brands"] if b["isOwnBrand"] == is_own_brand])
             st.session_state["brands"].append({
                 "id": str(uuid.uuid4()),
                 "name": "",
                 "keywords": [""],
                 "isOwnBrand": is_own_brand,
-                "color": colors[brand_count % len(colors)]
+                "color": BRAND_COLORS[brand_count % len(BRAND_COLORS)]
             })
         
         # Display own brands
@@ -526,30 +454,7 @@ with tabs[0]:
             st.info("Add your own brands to track")
         
         for i, brand in enumerate(own_brands):
-            with st.expander(f"Brand {i+1}: {brand['name'] or 'Unnamed'}", expanded=brand["name"] == ""):
-                # Brand name
-                new_name = st.text_input("Brand Name", brand["name"], key=f"own_name_{brand['id']}")
-                if new_name != brand["name"]:
-                    brand["name"] = new_name
-                
-                # Brand color
-                new_color = st.color_picker("Brand Color", brand["color"], key=f"own_color_{brand['id']}")
-                if new_color != brand["color"]:
-                    brand["color"] = new_color
-                
-                # Keywords
-                st.write("Keywords (one per line):")
-                keywords_text = "\n".join(brand["keywords"])
-                new_keywords = st.text_area("", keywords_text, key=f"own_keywords_{brand['id']}")
-                if new_keywords != keywords_text:
-                    brand["keywords"] = [k.strip() for k in new_keywords.split("\n") if k.strip()]
-                    if not brand["keywords"]:
-                        brand["keywords"] = [""]
-                
-                # Remove brand button
-                if st.button("Remove Brand", key=f"remove_own_{brand['id']}"):
-                    st.session_state["brands"] = [b for b in st.session_state["brands"] if b["id"] != brand["id"]]
-                    st.rerun()
+            brand_editor(brand["id"], f"Brand {i+1}", "own")
         
         if st.button("➕ Add Your Brand"):
             add_brand(True)
@@ -562,44 +467,115 @@ with tabs[0]:
             st.info("Add competitor brands to compare")
         
         for i, brand in enumerate(competitor_brands):
-            with st.expander(f"Competitor {i+1}: {brand['name'] or 'Unnamed'}", expanded=brand["name"] == ""):
-                # Brand name
-                new_name = st.text_input("Brand Name", brand["name"], key=f"comp_name_{brand['id']}")
-                if new_name != brand["name"]:
-                    brand["name"] = new_name
-                
-                # Brand color
-                new_color = st.color_picker("Brand Color", brand["color"], key=f"comp_color_{brand['id']}")
-                if new_color != brand["color"]:
-                    brand["color"] = new_color
-                
-                # Keywords
-                st.write("Keywords (one per line):")
-                keywords_text = "\n".join(brand["keywords"])
-                new_keywords = st.text_area("", keywords_text, key=f"comp_keywords_{brand['id']}")
-                if new_keywords != keywords_text:
-                    brand["keywords"] = [k.strip() for k in new_keywords.split("\n") if k.strip()]
-                    if not brand["keywords"]:
-                        brand["keywords"] = [""]
-                
-                # Remove brand button
-                if st.button("Remove Brand", key=f"remove_comp_{brand['id']}"):
-                    st.session_state["brands"] = [b for b in st.session_state["brands"] if b["id"] != brand["id"]]
-                    st.rerun()
+            brand_editor(brand["id"], f"Competitor {i+1}", "comp")
         
         if st.button("➕ Add Competitor Brand"):
             add_brand(False)
             st.rerun()
+        
+        # Load a whole competitive set in one step instead of editing brands one by one
+        with st.expander("📥 Import brands from CSV or Excel"):
+            st.caption(
+                "One row per keyword, or several keywords in one cell separated by commas, semicolons or line breaks. "
+                "Columns: brand (required), keyword, own (yes/no) and color (#RRGGBB). "
+                "Brands without keywords are searched by their name."
+            )
+            uploaded_file = st.file_uploader("Brand file", type=list(IMPORT_EXTENSIONS), key="brand_import_file")
+            replace_brands = st.radio(
+                "Imported brands",
+                options=["Add to the current brands", "Replace the current brands"],
+                horizontal=True
+            ) == "Replace the current brands"
+            if st.button("Import brands", disabled=uploaded_file is None):
+                try:
+                    imported = import_brand_file(uploaded_file.getvalue(), uploaded_file.name)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    for brand in st.session_state["brands"]:
+                        forget_brand_widgets(brand["id"])
+                    st.session_state["brands"] = merge_brands(st.session_state["brands"], imported.brands, replace=replace_brands)
+                    st.session_state["import_message"] = (
+                        f"Imported {len(imported.brands)} brands with {imported.keywords} keywords from {imported.rows} rows"
+                        + (f", {imported.duplicates} duplicate keywords left out." if imported.duplicates else "."),
+                        imported.issues
+                    )
+                    st.rerun()
+            
+            if "import_message" in st.session_state:
+                message, issues = st.session_state.pop("import_message")
+                st.success(message)
+                for issue in issues:
+                    st.warning(issue)
+            
+            brand_table = brands_to_table(st.session_state["brands"])
+            if not brand_table.empty:
+                st.download_button(
+                    "Download current brands",
+                    data=brand_table.to_csv(index=False).encode("utf-8"),
+                    file_name="brands.csv",
+                    mime="text/csv",
+                    help="The brands and keywords above as a file this import reads"
+                )
     
     with col2:
         st.subheader("Search Parameters")
         
-        # Location
-        locations = list(COUNTRY_MAPPING.keys())
-        st.session_state["settings"]["location"] = st.selectbox(
+        # Location: a country, optionally narrowed down to one of its regions or cities
+        geo_index = get_geo_index()
+        countries, country_positions = get_country_choices()
+        current_location = st.session_state["settings"]["location"]
+        current_target = None if current_location in country_positions else geo_index.resolve(current_location)
+        current_country = geo_index.country_of(current_target.id) if current_target is not None else None
+        selected_country = st.selectbox(
             "Location", 
-            options=locations,
-            index=locations.index(st.session_state["settings"]["location"]) if st.session_state["settings"]["location"] in locations else locations.index("United States")
+            options=countries,
+            index=country_positions.get(
+                current_country.location if current_country is not None else current_location,
+                country_positions["United States"]
+            )
+        )
+        
+        location = selected_country
+        location_matches = []
+        if selected_country != "All Countries" and geo_index.subdivisions:
+            location_query = st.text_input(
+                "Region or city",
+                key="location_query",
+                placeholder="Search, e.g. Brno",
+                help="Narrow the report down to a region or city of the selected country"
+            )
+            if location_query.strip():
+                location_matches = [
+                    target.location for target in geo_index.search(
+                        location_query, country_code=geo_index.resolve(selected_country).country_code
+                    )
+                ]
+            target_options = list(dict.fromkeys(
+                [selected_country]
+                + ([current_location] if current_country is not None and current_country.location == selected_country else [])
+                + location_matches
+            ))
+            location = st.selectbox(
+                "Target area",
+                options=target_options,
+                index=target_options.index(current_location) if current_location in target_options else 0,
+                format_func=lambda option: f"All of {selected_country}" if option == selected_country else location_label(option)
+            )
+        st.session_state["settings"]["location"] = location
+        
+        # Extra markets fetched alongside the main location; regions and cities found above can be added too
+        current_compare = [
+            other for other in st.session_state["settings"].get("compareLocations", []) if other != location
+        ]
+        st.session_state["settings"]["compareLocations"] = st.multiselect(
+            "Compare with other locations",
+            options=[
+                option for option in dict.fromkeys(location_matches + current_compare + countries) if option != location
+            ],
+            default=current_compare,
+            format_func=location_label,
+            help="Fetch the same brands for several markets and compare their share of search side by side"
         )
         
         # Network - Updated to match the API's available options
@@ -732,113 +708,234 @@ with tabs[0]:
             horizontal=True
         )
         
-        # Generate Results Button
-        st.markdown("### Generate Results")
+        # Advanced request options
+        with st.expander("Advanced Options"):
+            st.session_state["settings"]["maxConcurrentRequests"] = st.number_input(
+                "Parallel API requests",
+                min_value=1,
+                max_value=16,
+                value=st.session_state["settings"].get("maxConcurrentRequests", DEFAULT_MAX_WORKERS),
+                help="How many Keyword Planner requests are sent at the same time"
+            )
+            st.session_state["settings"]["useCache"] = st.checkbox(
+                "Use local keyword cache",
+                value=st.session_state["settings"].get("useCache", True),
+                help="Reuse previously fetched monthly volumes and only request months that are missing or outdated"
+            )
+            backends = [
+                ("ideas", "Keyword Ideas (GenerateKeywordIdeas)"),
+                ("historical", "Historical Metrics (GenerateKeywordHistoricalMetrics)")
+            ]
+            backend_options = [b[1] for b in backends]
+            current_backend_index = next((i for i, b in enumerate(backends) if b[0] == st.session_state["settings"].get("backend", "ideas")), 0)
+            selected_backend = st.selectbox(
+                "Keyword Planner endpoint",
+                options=backend_options,
+                index=current_backend_index,
+                help="Historical Metrics returns only the requested keywords and accepts far larger batches"
+            )
+            st.session_state["settings"]["backend"] = backends[backend_options.index(selected_backend)][0]
+            st.session_state["settings"]["maxChartBrands"] = st.number_input(
+                "Brands per chart",
+                min_value=2,
+                max_value=100,
+                value=st.session_state["settings"].get("maxChartBrands", DEFAULT_MAX_CHART_BRANDS),
+                help="Charts draw the largest brands and your own brands separately and sum the rest into \"Other\"; "
+                     "the data table and downloads keep every brand"
+            )
+            st.session_state["settings"]["debugTimings"] = st.checkbox(
+                "Debug timings",
+                value=st.session_state["settings"].get("debugTimings", False),
+                help="Time the client, requests, aggregation and chart rendering and show the breakdown in the Results tab"
+            )
+            if st.button("Clear keyword cache"):
+                get_keyword_cache().clear()
+                st.success("Keyword cache cleared.")
         
         valid_brands = [b for b in st.session_state["brands"] 
                        if b["name"] and any(k.strip() for k in b["keywords"])]
         
+        # Misspellings, diacritic variants and brand + product queries among the keyword ideas of the brands
+        with st.expander("🔎 Discover brand variants"):
+            st.caption(
+                "Looks through the keyword ideas Google returns for your keywords for other spellings of your brands "
+                "and queries that contain them, with their search volume in the selected period and location"
+            )
+            if st.button("Find variants", disabled=not valid_brands):
+                if not google_ads_client:
+                    st.error("Google Ads client not initialized. Please check your credentials.")
+                else:
+                    settings = st.session_state["settings"]
+                    with st.spinner("Fetching keyword ideas..."):
+                        variants, variant_errors = discover_brand_variants(
+                            valid_brands, settings, google_ads_client, st.secrets["GOOGLE_CUSTOMER_ID"],
+                            cache=get_keyword_cache() if settings.get("useCache", True) else None,
+                            scheduler=get_request_scheduler()
+                        )
+                    st.session_state["brand_variants"] = (variants, variant_errors)
+            
+            variants, variant_errors = st.session_state.get("brand_variants", (None, []))
+            for error in variant_errors:
+                st.warning(f"{error.message} Variants of these brands could not be looked up.")
+            if variants is not None and variants.empty:
+                st.info("No variants found among the keyword ideas.")
+            elif variants is not None:
+                edited = st.data_editor(
+                    variants.assign(include=False),
+                    column_config={
+                        "include": st.column_config.CheckboxColumn("Include"),
+                        "volume": st.column_config.NumberColumn("Searches", format="%d"),
+                    },
+                    disabled=["brand", "keyword", "match", "volume"],
+                    hide_index=True,
+                    use_container_width=True,
+                    key="brand_variants_editor"
+                )
+                if st.button("➕ Add selected keywords", disabled=not edited["include"].any()):
+                    added = add_variant_keywords(edited[edited["include"]])
+                    st.session_state["brand_variants"] = (variants[~edited["include"]].reset_index(drop=True), [])
+                    st.session_state.pop("brand_variants_editor", None)
+                    st.session_state["variants_message"] = f"Added {added} keywords to your brands."
+                    st.rerun()
+            if "variants_message" in st.session_state:
+                st.success(st.session_state.pop("variants_message"))
+        
+        # Generate Results Button
+        st.markdown("### Generate Results")
+        
         if len(valid_brands) < 1:
             st.warning("Please add at least one brand with a name and keywords.")
+        elif "report_job" in st.session_state:
+            # The report is fetched in the background; the fragment polls it and loads the results when it finishes
+            show_report_job()
         else:
             if st.button("🔍 Generate Search Volume Data", type="primary"):
-                with st.spinner("Fetching search volume data from Google Ads..."):
-                    # Get search volumes using the Google Ads client
-                    results = get_search_volumes(valid_brands, st.session_state["settings"], google_ads_client)
-                    
-                    if results:
+                st.session_state.pop("job_message", None)
+                # Debug timings start over with every report run
+                if "tracer" in st.session_state:
+                    st.session_state["tracer"].clear()
+                settings = st.session_state["settings"]
+                # Reuse the stored monthly volumes when they cover the request, otherwise queue a report job
+                volume_data = st.session_state.get("volume_data")
+                if volume_data_covers(volume_data, valid_brands, settings):
+                    results = aggregate_volume_data(volume_data, valid_brands, settings)
+                    if not results.empty:
                         st.session_state["results"] = results
                         st.session_state["show_results"] = True
                         st.rerun()
                     else:
                         st.error("No data found for the selected parameters.")
+                elif not google_ads_client:
+                    st.error("Google Ads client not initialized. Please check your credentials.")
+                else:
+                    job = get_job_queue().enqueue(valid_brands, settings, selected_locations(settings))
+                    st.session_state["report_job"] = job.id
+                    st.query_params["job"] = job.id
+                    st.rerun()
+            
+            # Outcome of the last report job that produced no results
+            level, message = st.session_state.get("job_message", (None, None))
+            if message:
+                getattr(st, level)(message)
 
 # Results tab (only shown after generating results)
 if st.session_state["show_results"] and len(tabs) > 1:
     with tabs[1]:
         st.header("Share of Search Results")
         
-        # Convert results to DataFrame
-        df = pd.DataFrame(st.session_state["results"])
+        # Re-aggregate the stored monthly volumes for the current granularity and date window
+        volume_data = st.session_state.get("volume_data")
+        for error in (volume_data or {}).get("errors", []):
+            st.warning(f"{error.message} These brands are missing from the results.")
+        if volume_data and volume_data.get("requests"):
+            request_counts = volume_data["requests"]
+            st.caption(
+                f"Keyword Planner requests: {request_counts['requests']} sent, {request_counts['throttled']} throttled, "
+                f"{request_counts['retried']} retried, {request_counts['failed']} failed, "
+                f"{request_counts['rejected']} rejected by the daily budget, "
+                f"{request_counts.get('coalesced', 0)} shared with other sessions"
+            )
+        if volume_data is not None and volume_data.get("latencies") is not None:
+            with st.expander("Fetch time per brand"):
+                st.dataframe(volume_data["latencies"], use_container_width=True, hide_index=True)
+        if volume_data_covers(volume_data, valid_brands, st.session_state["settings"], allow_errors=True):
+            st.session_state["results"] = aggregate_volume_data(volume_data, valid_brands, st.session_state["settings"])
+        else:
+            st.info("Brands, locations, network or date range changed beyond the fetched data. "
+                    "Click \"Generate Search Volume Data\" to fetch it.")
+        
+        # Results are already kept as a DataFrame
+        df = st.session_state["results"]
         
-        # Create visualization options
+        # Create visualization options; comparing markets only makes sense with several locations
+        viz_options = ["Share of Search (%)", "Search Volume", "Data Table"]
+        if "location" in df.columns:
+            viz_options.insert(2, "Share by Market")
         viz_type = st.radio(
             "Visualization Type",
-            options=["Share of Search (%)", "Search Volume", "Data Table"],
+            options=viz_options,
             horizontal=True
         )
         
-        if viz_type == "Share of Search (%)":
-            # Create a stacked area chart for share percentages
-            fig = px.area(
-                df, 
-                x="period", 
-                y="share", 
-                color="brand",
-                color_discrete_map={brand["name"]: brand["color"] for brand in st.session_state["brands"] if brand["name"]},
-                title="Share of Search Over Time (%)",
-                labels={"period": "Time Period", "share": "Share (%)", "brand": "Brand"},
-                groupnorm="percent"
-            )
-            
-            fig.update_layout(
-                xaxis_title="Time Period",
-                yaxis_title="Share of Search (%)",
-                legend_title="Brands",
-                height=600
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-        elif viz_type == "Search Volume":
-            # Create a line chart for absolute search volumes
-            fig = px.line(
-                df, 
-                x="period", 
-                y="volume", 
-                color="brand",
-                color_discrete_map={brand["name"]: brand["color"] for brand in st.session_state["brands"] if brand["name"]},
-                title="Search Volume Over Time",
-                labels={"period": "Time Period", "volume": "Search Volume", "brand": "Brand"},
-                markers=True
-            )
-            
-            fig.update_layout(
-                xaxis_title="Time Period",
-                yaxis_title="Search Volume",
-                legend_title="Brands",
-                height=600
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-        else:  # Data Table
-            # Group by period and calculate totals
-            periods = sorted(df["period"].unique())
-            
-            # Create a pivot table
-            pivot_df = df.pivot(index="period", columns="brand", values=["volume", "share"]).reset_index()
-            
-            # Flatten the column names
-            pivot_df.columns = [f"{col[0]}_{col[1]}" if col[1] else col[0] for col in pivot_df.columns]
-            
-            # Sort by period
-            pivot_df = pivot_df.sort_values("period")
-            
-            # Display the table
-            st.dataframe(pivot_df, use_container_width=True)
+        # Colours of the named brands and the chart brand limit, used as part of the chart cache key
+        brand_colors = {brand["name"]: brand["color"] for brand in st.session_state["brands"] if brand["name"]}
+        max_brands, own_brands = chart_brand_limit(st.session_state["brands"], st.session_state["settings"])
+        
+        with span("chart.render", chart=viz_type, rows=len(df)):
+            if viz_type == "Share of Search (%)":
+                st.plotly_chart(build_share_chart(df, brand_colors, max_brands, own_brands), use_container_width=True)
+                
+            elif viz_type == "Search Volume":
+                st.plotly_chart(build_volume_chart(df, brand_colors, max_brands, own_brands), use_container_width=True)
+                
+            elif viz_type == "Share by Market":
+                st.plotly_chart(
+                    build_market_share_chart(df, brand_colors, max_brands, own_brands), use_container_width=True
+                )
+                
+            else:  # Data Table
+                st.dataframe(build_pivot_table(df), use_container_width=True)
+        
+        if viz_type != "Data Table" and df["brand"].nunique() > max_brands:
+            st.caption("The smallest brands are summed into \"Other\" to keep the chart fast; "
+                       "raise \"Brands per chart\" in Advanced Options or use the Data Table to see every brand.")
         
         # Export options
         st.subheader("Export Options")
         
-        # Export as CSV
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📄 Download CSV",
-            data=csv,
-            file_name=f"share_of_search_data_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
-        )
+        # Export as CSV, or as Parquet / Arrow IPC with the label columns dictionary-encoded
+        export_labels = {"csv": "📄 Download CSV", "parquet": "📦 Download Parquet", "arrow": "📦 Download Arrow IPC"}
+        for column, (export_format, label) in zip(st.columns(len(export_labels)), export_labels.items()):
+            extension, mime = EXPORT_FORMATS[export_format]
+            with column:
+                st.download_button(
+                    label=label,
+                    data=build_export(df, export_format),
+                    file_name=f"share_of_search_data_{datetime.now().strftime('%Y%m%d')}.{extension}",
+                    mime=mime,
+                    key=f"download_{export_format}"
+                )
+        
+        # Timing breakdown of the last report run and the renders since, when enabled
+        tracer = st.session_state.get("tracer")
+        if st.session_state["settings"].get("debugTimings") and tracer is not None:
+            with st.expander("Debug timings", expanded=True):
+                st.dataframe(pd.DataFrame(tracer.summary()), use_container_width=True, hide_index=True)
+                timing_columns = st.columns(2)
+                with timing_columns[0]:
+                    st.download_button(
+                        label="Download spans (JSON)",
+                        data=tracer.to_json(),
+                        file_name=f"share_of_search_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        mime="application/json"
+                    )
+                with timing_columns[1]:
+                    st.download_button(
+                        label="Download trace (OpenTelemetry JSON)",
+                        data=json.dumps(tracer.to_otel()),
+                        file_name=f"share_of_search_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.otlp.json",
+                        mime="application/json"
+                    )
 
 # Footer
 st.markdown("---")
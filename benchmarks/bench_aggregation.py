@@ -0,0 +1,75 @@
+"""Benchmark the single-pass bucketing of keyword ideas responses.
+
+Feeds synthetic responses of growing size through
+``index_keyword_monthly_volumes`` and sums the brand's months into the periods
+of every granularity, printing the cost per idea, which should stay flat as
+the response, keyword seed and month range grow. The smaller responses are
+also bucketed by walking the response again for every period, as the app did
+before, and both must give the same period volumes.
+
+Run with ``python benchmarks/bench_aggregation.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import synthetic_response
+from share_of_search.aggregation import (
+    build_periods, index_keyword_monthly_volumes, month_range, normalize_keyword, sum_keyword_volumes
+)
+
+
+def single_pass(response, keywords, periods):
+    """Walk the response once, then sum the brand's (year, month) table into ``periods``."""
+    monthly_volumes = sum_keyword_volumes(index_keyword_monthly_volumes(response, keywords), keywords)
+    return [(label, sum(monthly_volumes.get(month, 0) for month in months)) for label, months in periods]
+
+
+def walk_per_period(response, keywords, periods):
+    """Walk the whole response again for every period, summing the seed keywords' months in it."""
+    keyword_set = {normalize_keyword(k) for k in keywords}
+    volumes = []
+    for label, months in periods:
+        months = set(months)
+        volume = 0
+        for result in response:
+            if normalize_keyword(result.text) in keyword_set:
+                volume += sum(
+                    monthly_search_volume.monthly_searches
+                    for monthly_search_volume in result.keyword_idea_metrics.monthly_search_volumes
+                    if (monthly_search_volume.year, monthly_search_volume.month.value - 1) in months
+                )
+        volumes.append((label, volume))
+    return volumes
+
+
+def run(n_ideas, n_keywords, date_from, date_to, compare):
+    months = month_range(date_from, date_to)
+    keywords = [f"brand keyword {i}" for i in range(n_keywords)]
+    response = synthetic_response(n_ideas, months, keywords)
+    periods = [build_periods(date_from, date_to, granularity) for granularity in ("monthly", "quarterly", "yearly")]
+
+    start = time.perf_counter()
+    results = [single_pass(response, keywords, granularity_periods) for granularity_periods in periods]
+    elapsed = time.perf_counter() - start
+    line = (f"{n_ideas:>7} ideas {n_keywords:>4} keywords {len(months):>4} months: "
+            f"{elapsed * 1000:9.2f} ms  {elapsed / n_ideas * 1e6:7.3f} us/idea")
+
+    if compare:
+        start = time.perf_counter()
+        expected = [walk_per_period(response, keywords, granularity_periods) for granularity_periods in periods]
+        line += f"  walk per period {(time.perf_counter() - start) * 1000:9.2f} ms"
+        assert results == expected, "the single pass must give the same period volumes as walking per period"
+    assert all(volume > 0 for result in results for _, volume in result)
+    print(line)
+
+
+if __name__ == "__main__":
+    for n_ideas, n_keywords, date_from, date_to, compare in [
+        (500, 10, "2024-01", "2024-12", True),
+        (5000, 100, "2015-01", "2024-12", True),
+        (50000, 1000, "2015-01", "2024-12", False),
+    ]:
+        run(n_ideas, n_keywords, date_from, date_to, compare)
@@ -0,0 +1,183 @@
+"""Load test the JSON API against a fake Keyword Planner backend.
+
+``users`` concurrent clients each ask for ``requests_per_user`` reports,
+drawn from a handful of distinct brand sets (teams looking at the same
+market ask for the same report). They are served three ways:
+
+- per session: every request runs the pipeline on its own, as a Streamlit
+  script does for its session (no keyword cache, no coalescing);
+- API, no response cache: the HTTP server, with identical reports in
+  progress coalesced and keyword requests shared through one SingleFlight;
+- API: the same with the response cache, and clients revalidating the
+  reports they already hold with If-None-Match.
+
+Every fake Keyword Planner call sleeps for ``latency`` seconds; all three go
+through one RequestScheduler with the same concurrency cap. The API must
+return the same rows as the direct pipeline call.
+
+Run with ``python benchmarks/bench_api.py``.
+"""
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+
+from benchmarks.fake_ads import FakeGoogleAdsClient, FakeKeywordPlanIdeaService
+from share_of_search.aggregation import month_range
+from share_of_search.api import ReportService, create_app, parse_report_request
+from share_of_search.keyword_planner import get_search_volumes
+from share_of_search.scheduler import RequestScheduler
+
+SETTINGS = {
+    "location": "Czech Republic", "language": "English", "network": "google", "dateFrom": "2024-01-01",
+    "dateTo": "2024-12-31", "granularity": "monthly"
+}
+
+
+def report_bodies(n_reports, n_brands):
+    """Return request bodies of distinct reports that share most of their competitors."""
+    bodies = []
+    for report in range(n_reports):
+        brands = [{"id": "own", "name": f"Own brand {report}", "keywords": [f"own brand {report}"], "isOwnBrand": True}]
+        brands += [
+            {"id": str(i), "name": f"Competitor {i}", "keywords": [f"competitor {i}", f"competitor {i} shop"],
+             "isOwnBrand": False}
+            for i in range(n_brands - 1)
+        ]
+        bodies.append(json.dumps({"brands": brands, "settings": SETTINGS}).encode())
+    return bodies
+
+
+def workload(users, requests_per_user, n_reports, seed=0):
+    """Return the report index of every request of every user."""
+    rng = random.Random(seed)
+    return [[rng.randrange(n_reports) for _ in range(requests_per_user)] for _ in range(users)]
+
+
+def start_server(service):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(create_app(service), log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, sock.getsockname()[1]
+
+
+def run_per_session(bodies, plan, client, scheduler):
+    requests = [parse_report_request(json.loads(body)) for body in bodies]
+
+    def user(indices):
+        latencies = []
+        for index in indices:
+            start = time.perf_counter()
+            results, errors = get_search_volumes(
+                list(requests[index].brands), requests[index].settings, client, "1234567890", scheduler=scheduler
+            )
+            results.to_json(orient="records")
+            latencies.append(time.perf_counter() - start)
+        return latencies, {"200": len(indices)}, None
+
+    return run_users(user, plan)
+
+
+def run_api(bodies, plan, port, revalidate):
+    def user(indices):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        etags = {}
+        latencies, statuses, received = [], {}, 0
+        for index in indices:
+            headers = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+            if revalidate and index in etags:
+                headers["If-None-Match"] = etags[index]
+            start = time.perf_counter()
+            connection.request("POST", "/api/search-volumes", body=bodies[index], headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status)] = statuses.get(str(response.status), 0) + 1
+            received += len(payload)
+            if response.status == 200:
+                etags[index] = response.getheader("ETag")
+        connection.close()
+        return latencies, statuses, received
+
+    return run_users(user, plan)
+
+
+def run_users(user, plan):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+        outcomes = list(executor.map(user, plan))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latencies, _, _ in outcomes for latency in latencies)
+    statuses = {}
+    for _, user_statuses, _ in outcomes:
+        for status, count in user_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "statuses": statuses,
+        # Per-session reports are rendered in place, nothing is sent
+        "received": None if outcomes[0][2] is None else sum(received for _, _, received in outcomes),
+    }
+
+
+def check_same_rows(bodies, client, port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    connection.request("POST", "/api/search-volumes", body=bodies[0], headers={"Content-Type": "application/json"})
+    served = json.loads(connection.getresponse().read())
+    connection.close()
+    request = parse_report_request(json.loads(bodies[0]))
+    results, _ = get_search_volumes(
+        list(request.brands), request.settings, client, "1234567890", scheduler=RequestScheduler(requests_per_second=1e6)
+    )
+    assert served["results"] == json.loads(results.to_json(orient="records")), "the API must serve the pipeline's rows"
+    assert set(served["results"][0]) == {"brand", "period", "volume", "share", "color"}
+
+
+def run(users, requests_per_user, n_reports=5, n_brands=20, latency=0.05, max_requests=16):
+    bodies = report_bodies(n_reports, n_brands)
+    plan = workload(users, requests_per_user, n_reports)
+    months = month_range("2015-01", "2026-12")
+    print(f"{users} users x {requests_per_user} requests, {n_reports} distinct reports of {n_brands} brands, "
+          f"{latency * 1000:.0f} ms per Keyword Planner call, {max_requests} calls in flight")
+
+    for label in ("per session", "API, no response cache", "API"):
+        service = FakeKeywordPlanIdeaService(months, latency=latency, ideas_per_request=20)
+        client = FakeGoogleAdsClient(service)
+        scheduler = RequestScheduler(requests_per_second=1e6, max_concurrent=max_requests)
+        if label == "per session":
+            outcome = run_per_session(bodies, plan, client, scheduler)
+        else:
+            report_service = ReportService(
+                client, "1234567890", scheduler=scheduler, cache_size=0 if "no response" in label else 256
+            )
+            server, thread, port = start_server(report_service)
+            outcome = run_api(bodies, plan, port, revalidate=label == "API")
+            check_same_rows(bodies, FakeGoogleAdsClient(FakeKeywordPlanIdeaService(months, ideas_per_request=20)), port)
+            server.should_exit = True
+            thread.join()
+        total = users * requests_per_user
+        print(f"  {label:<23} {total / outcome['elapsed']:7.1f} reports/s, p50 {outcome['p50'] * 1000:7.1f} ms, "
+              f"p95 {outcome['p95'] * 1000:7.1f} ms, {service.calls:>5} API calls, "
+              + (f"{outcome['received'] / 1024:7.1f} KiB sent, " if outcome["received"] is not None else "")
+              + f"statuses {outcome['statuses']}")
+
+
+if __name__ == "__main__":
+    run(10, 5)
+    run(50, 10)
@@ -0,0 +1,56 @@
+"""Compare payload size and parse time of the keyword ideas and historical metrics backends.
+
+Responses are serialised to JSON as an offline proxy for the protobuf payload,
+so absolute sizes differ from the wire but the ratio between backends holds:
+the ideas path returns every related idea, the historical metrics path only
+the requested keywords. Both backends must return every month of every
+requested keyword.
+
+Run with ``python benchmarks/bench_backends.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import from_wire, historical_metrics_response, synthetic_response, to_wire
+from share_of_search.aggregation import index_historical_metrics, index_keyword_monthly_volumes, month_range
+from share_of_search.planner import BATCH_SIZES, plan_keyword_batches
+
+
+def measure(payloads, index, keywords_per_payload):
+    keyword_volumes = {}
+    start = time.perf_counter()
+    for payload, keywords in zip(payloads, keywords_per_payload):
+        keyword_volumes.update(index(from_wire(payload), keywords))
+    return sum(len(p) for p in payloads), time.perf_counter() - start, keyword_volumes
+
+
+def run(n_keywords, ideas_per_request, date_from="2015-01", date_to="2024-12"):
+    months = month_range(date_from, date_to)
+    keywords = [f"brand keyword {i}" for i in range(n_keywords)]
+
+    ideas_batches = plan_keyword_batches(keywords, BATCH_SIZES["ideas"])
+    ideas_payloads = [to_wire(synthetic_response(ideas_per_request, months, batch)) for batch in ideas_batches]
+    historical_batches = plan_keyword_batches(keywords, BATCH_SIZES["historical"])
+    historical_payloads = [to_wire(historical_metrics_response(months, batch)) for batch in historical_batches]
+
+    ideas_bytes, ideas_time, ideas_volumes = measure(ideas_payloads, index_keyword_monthly_volumes, ideas_batches)
+    historical_bytes, historical_time, historical_volumes = measure(
+        historical_payloads, index_historical_metrics, historical_batches
+    )
+    for volumes in (ideas_volumes, historical_volumes):
+        assert sorted(volumes) == sorted(keywords), "every requested keyword must be indexed, and nothing else"
+        assert all(sorted(volumes[keyword]) == months for keyword in keywords), "every month must be indexed"
+    assert historical_bytes < ideas_bytes, "historical metrics must return less than keyword ideas"
+
+    print(f"{n_keywords:>5} keywords {len(months):>4} months | "
+          f"ideas {len(ideas_batches):>3} req {ideas_bytes / 1e6:8.2f} MB {ideas_time * 1000:8.1f} ms | "
+          f"historical {len(historical_batches):>2} req {historical_bytes / 1e6:7.2f} MB {historical_time * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    run(20, 300)
+    run(100, 300)
+    run(500, 300)
@@ -0,0 +1,123 @@
+"""Time the vectorised brand file import against the same normalisation done row by row.
+
+A messy competitive set is generated as CSV and Excel: brand names in mixed
+case and spacing, several keywords per cell, repeated keywords within and
+across brands, and missing keywords. Both imports must produce the same
+brands and keywords. For the smallest set, a full run of app.py with the
+imported brands is timed too: entering the set by hand cost one such rerun
+per edit before the brand editors became fragments.
+
+Run with ``python benchmarks/bench_brand_import.py``.
+"""
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from share_of_search.aggregation import normalize_keyword
+from share_of_search.brand_import import (
+    MAX_KEYWORD_LENGTH, MAX_KEYWORD_WORDS, import_brand_file, normalize_brand_table, read_brand_table
+)
+
+
+def brand_file(n_brands, n_keywords, seed=0):
+    """Return a brand, keyword table with about ``n_keywords`` keywords spread over ``n_brands`` brands."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_keywords):
+        brand = rng.randrange(n_brands)
+        name = rng.choice([f"Brand {brand}", f"brand  {brand}", f" BRAND {brand} "])
+        keyword = f"brand {brand} {rng.choice(['shop', 'eshop', 'cena', 'recenze', 'akce'])} {rng.randrange(n_keywords // n_brands)}"
+        if rng.random() < 0.1:
+            keyword += f"; Brand {brand}  Outlet"
+        if rng.random() < 0.02:
+            keyword = f"brand {rng.randrange(n_brands)} shop 0"
+        rows.append((name, keyword.upper() if rng.random() < 0.1 else keyword))
+    rows += [(f"Brand {n_brands + i}", "") for i in range(5)]
+    return pd.DataFrame(rows, columns=["Brand", "Keyword"])
+
+
+def row_by_row(frame):
+    """Normalise a brand table with a Python loop over its rows; returns {brand name: keywords}."""
+    names, rows = {}, []
+    for name, cell in zip(frame["Brand"], frame["Keyword"]):
+        name = " ".join(name.split())
+        if not name:
+            continue
+        key = name.casefold()
+        names.setdefault(key, name)
+        for keyword in cell.replace("\r", "\n").replace(";", "\n").replace("|", "\n").replace(",", "\n").split("\n"):
+            keyword = normalize_keyword(keyword)
+            if keyword:
+                rows.append((key, keyword))
+    with_keywords = {key for key, _ in rows}
+    rows += [(key, name.lower()) for key, name in names.items() if key not in with_keywords]
+
+    # A keyword belongs to the brand of the first row listing it
+    brands, owner = {}, {}
+    for key, keyword in rows:
+        if len(keyword) > MAX_KEYWORD_LENGTH or len(keyword.split()) > MAX_KEYWORD_WORDS:
+            continue
+        if owner.setdefault(keyword, key) == key and keyword not in brands.get(names[key], []):
+            brands.setdefault(names[key], []).append(keyword)
+    return {names[key]: brands[names[key]] for key in names if names[key] in brands}
+
+
+def page_rerun_seconds(brands, repeat=3):
+    """Time a full run of app.py with ``brands`` in the session, which every brand edit cost before the fragments."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py"),
+                            default_timeout=120)
+    app.run()
+    app.session_state["brands"] = brands
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n_brands, n_keywords, rerun=False):
+    frame = brand_file(n_brands, n_keywords)
+    csv = frame.to_csv(index=False).encode("utf-8")
+    excel = io.BytesIO()
+    frame.to_excel(excel, index=False)
+    print(f"{n_keywords} keyword rows, {n_brands} brands")
+
+    start = time.perf_counter()
+    table = read_brand_table(csv, "brands.csv")
+    print(f"  read CSV          {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    expected = row_by_row(table)
+    print(f"  row by row        {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    imported = normalize_brand_table(table)
+    print(f"  vectorised        {(time.perf_counter() - start) * 1000:8.1f} ms, {len(imported.brands)} brands, "
+          f"{imported.keywords} keywords, {imported.duplicates} duplicates left out")
+    assert {brand["name"]: brand["keywords"] for brand in imported.brands} == expected, "imports must agree"
+
+    start = time.perf_counter()
+    from_excel = import_brand_file(excel.getvalue(), "brands.xlsx")
+    print(f"  read and import xlsx {(time.perf_counter() - start) * 1000:5.1f} ms")
+    assert [brand["keywords"] for brand in from_excel.brands] == [brand["keywords"] for brand in imported.brands]
+
+    if rerun:
+        # Typing a set in by hand takes at least a name and a keyword list per brand, each a page rerun
+        seconds = page_rerun_seconds(imported.brands)
+        print(f"  full page rerun   {seconds * 1000:8.1f} ms with these brands; "
+              f"{2 * len(imported.brands)} edits by hand took {2 * len(imported.brands) * seconds:5.1f} s of reruns")
+
+
+if __name__ == "__main__":
+    run(50, 1000, rerun=True)
+    run(200, 20000)
+    run(500, 100000)
@@ -0,0 +1,85 @@
+"""Measure chart payload size and build time by dataset size, with and without the brand limit.
+
+For each brand count and location count, the share, volume and market
+charts are built from a ten-year monthly result set with every brand drawn
+separately (max_brands=None) and with the default limit that sums the long
+tail into "Other". Payload is the figure JSON Streamlit sends to the
+browser; time covers building the figure and serialising it. The limited
+charts must draw at most the limit of series, with the tail as "Other", and
+the limited volume chart must keep every period's total volume.
+
+Run with ``python benchmarks/bench_charts.py``.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_of_search.aggregation import month_range
+from share_of_search.charts import (
+    DEFAULT_MAX_CHART_BRANDS, market_share_chart_figure, other_label, share_chart_figure, volume_chart_figure
+)
+from share_of_search.matrix import aggregate_matrix, build_volume_matrix, concat_location_frames, to_results_frame
+
+LOCATIONS = ("Czech Republic", "Slovakia", "Poland")
+
+
+def results_table(n_brands, n_locations, months):
+    rng = random.Random(0)
+    names = [f"Brand {i}" for i in range(n_brands)]
+    frames = {}
+    for location in LOCATIONS[:n_locations]:
+        # Long-tailed volumes: a few large brands and many small ones
+        keyword_volumes = {
+            f"brand {i}": {month: int(rng.paretovariate(1.2) * 1000) for month in months} for i in range(n_brands)
+        }
+        matrix = build_volume_matrix(keyword_volumes, names, [[f"brand {i}"] for i in range(n_brands)], months)
+        frames[location] = to_results_frame(aggregate_matrix(matrix, "monthly"), ["#1f77b4"] * n_brands)
+    return concat_location_frames(frames) if n_locations > 1 else frames[LOCATIONS[0]]
+
+
+def measure(build, results, max_brands, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        figure = build(results, {}, max_brands)
+        payload = figure.to_json()
+        best = min(best, time.perf_counter() - start)
+    return figure, len(payload), best
+
+
+def period_totals(figure):
+    totals = {}
+    for trace in figure.data:
+        for period, value in zip(trace.x, trace.y):
+            totals[period] = totals.get(period, 0) + value
+    return totals
+
+
+def run(n_brands, n_locations, n_months=120):
+    results = results_table(n_brands, n_locations, month_range("2015-01", "2024-12")[-n_months:])
+    charts = [("share", share_chart_figure), ("volume", volume_chart_figure)]
+    if n_locations > 1:
+        charts.append(("market", market_share_chart_figure))
+    for label, build in charts:
+        full, full_bytes, full_seconds = measure(build, results, None)
+        limited, limited_bytes, limited_seconds = measure(build, results, DEFAULT_MAX_CHART_BRANDS)
+        full_names, limited_names = {trace.name for trace in full.data}, {trace.name for trace in limited.data}
+        assert len(full_names) == n_brands, "without a limit every brand must be drawn"
+        assert len(limited_names) == min(n_brands, DEFAULT_MAX_CHART_BRANDS), "the limit must cap the series"
+        grouped = n_brands - DEFAULT_MAX_CHART_BRANDS + 1
+        assert (other_label(grouped) in limited_names) == (n_brands > DEFAULT_MAX_CHART_BRANDS)
+        assert limited_bytes <= full_bytes
+        if label == "volume":
+            assert period_totals(limited) == period_totals(full), "the limit must keep every period's total volume"
+        print(f"{n_brands:>3} brands x {n_months} months x {n_locations} locations | {label:<6} "
+              f"all brands {full_bytes / 1024:8.1f} KiB {full_seconds * 1000:7.0f} ms | "
+              f"top {DEFAULT_MAX_CHART_BRANDS} + Other {limited_bytes / 1024:7.1f} KiB {limited_seconds * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    for n_brands in (10, 50, 200):
+        for n_locations in (1, 3):
+            run(n_brands, n_locations)
@@ -0,0 +1,42 @@
+"""Benchmark concurrent per-brand fetching against a fake KeywordPlanIdeaService.
+
+The fake service sleeps to simulate the round-trip of a real API call and
+fails for one brand, which must be reported without dropping the others.
+
+Run with ``python benchmarks/bench_fetch.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import FakeAdsError, FakeKeywordPlanIdeaService, ideas_request
+from share_of_search.aggregation import index_keyword_monthly_volumes, month_range
+from share_of_search.fetch import fetch_all
+
+
+def run(n_brands, latency, max_workers):
+    months = month_range("2024-01", "2024-12")
+    jobs = [(f"brand {i}", [f"brand {i}", f"brand {i} shop"]) for i in range(n_brands)]
+    service = FakeKeywordPlanIdeaService(months, latency=latency, failing_keywords={"brand 3"})
+
+    def fetch_one(job):
+        response = service.generate_keyword_ideas(request=ideas_request(job[1]))
+        return index_keyword_monthly_volumes(response, job[1])
+
+    start = time.perf_counter()
+    outcomes = fetch_all(jobs, fetch_one, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+
+    assert [job for job, _, _ in outcomes] == jobs, "outcomes must keep brand order"
+    failed = [job[0] for job, _, error in outcomes if error is not None]
+    assert failed == ["brand 3"] and isinstance(outcomes[3][2], FakeAdsError)
+    assert all(volumes for _, volumes, error in outcomes if error is None)
+
+    print(f"{n_brands:>3} brands {latency * 1000:5.0f} ms latency {max_workers:>2} workers: {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    for max_workers in (1, 4, 8, 16):
+        run(15, 0.2, max_workers)
@@ -0,0 +1,143 @@
+"""Compare the geo target index with loading the geo targets file into every session.
+
+A synthetic file in Google's geo targets CSV format (countries, regions and
+cities with diacritics) is compiled into a GeoTargetIndex once. Location
+searches, by prefix and with typos, are then timed against the index and
+against the whole file loaded with pandas and scanned, which is what every
+session would do without the index. Both searches rank matches the same
+way and must return equally good matches for every scanned query.
+
+Run with ``python benchmarks/bench_geo.py``.
+"""
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from share_of_search.fuzzy import edit_distance, fold_text, max_edits
+from share_of_search.geo import COUNTRY_MAPPING, OTHER_TARGET_TYPE_RANK, TARGET_TYPE_RANKS, GeoTargetIndex
+
+SYLLABLES = ["bra", "no", "pra", "ha", "ost", "ra", "va", "ko", "ši", "ce", "lín", "zl", "ín", "ol", "mo", "uc", "dě",
+             "čín", "ta", "bor", "kr", "um", "lov", "ni", "tr", "há", "je", "se", "pl", "zeň"]
+
+
+def write_geo_targets(path, n_targets, seed=0):
+    """Write a geo targets CSV with the COUNTRY_MAPPING countries, ten regions each and cities up to ``n_targets``."""
+    rng = random.Random(seed)
+    countries = [(name, geo_id) for name, geo_id in COUNTRY_MAPPING.items() if geo_id.isdigit()]
+    rows, regions = [], []
+    for name, geo_id in countries:
+        code = f"{name[:1]}{chr(65 + int(geo_id) % 26)}".upper()
+        rows.append((geo_id, name, name, "", code, "Country"))
+        for region in range(10):
+            region_id = str(20000 + len(regions))
+            region_name = "".join(rng.choice(SYLLABLES) for _ in range(3)).title() + " Region"
+            rows.append((region_id, region_name, f"{region_name},{name}", geo_id, code, "Region"))
+            regions.append((region_id, f"{region_name},{name}", code))
+    while len(rows) < n_targets:
+        region_id, region_canonical, code = rng.choice(regions)
+        city = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice([2, 3, 4]))).title()
+        rows.append((str(1000000 + len(rows)), city, f"{city},{region_canonical}", region_id, code, "City"))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Criteria ID", "Name", "Canonical Name", "Parent ID", "Country Code", "Target Type", "Status"])
+        writer.writerows(row + ("Active",) for row in rows)
+    return rows
+
+
+def scan_search(frame, query, limit=20):
+    """Search the loaded file row by row, ranking matches like GeoTargetIndex.search; returns their rank keys."""
+    folded = fold_text(query)
+    ranked = sorted(
+        (0, name != folded, TARGET_TYPE_RANKS.get(target_type, OTHER_TARGET_TYPE_RANK), len(name), label)
+        for name, label, target_type in zip(frame["folded"], frame["Name"], frame["Target Type"])
+        if name.startswith(folded)
+    )[:limit]
+    limit_edits = max_edits(folded)
+    if len(ranked) < limit and limit_edits:
+        ranked += sorted(
+            (1, distance, TARGET_TYPE_RANKS.get(target_type, OTHER_TARGET_TYPE_RANK))
+            for name, target_type in zip(frame["folded"], frame["Target Type"])
+            if not name.startswith(folded) and (distance := edit_distance(folded, name, limit_edits)) <= limit_edits
+        )[:limit - len(ranked)]
+    return ranked
+
+
+def index_search(index, query):
+    """Search the index; returns the rank keys of its results, as scan_search does."""
+    folded = fold_text(query)
+    ranked = []
+    for target in index.search(query):
+        name = fold_text(target.name)
+        type_rank = TARGET_TYPE_RANKS.get(target.target_type, OTHER_TARGET_TYPE_RANK)
+        if name.startswith(folded):
+            ranked.append((0, name != folded, type_rank, len(name), target.name))
+        else:
+            distance = edit_distance(folded, name, max_edits(folded))
+            assert distance <= max_edits(folded), f"{target.name!r} does not match {query!r}"
+            ranked.append((1, distance, type_rank))
+    return ranked
+
+
+def run(n_targets=100000, n_queries=200, seed=0):
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, "geotargets.csv")
+    rows = write_geo_targets(csv_path, n_targets, seed)
+    rng = random.Random(seed)
+    print(f"{len(rows)} geo targets, {os.path.getsize(csv_path) / 1e6:.1f} MB CSV")
+
+    start = time.perf_counter()
+    index = GeoTargetIndex(os.path.join(directory, "geo.sqlite"), csv_path)
+    print(f"  build index          {(time.perf_counter() - start) * 1000:8.1f} ms once, "
+          f"{os.path.getsize(index.path) / 1e6:.1f} MB on disk")
+    start = time.perf_counter()
+    GeoTargetIndex(index.path, csv_path)
+    print(f"  open index           {(time.perf_counter() - start) * 1000:8.1f} ms per process")
+
+    start = time.perf_counter()
+    frame = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    frame["folded"] = [fold_text(name) for name in frame["Name"]]
+    print(f"  load file            {(time.perf_counter() - start) * 1000:8.1f} ms per session, "
+          f"{frame.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+
+    names = [row[1] for row in rows if row[5] == "City"]
+    queries = {
+        "prefix": [name[:rng.randint(2, 5)] for name in rng.sample(names, n_queries)],
+        "typo": [name[:2] + name[3:] if len(name) > 5 else name for name in rng.sample(names, n_queries)],
+    }
+    for kind, kind_queries in queries.items():
+        for label, search in (
+            ("index", lambda query: index_search(index, query)),
+            ("scan", lambda query: scan_search(frame, query)),
+        ):
+            # The scan is slow; a tenth of the queries is enough to time it
+            timed = kind_queries if label == "index" else kind_queries[:n_queries // 10]
+            latencies, results = [], {}
+            for query in timed:
+                start = time.perf_counter()
+                results[query] = search(query)
+                latencies.append(time.perf_counter() - start)
+            print(f"  {kind:<6} search, {label:<5}  p50 {statistics.median(latencies) * 1000:7.2f} ms, "
+                  f"max {max(latencies) * 1000:7.2f} ms")
+            if label == "index":
+                found = results
+            else:
+                for query, scanned in results.items():
+                    assert found[query] == scanned, f"the index and the scan must rank the same matches of {query!r}"
+
+    start = time.perf_counter()
+    canonical_names = [row[2] for row in rng.sample(rows, 1000)]
+    for canonical_name in canonical_names:
+        index.resolve(canonical_name)
+    print(f"  resolve location     {(time.perf_counter() - start) * 1000 / len(canonical_names):8.3f} ms")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,41 @@
+"""Measure the cold import time of the core library against the app's UI dependencies.
+
+Each import runs in a fresh interpreter so module caches do not hide the cost.
+The core library imports must not load Streamlit.
+
+Run with ``python benchmarks/bench_import.py``.
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIBRARY_IMPORTS = [
+    "share_of_search",
+    "share_of_search.keyword_planner",
+    "share_of_search.batch",
+]
+IMPORTS = LIBRARY_IMPORTS + ["streamlit, plotly.express, pandas, google.ads.googleads.client"]
+
+
+def cold_import_seconds(statement, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {statement}"], cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def loads_streamlit(statement):
+    script = f"import sys\nimport {statement}\nsys.exit('streamlit' in sys.modules)"
+    return subprocess.run([sys.executable, "-c", script], cwd=ROOT).returncode != 0
+
+
+if __name__ == "__main__":
+    for statement in IMPORTS:
+        print(f"{cold_import_seconds(statement) * 1000:8.1f} ms  import {statement}")
+    for statement in LIBRARY_IMPORTS:
+        assert not loads_streamlit(statement), f"import {statement} must not load Streamlit"
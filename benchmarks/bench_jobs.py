@@ -0,0 +1,118 @@
+"""Measure how long a report blocks the script, job deduplication and restarts with the background job queue.
+
+A ten-year report of 40 brands in two locations is fetched against a fake
+Keyword Planner service (``latency`` seconds per call), first synchronously,
+as the Generate button used to do in the script thread, then through a
+JobQueue with worker processes, where the script only waits for the enqueue.
+Several sessions then enqueue the same report at once. Finally a server
+process and its workers are killed halfway through a job; a new queue on the
+same job table must finish it once the job's lease expires (``LEASE_SECONDS``
+here instead of a minute).
+
+Run with ``python benchmarks/bench_jobs.py``.
+"""
+import functools
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import fake_google_ads_client
+from share_of_search.aggregation import month_range
+from share_of_search.jobs import JobQueue
+from share_of_search.keyword_planner import get_search_volumes_by_location
+from share_of_search.scheduler import RequestScheduler
+
+MONTHS = month_range("2015-01", "2026-12")
+LEASE_SECONDS = 3
+LOCATIONS = ["Czech Republic", "Slovakia"]
+SETTINGS = {
+    "location": LOCATIONS[0], "compareLocations": LOCATIONS[1:], "network": "GOOGLE_SEARCH", "dateFrom": "2015-01",
+    "dateTo": "2024-12", "granularity": "monthly", "maxConcurrentRequests": 4, "backend": "ideas", "useCache": False
+}
+
+
+def brands(n_brands, prefix="brand"):
+    return [
+        {"name": f"{prefix} {i}", "keywords": [f"{prefix} {i}", f"{prefix} {i} shop"], "isOwnBrand": i == 0,
+         "color": "#1f77b4"}
+        for i in range(n_brands)
+    ]
+
+
+def wait(queue, job_id):
+    while not (job := queue.job(job_id)).finished:
+        time.sleep(0.05)
+    return job
+
+
+def run(n_brands=40, latency=0.1, sessions=8):
+    factory = functools.partial(fake_google_ads_client, MONTHS, latency=latency, ideas_per_request=20)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "jobs.sqlite")
+    options = {
+        "path": path, "workers": 2, "requests_per_second": 1e6, "keyword_cache_path": None, "lease_seconds": LEASE_SECONDS
+    }
+    print(f"{n_brands} brands x 120 months x {len(LOCATIONS)} locations, {latency * 1000:.0f} ms per Keyword Planner call")
+
+    start = time.perf_counter()
+    get_search_volumes_by_location(
+        brands(n_brands), SETTINGS, LOCATIONS, factory(), "1234567890", scheduler=RequestScheduler(requests_per_second=1e6)
+    )
+    print(f"  synchronous fetch        script blocked {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    queue = JobQueue(factory, "1234567890", **options)
+    # Let the worker processes start before timing
+    wait(queue, queue.enqueue(brands(1, "warm-up"), SETTINGS, LOCATIONS).id)
+    start = time.perf_counter()
+    job = queue.enqueue(brands(n_brands), SETTINGS, LOCATIONS)
+    blocked = time.perf_counter() - start
+    job = wait(queue, job.id)
+    print(f"  background job           script blocked {blocked * 1000:8.1f} ms, "
+          f"job finished after {(job.finished_at - job.created_at) * 1000:8.1f} ms")
+
+    report = brands(n_brands, "deduplicated")
+    ids = {queue.enqueue(report, SETTINGS, LOCATIONS).id for _ in range(sessions)}
+    job = wait(queue, ids.pop())
+    print(f"  {sessions} identical enqueues     {len(ids) + 1} job, {job.requests['requests']} Keyword Planner requests")
+
+    queue.close()
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", path, str(n_brands), str(latency)], stdout=subprocess.PIPE, text=True,
+        start_new_session=True
+    )
+    job_id = server.stdout.readline().strip()
+    while (job := queue.store.get(job_id)).fetched < job.total // 2:
+        time.sleep(0.05)
+    os.killpg(server.pid, signal.SIGKILL)
+    server.wait()
+    killed_at = queue.store.get(job_id).fetched
+
+    restarted_at = time.perf_counter()
+    restarted = JobQueue(factory, "1234567890", **options)
+    job = wait(restarted, job_id)
+    assert job.status == "done" and job.fetched == job.total, "a restarted queue must finish the interrupted job"
+    print(f"  server killed mid-job    at {killed_at} of {job.total} brands; {job.status} "
+          f"{time.perf_counter() - restarted_at:.1f} s after the restart ({LEASE_SECONDS} s lease)")
+    restarted.close()
+
+
+def serve(path, n_brands, latency):
+    """Run a queue with one job until the parent kills this process group."""
+    factory = functools.partial(fake_google_ads_client, MONTHS, latency=latency, ideas_per_request=20)
+    queue = JobQueue(factory, "1234567890", path=path, workers=2, requests_per_second=1e6, keyword_cache_path=None,
+                     lease_seconds=LEASE_SECONDS)
+    print(queue.enqueue(brands(n_brands, "restarted"), SETTINGS, LOCATIONS).id, flush=True)
+    time.sleep(600)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        run()
@@ -0,0 +1,96 @@
+"""Compare dict-loop aggregation with the vectorised volume matrix for many brands.
+
+Both paths start from the same keyword -> {(year, month): volume} tables and
+produce the long results table plus the Data Table pivot for all three
+granularities, and must give the same volumes and shares. The dict loops are
+the aggregation the app used before the matrix and are kept here as the
+reference.
+
+Run with ``python benchmarks/bench_matrix.py``.
+"""
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_of_search.aggregation import build_periods, month_range, sum_keyword_volumes
+from share_of_search.matrix import aggregate_matrix, build_volume_matrix, pivot_results, to_results_frame
+
+
+def aggregate_periods(monthly_volumes, periods):
+    """Sum a (year, month) -> volume table into the given periods, returning (label, volume) pairs."""
+    return [
+        (label, sum(monthly_volumes.get(month, 0) for month in months))
+        for label, months in periods
+    ]
+
+
+def calculate_shares(results):
+    """Fill in the ``share`` of every result row as a percentage of its period total."""
+    period_totals = {}
+    for result in results:
+        period_totals[result["period"]] = period_totals.get(result["period"], 0) + result["volume"]
+
+    for result in results:
+        total = period_totals[result["period"]]
+        if total > 0:
+            result["share"] = round((result["volume"] / total) * 100, 1)
+    return results
+
+
+def keyword_tables(n_brands, keywords_per_brand, months):
+    rng = random.Random(0)
+    brand_keyword_lists = [[f"brand {b} kw {k}" for k in range(keywords_per_brand)] for b in range(n_brands)]
+    keyword_volumes = {
+        keyword: {month: rng.randint(0, 10000) for month in months}
+        for keywords in brand_keyword_lists for keyword in keywords
+    }
+    return brand_keyword_lists, keyword_volumes
+
+
+def dict_loops(names, brand_keyword_lists, keyword_volumes, date_from, date_to, granularity):
+    periods = build_periods(date_from, date_to, granularity)
+    results = []
+    for name, keywords in zip(names, brand_keyword_lists):
+        monthly_volumes = sum_keyword_volumes(keyword_volumes, keywords)
+        for label, volume in aggregate_periods(monthly_volumes, periods):
+            if volume > 0:
+                results.append({"brand": name, "period": label, "volume": volume, "share": 0, "color": "#000000"})
+    df = pd.DataFrame(calculate_shares(results))
+    return df, pivot_results(df)
+
+
+def vectorised(names, brand_keyword_lists, keyword_volumes, months, granularity):
+    matrix = build_volume_matrix(keyword_volumes, names, brand_keyword_lists, months)
+    df = to_results_frame(aggregate_matrix(matrix, granularity), ["#000000"] * len(names))
+    return df, pivot_results(df)
+
+
+def run(n_brands, date_from, date_to, keywords_per_brand=3):
+    months = month_range(date_from, date_to)
+    brand_keyword_lists, keyword_volumes = keyword_tables(n_brands, keywords_per_brand, months)
+    names = [f"Brand {b}" for b in range(n_brands)]
+
+    for granularity in ("monthly", "quarterly", "yearly"):
+        start = time.perf_counter()
+        expected, _ = dict_loops(names, brand_keyword_lists, keyword_volumes, date_from, date_to, granularity)
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual, _ = vectorised(names, brand_keyword_lists, keyword_volumes, months, granularity)
+        matrix_time = time.perf_counter() - start
+
+        assert expected["volume"].tolist() == actual["volume"].tolist()
+        assert expected["share"].tolist() == actual["share"].tolist()
+        print(f"{n_brands:>4} brands {len(months):>4} months {granularity:>9}: "
+              f"dict loops {loop_time * 1000:8.1f} ms  matrix {matrix_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    run(20, "2024-01", "2024-12")
+    run(100, "2015-01", "2024-12")
+    run(500, "2015-01", "2024-12")
@@ -0,0 +1,59 @@
+"""Compare per-brand requests with cross-brand keyword batches against a fake KeywordPlanIdeaService.
+
+Run with ``python benchmarks/bench_planner.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import FakeKeywordPlanIdeaService, ideas_request
+from share_of_search.aggregation import index_keyword_monthly_volumes, month_range, sum_keyword_volumes
+from share_of_search.fetch import fetch_all
+from share_of_search.planner import brand_keywords, plan_keyword_batches, unique_keywords
+
+
+def make_brands(n_brands, keywords_per_brand, shared_keywords):
+    return [
+        {"name": f"Brand {i}", "keywords": [f"brand {i} kw {j}" for j in range(keywords_per_brand)] + shared_keywords}
+        for i in range(n_brands)
+    ]
+
+
+def run(n_brands, keywords_per_brand, latency=0.1, max_workers=4):
+    months = month_range("2024-01", "2024-12")
+    brands = make_brands(n_brands, keywords_per_brand, ["Shared Category Term"])
+    jobs = [(brand, brand_keywords(brand)) for brand in brands]
+
+    timings = {}
+    totals = {}
+    for mode in ("per-brand", "batched"):
+        service = FakeKeywordPlanIdeaService(months, latency=latency)
+
+        def fetch_one(keywords):
+            return index_keyword_monthly_volumes(service.generate_keyword_ideas(request=ideas_request(keywords)), keywords)
+
+        start = time.perf_counter()
+        if mode == "per-brand":
+            outcomes = fetch_all([keywords for _, keywords in jobs], fetch_one, max_workers=max_workers)
+            tables = [fetched for _, fetched, _ in outcomes]
+        else:
+            batches = plan_keyword_batches(unique_keywords(keywords for _, keywords in jobs))
+            keyword_volumes = {}
+            for _, fetched, _ in fetch_all(batches, fetch_one, max_workers=max_workers):
+                keyword_volumes.update(fetched)
+            tables = [keyword_volumes] * len(jobs)
+        totals[mode] = [sum(sum_keyword_volumes(table, keywords).values() or [0]) > 0 for table, (_, keywords) in zip(tables, jobs)]
+        timings[mode] = (service.calls, time.perf_counter() - start)
+
+    assert all(totals["batched"]), "every brand must get volumes routed back"
+    print(f"{n_brands:>3} brands x {keywords_per_brand + 1} keywords: " + "  ".join(
+        f"{mode} {calls:>3} RPCs {elapsed * 1000:7.1f} ms" for mode, (calls, elapsed) in timings.items()
+    ))
+
+
+if __name__ == "__main__":
+    run(5, 2)
+    run(20, 2)
+    run(50, 4)
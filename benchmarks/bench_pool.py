@@ -0,0 +1,163 @@
+"""Load test the pooled Google Ads client against a local fake gRPC KeywordPlanIdeaService.
+
+N simulated sessions send GenerateKeywordIdeas requests at the same time,
+first through a client that opens a new channel on every ``get_service``
+call (what GoogleAdsClient does) and then through a PooledGoogleAdsClient.
+The server is a real gRPC server speaking the Google Ads protobufs over an
+insecure local port, so channel setup and HTTP/2 connection reuse are
+measured rather than simulated. Finally the server is restarted to check that
+the pool's health check replaces the dead channels.
+
+Run with ``python benchmarks/bench_pool.py`` (needs google-ads and grpcio).
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grpc
+from google.ads.googleads.client import GoogleAdsClient
+from google.auth.credentials import AnonymousCredentials
+
+from share_of_search.aggregation import month_range
+from share_of_search.keyword_planner import fetch_keyword_monthly_volumes
+from share_of_search.pool import PooledGoogleAdsClient
+
+MONTHS = month_range("2024-01", "2024-12")
+SETTINGS = {"location": "Germany", "network": "GOOGLE_SEARCH", "backend": "ideas"}
+
+
+class FakeIdeasHandler(grpc.GenericRpcHandler):
+    """Answer GenerateKeywordIdeas with one idea per seed keyword after ``latency`` seconds."""
+
+    def __init__(self, ads_client, latency):
+        self.request_type = type(ads_client.get_type("GenerateKeywordIdeasRequest"))
+        self.response_type = type(ads_client.get_type("GenerateKeywordIdeaResponse"))
+        self.latency = latency
+
+    def generate(self, request, context):
+        time.sleep(self.latency)
+        return self.response_type(results=[
+            {
+                "text": keyword,
+                "keyword_idea_metrics": {"monthly_search_volumes": [
+                    # MonthOfYearEnum values are the calendar month + 1
+                    {"year": year, "month": month + 1, "monthly_searches": 100 * month}
+                    for year, month in MONTHS
+                ]},
+            }
+            for keyword in request.keyword_seed.keywords
+        ])
+
+    def service(self, handler_call_details):
+        if handler_call_details.method.endswith("/GenerateKeywordIdeas"):
+            return grpc.unary_unary_rpc_method_handler(
+                self.generate,
+                request_deserializer=self.request_type.deserialize,
+                response_serializer=self.response_type.serialize
+            )
+        return None
+
+
+def start_server(ads_client, latency, port=0):
+    server = grpc.server(ThreadPoolExecutor(max_workers=64))
+    server.add_generic_rpc_handlers((FakeIdeasHandler(ads_client, latency),))
+    port = server.add_insecure_port(f"127.0.0.1:{port}")
+    server.start()
+    return server, port
+
+
+class LocalAdsClient:
+    """Opens a new insecure channel to the fake server on every get_service call, like GoogleAdsClient."""
+
+    def __init__(self, ads_client, address):
+        self.client = ads_client
+        self.address = address
+        self.channels = 0
+        self._lock = threading.Lock()
+        self._classes = {}
+
+    def get_service(self, name):
+        with self._lock:
+            if name not in self._classes:
+                service = self.client.get_service(name)
+                service.transport.close()
+                self._classes[name] = type(service)
+            self.channels += 1
+        service_class = self._classes[name]
+        return service_class(transport=service_class.get_transport_class()(channel=grpc.insecure_channel(self.address)))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def load_test(client, sessions, requests_per_session):
+    latencies = []
+    lock = threading.Lock()
+
+    def session(number):
+        for request in range(requests_per_session):
+            keywords = [f"brand {number} kw {request} {k}" for k in range(5)]
+            start = time.perf_counter()
+            volumes = fetch_keyword_monthly_volumes(client, "1234567890", keywords, SETTINGS, MONTHS[0], MONTHS[-1])
+            elapsed = time.perf_counter() - start
+            assert set(volumes) == set(keywords) and volumes[keywords[0]][(2024, 3)] == 300
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(session, range(sessions)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return wall, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def run(sessions, requests_per_session, latency=0.02, pool_size=4):
+    ads_client = GoogleAdsClient(AnonymousCredentials(), "0", use_proto_plus=True)
+    server, port = start_server(ads_client, latency)
+    try:
+        unpooled = LocalAdsClient(ads_client, f"127.0.0.1:{port}")
+        pooled_local = LocalAdsClient(ads_client, f"127.0.0.1:{port}")
+        pooled = PooledGoogleAdsClient(pooled_local, size=pool_size)
+        for label, client, local in (("new channel per call", unpooled, unpooled),
+                                     (f"pool of {pool_size}", pooled, pooled_local)):
+            wall, p50, p95 = load_test(client, sessions, requests_per_session)
+            channels = local.channels
+            print(f"{sessions:>3} sessions x {requests_per_session:>2} requests | {label:<20} {wall * 1000:8.1f} ms total, "
+                  f"p50 {p50 * 1000:6.1f} ms, p95 {p95 * 1000:6.1f} ms, {channels:>4} channels opened")
+    finally:
+        server.stop(None)
+
+
+def check_health_replacement():
+    """Idle channels to a restarted server are checked and replaced instead of failing the first request."""
+    ads_client = GoogleAdsClient(AnonymousCredentials(), "0", use_proto_plus=True)
+    server, port = start_server(ads_client, 0.0)
+    pooled = PooledGoogleAdsClient(
+        LocalAdsClient(ads_client, f"127.0.0.1:{port}"), size=2, keepalive_seconds=0.0, health_check_timeout=0.5
+    )
+    load_test(pooled, 2, 2)
+    server.stop(None).wait()
+
+    # With the server down the idle channels fail their check and are replaced
+    pooled.get_service("KeywordPlanIdeaService")
+    replaced = pooled.pool.stats.as_dict()["replaced"]
+    server, _ = start_server(ads_client, 0.0, port=port)
+    try:
+        load_test(pooled, 2, 2)
+    finally:
+        server.stop(None)
+    assert replaced >= 1, "an unhealthy idle channel must be replaced"
+    print(f"health check after server restart: {pooled.pool.stats.as_dict()}")
+
+
+if __name__ == "__main__":
+    run(4, 10)
+    run(16, 10)
+    run(64, 5)
+    check_health_replacement()
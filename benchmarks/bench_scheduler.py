@@ -0,0 +1,71 @@
+"""Exercise the request scheduler against a fake service that returns quota errors.
+
+Checks that quota errors are retried until every batch succeeds, that the
+token bucket holds the request rate, and that higher-priority requests are
+served first, then prints the scheduler counters.
+
+Run with ``python benchmarks/bench_scheduler.py``.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import FakeKeywordPlanIdeaService, ideas_request
+from share_of_search.aggregation import month_range
+from share_of_search.fetch import fetch_all
+from share_of_search.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+
+
+def run_quota_errors(n_batches, requests_per_second, quota_error_rate):
+    service = FakeKeywordPlanIdeaService(month_range("2024-01", "2024-12"), latency=0.01,
+                                         quota_error_rate=quota_error_rate)
+    scheduler = RequestScheduler(requests_per_second=requests_per_second, burst=1, max_retries=8,
+                                 base_delay=0.05, max_delay=0.5)
+    batches = [[f"keyword {i}"] for i in range(n_batches)]
+
+    start = time.perf_counter()
+    outcomes = fetch_all(
+        batches,
+        lambda batch: scheduler.call(service.generate_keyword_ideas, request=ideas_request(batch)),
+        max_workers=8
+    )
+    elapsed = time.perf_counter() - start
+
+    lost = sum(error is not None for _, _, error in outcomes)
+    achieved_rate = service.calls / elapsed
+    assert achieved_rate <= requests_per_second * 1.2, f"rate {achieved_rate:.1f}/s exceeds the bucket"
+    print(f"{n_batches} batches at {requests_per_second:.0f} req/s with {quota_error_rate:.0%} quota errors: "
+          f"{elapsed:5.2f} s, {achieved_rate:5.1f} req/s, {lost} batches lost, counters {scheduler.stats.as_dict()}")
+    assert lost == 0, f"{lost} batches failed despite retries"
+    assert scheduler.stats.as_dict()["requests"] == service.calls, "every request sent must be counted"
+
+
+def run_priorities():
+    scheduler = RequestScheduler(requests_per_second=20, burst=1)
+    order = []
+
+    def request(name, priority):
+        scheduler.call(lambda: order.append(name), priority=priority)
+
+    # Take the only token so every following request has to queue
+    scheduler.call(lambda: None)
+    threads = [threading.Thread(target=request, args=(f"batch {i}", PRIORITY_BATCH)) for i in range(5)]
+    threads += [threading.Thread(target=request, args=(f"interactive {i}", PRIORITY_INTERACTIVE)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    first_interactive = min(i for i, name in enumerate(order) if name.startswith("interactive"))
+    print(f"service order: {', '.join(order)}")
+    assert first_interactive <= 1, "interactive requests should overtake queued batch requests"
+
+
+if __name__ == "__main__":
+    run_quota_errors(40, 20, 0.0)
+    run_quota_errors(40, 20, 0.3)
+    run_priorities()
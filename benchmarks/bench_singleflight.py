@@ -0,0 +1,56 @@
+"""Measure how many Keyword Planner calls single-flight coalescing saves for concurrent identical reports.
+
+N sessions fetch the same competitor set for the same market at the same time
+against a fake KeywordPlanIdeaService, without a keyword cache, first
+independently and then through one shared SingleFlight. Every session must
+get the same matrix either way.
+
+Run with ``python benchmarks/bench_singleflight.py``.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import FakeGoogleAdsClient, FakeKeywordPlanIdeaService
+from share_of_search.aggregation import month_range
+from share_of_search.keyword_planner import fetch_volume_matrix
+from share_of_search.scheduler import SchedulerStats
+from share_of_search.singleflight import SingleFlight
+
+SETTINGS = {
+    "location": "All Countries", "network": "GOOGLE_SEARCH", "dateFrom": "2024-01", "dateTo": "2024-12",
+    "granularity": "monthly", "maxConcurrentRequests": 4, "backend": "ideas"
+}
+
+
+def run(sessions, n_brands, latency=0.2):
+    brands = [{"name": f"Brand {i}", "keywords": [f"brand {i}", f"brand {i} shop"]} for i in range(n_brands)]
+    for label, single_flight in (("independent", None), ("single-flight", SingleFlight())):
+        service = FakeKeywordPlanIdeaService(month_range("2015-01", "2026-12"), latency=latency)
+        client = FakeGoogleAdsClient(service)
+        stats = SchedulerStats()
+
+        def session(_):
+            matrix, _, errors = fetch_volume_matrix(
+                brands, SETTINGS, client, "1234567890", stats=stats, single_flight=single_flight
+            )
+            assert not errors
+            return matrix
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            matrices = list(executor.map(session, range(sessions)))
+        elapsed = time.perf_counter() - start
+
+        assert all(matrix.equals(matrices[0]) for matrix in matrices), "coalesced sessions must see the same data"
+        print(f"{sessions:>2} sessions x {n_brands:>3} brands | {label:<13} {service.calls:>4} API calls, "
+              f"{stats.as_dict()['coalesced']:>4} coalesced, {elapsed * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    run(2, 10)
+    run(8, 10)
+    run(8, 100)
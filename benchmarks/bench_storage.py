@@ -0,0 +1,121 @@
+"""Compare the memory and export cost of list-of-dict results with the compact categorical results table.
+
+For multi-location monthly reports the same results are held three ways:
+the per-row dicts the app used to keep in session state, a DataFrame with
+string (object) columns, and the compact table to_results_frame returns now.
+Retained size and peak Python heap are measured with tracemalloc; each
+representation is then exported as CSV, and the compact one also as Parquet
+and Arrow IPC.
+
+Run with ``python benchmarks/bench_storage.py``.
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_of_search.aggregation import month_range
+from share_of_search.export import export_results
+from share_of_search.matrix import aggregate_matrix, build_volume_matrix, concat_location_frames, to_results_frame
+
+LOCATIONS = ("Czech Republic", "Slovakia", "Poland")
+
+
+def location_matrices(n_brands, months):
+    rng = random.Random(0)
+    keyword_volumes = {f"brand {i}": {month: rng.randint(1, 10000) for month in months} for i in range(n_brands)}
+    names = [f"Brand number {i}" for i in range(n_brands)]
+    return {
+        location: build_volume_matrix(keyword_volumes, names, [[f"brand {i}"] for i in range(n_brands)], months)
+        for location in LOCATIONS
+    }
+
+
+def list_of_dicts(matrices, colors):
+    rows = []
+    for location, matrix in matrices.items():
+        results = to_results_frame(aggregate_matrix(matrix, "monthly"), colors)
+        rows.extend(
+            {"location": location, "brand": brand, "period": period, "volume": int(volume), "share": float(share),
+             "color": color}
+            for brand, period, volume, share, color in zip(
+                results["brand"].astype(str), results["period"].astype(str), results["volume"], results["share"],
+                results["color"].astype(str)
+            )
+        )
+    return rows
+
+
+def object_frame(matrices, colors):
+    return pd.DataFrame(list_of_dicts(matrices, colors))
+
+
+def compact_frame(matrices, colors):
+    return concat_location_frames({
+        location: to_results_frame(aggregate_matrix(matrix, "monthly"), colors) for location, matrix in matrices.items()
+    })
+
+
+def measure(build, *args):
+    """Return the built value, its retained bytes and the peak Python heap bytes allocated while building it.
+
+    DataFrames are sized with memory_usage(deep=True), since string columns
+    may live in Arrow buffers that tracemalloc does not see.
+    """
+    gc.collect()
+    tracemalloc.start()
+    value = build(*args)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if isinstance(value, pd.DataFrame):
+        retained = int(value.memory_usage(deep=True).sum())
+    return value, retained, peak
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+
+def run(n_brands, n_months):
+    months = month_range("2015-01", "2024-12")[-n_months:]
+    matrices = location_matrices(n_brands, months)
+    colors = [f"#{i % 0xFFFFFF:06x}" for i in range(n_brands)]
+
+    representations = {}
+    for label, build in (("list of dicts", list_of_dicts), ("object DataFrame", object_frame),
+                         ("compact DataFrame", compact_frame)):
+        value, retained, peak = measure(build, matrices, colors)
+        representations[label] = value
+        print(f"{n_brands:>3} brands x {n_months:>3} months x {len(LOCATIONS)} locations | {label:<17} "
+              f"retained {retained / 2**20:7.2f} MiB, peak {peak / 2**20:7.2f} MiB")
+
+    rows = representations["list of dicts"]
+    compact = representations["compact DataFrame"]
+    assert len(rows) == len(compact)
+    assert compact.astype({column: str for column in ("location", "brand", "period", "color")}).equals(
+        representations["object DataFrame"][compact.columns.tolist()]
+    ), "the compact table must hold the same values"
+
+    exports = [
+        ("list of dicts -> CSV", lambda: pd.DataFrame(rows).to_csv(index=False).encode("utf-8")),
+        ("compact -> CSV", lambda: export_results(compact, "csv")),
+        ("compact -> Parquet", lambda: export_results(compact, "parquet")),
+        ("compact -> Arrow IPC", lambda: export_results(compact, "arrow")),
+    ]
+    for label, export in exports:
+        payload, seconds = timed(export)
+        print(f"    {label:<21} {len(payload) / 2**20:7.2f} MiB in {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    run(50, 120)
+    run(200, 120)
+    run(500, 120)
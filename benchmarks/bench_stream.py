@@ -0,0 +1,56 @@
+"""Measure time to first result when batches are streamed as they finish instead of collected at the end.
+
+One batch of the fake KeywordPlanIdeaService is made slow to show that it no
+longer holds back the others, and closing the stream early must stop the
+batches that have not started.
+
+Run with ``python benchmarks/bench_stream.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ads import FakeKeywordPlanIdeaService, ideas_request
+from share_of_search.aggregation import index_keyword_monthly_volumes, month_range
+from share_of_search.fetch import fetch_all, iter_fetch
+from share_of_search.planner import plan_keyword_batches
+
+
+def run(n_batches, latency, slow_latency, max_workers=4):
+    months = month_range("2024-01", "2024-12")
+    batches = plan_keyword_batches([f"brand {i} kw {j}" for i in range(n_batches) for j in range(20)])
+    service = FakeKeywordPlanIdeaService(months, latency=latency)
+
+    def fetch_one(batch):
+        if batch is batches[0]:
+            time.sleep(slow_latency)
+        return index_keyword_monthly_volumes(service.generate_keyword_ideas(request=ideas_request(batch)), batch)
+
+    start = time.perf_counter()
+    fetch_all(batches, fetch_one, max_workers=max_workers)
+    collected = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = None
+    for _ in iter_fetch(batches, fetch_one, max_workers=max_workers):
+        first = first or time.perf_counter() - start
+    streamed = time.perf_counter() - start
+
+    # Cancel after the first result
+    service.calls = 0
+    stream = iter_fetch(batches, fetch_one, max_workers=max_workers)
+    next(stream)
+    stream.close()
+    time.sleep(slow_latency + latency)
+    assert service.calls < n_batches, "closing the stream must cancel the queued batches"
+
+    print(f"{n_batches:>3} batches, one {slow_latency * 1000:.0f} ms slow: first result {first * 1000:7.1f} ms "
+          f"(collected {collected * 1000:7.1f} ms, streamed all {streamed * 1000:7.1f} ms), "
+          f"{service.calls} of {n_batches} batches sent after cancel")
+
+
+if __name__ == "__main__":
+    run(16, 0.1, 1.0)
+    run(32, 0.1, 2.0)
@@ -0,0 +1,51 @@
+"""Measure the cost of the timing spans with tracing off and on, and show a traced aggregation breakdown.
+
+Run with ``python benchmarks/bench_tracing.py``.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_of_search.aggregation import month_range
+from share_of_search.matrix import aggregate_matrix, build_volume_matrix, to_results_frame
+from share_of_search.tracing import Tracer, activate, span
+
+
+def span_overhead(n=200_000):
+    for label, tracer in (("off", None), ("on", Tracer())):
+        with activate(tracer):
+            start = time.perf_counter()
+            for _ in range(n):
+                with span("noop"):
+                    pass
+            elapsed = time.perf_counter() - start
+        print(f"span overhead with tracing {label:<3}: {elapsed / n * 1e6:6.2f} us per span")
+
+
+def traced_report(n_brands=100, n_months=120):
+    months = month_range("2015-01", "2024-12")[:n_months]
+    rng = random.Random(0)
+    keyword_volumes = {f"brand {i}": {month: rng.randint(0, 10000) for month in months} for i in range(n_brands)}
+    names = [f"Brand {i}" for i in range(n_brands)]
+
+    tracer = Tracer()
+    with activate(tracer), span("report", brands=n_brands, months=n_months):
+        matrix = build_volume_matrix(keyword_volumes, names, [[f"brand {i}"] for i in range(n_brands)], months)
+        for granularity in ("monthly", "quarterly", "yearly"):
+            to_results_frame(aggregate_matrix(matrix, granularity), ["#000000"] * n_brands)
+
+    for row in tracer.summary():
+        print(f"  {row['span']:<18} {row['count']:>3} x {row['meanMs']:8.3f} ms = {row['totalMs']:8.3f} ms")
+    otel = tracer.to_otel()
+    spans = otel["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert all(record["parentSpanId"] for record in spans if record["name"] != "report"), "spans must nest under the report"
+    assert json.loads(json.dumps(otel)) == otel
+
+
+if __name__ == "__main__":
+    span_overhead()
+    traced_report()
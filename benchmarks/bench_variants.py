@@ -0,0 +1,152 @@
+"""Compare brand variant matching through the VariantIndex with a per-brand scan of every idea.
+
+Synthetic Czech-looking brands get diacritic variants, names split in two,
+misspellings and brand + product ideas mixed into many unrelated ideas, as a keyword ideas
+response of a whole report would contain them. The per-brand scan folds each
+idea and compares it token by token with every term of every brand; it is
+timed on a sample and must find exactly the matches of the index.
+
+Run with ``python benchmarks/bench_variants.py``.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_of_search.aggregation import month_range
+from share_of_search.fuzzy import edit_distance, fold_text, max_edits
+from share_of_search.planner import brand_keywords
+from share_of_search.variants import (
+    BRAND_WITH_WORDS, MISSPELLING, MISSPELLING_WITH_WORDS, SPELLING_VARIANT, VariantIndex, match_variants,
+    split_forms
+)
+
+SYLLABLES = ["ko", "fo", "la", "še", "ří", "va", "ne", "to", "mi", "da", "ru", "bě", "lo", "čo", "ka", "žu", "pe", "sy"]
+# Unrelated ideas are built from other syllables, so they only match a brand when the index is wrong
+OTHER_SYLLABLES = ["ab", "ex", "ur", "ig", "om", "hu", "wy", "el", "an", "is", "op", "qu"]
+WORDS = ["cena", "eshop", "recenze", "akce", "praha", "brno", "otevírací doba", "kontakt", "bazar", "sleva", "nový"]
+LETTERS = "abcdefghijklmnoprstuvyz"
+
+
+def make_brands(n_brands, rng):
+    brands, names = [], set()
+    while len(brands) < n_brands:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice([3, 3, 4])))
+        if rng.random() < 0.2:
+            name += " " + "".join(rng.choice(SYLLABLES) for _ in range(2))
+        if fold_text(name) in names:
+            continue
+        names.add(fold_text(name))
+        brands.append({"name": name.title(), "keywords": [name, f"{name} {rng.choice(WORDS)}"]})
+    return brands
+
+
+def misspell(text, rng):
+    position = rng.randrange(1, len(text) - 1)
+    edit = rng.choice(["drop", "swap", "replace", "insert"])
+    if edit == "drop":
+        return text[:position] + text[position + 1:]
+    if edit == "swap":
+        return text[:position - 1] + text[position] + text[position - 1] + text[position + 1:]
+    if edit == "replace":
+        return text[:position] + rng.choice(LETTERS) + text[position + 1:]
+    return text[:position] + rng.choice(LETTERS) + text[position:]
+
+
+def make_ideas(brands, n_ideas, rng, variant_share=0.2):
+    """Return ``n_ideas`` distinct idea texts, about ``variant_share`` of them variants of the brands."""
+    ideas = set()
+    while len(ideas) < n_ideas:
+        if rng.random() < variant_share:
+            name = rng.choice(brands)["name"].lower()
+            split = rng.randrange(2, len(name) - 1)
+            ideas.add(rng.choice([
+                fold_text(name),
+                f"{name[:split]} {name[split:]}",
+                misspell(name, rng),
+                f"{name} {rng.choice(WORDS)}",
+                f"{rng.choice(WORDS)} {misspell(name, rng)}",
+            ]))
+        else:
+            words = [rng.choice(WORDS)] + ["".join(rng.choice(OTHER_SYLLABLES) for _ in range(rng.choice([2, 3, 4])))]
+            rng.shuffle(words)
+            ideas.add(" ".join(words))
+    return sorted(ideas)
+
+
+def term_forms(brands):
+    """Return the term forms of every brand and the tokens that tolerate edits, as VariantIndex builds them."""
+    forms, fuzzy_tokens = [], set()
+    for brand in brands:
+        brand_forms = set()
+        for term_text in [brand["name"], *brand_keywords(brand)]:
+            term = tuple(fold_text(term_text).split())
+            written = {term, ("".join(term),)} if len(term) > 1 else {term}
+            fuzzy_tokens.update(token for form in written for token in form)
+            brand_forms |= written | {split for form in written for split in split_forms(form)}
+        forms.append(brand_forms)
+    return forms, fuzzy_tokens
+
+
+def scan_match(brands, text, forms=None):
+    """Match ``text`` by comparing it with every term of every brand in turn."""
+    forms, fuzzy_tokens = forms or term_forms(brands)
+    tokens = fold_text(text).split()
+    best = {}
+    for index, brand_forms in enumerate(forms):
+        for candidate in brand_forms:
+            for start in range(len(tokens) - len(candidate) + 1):
+                edits = 0
+                for offset, brand_token in enumerate(candidate):
+                    limit = max_edits(brand_token) if brand_token in fuzzy_tokens else 0
+                    token_edits = edit_distance(tokens[start + offset], brand_token, limit)
+                    if token_edits > limit:
+                        break
+                    edits += token_edits
+                else:
+                    rank = (len(tokens) - len(candidate), edits)
+                    if index not in best or rank < best[index]:
+                        best[index] = rank
+    if len(best) != 1:
+        return None
+    (index, (extra_words, edits)), = best.items()
+    if extra_words:
+        return index, MISSPELLING_WITH_WORDS if edits else BRAND_WITH_WORDS
+    return index, MISSPELLING if edits else SPELLING_VARIANT
+
+
+def run(n_brands=50, n_ideas=50000, sample=2000, seed=0):
+    rng = random.Random(seed)
+    brands = make_brands(n_brands, rng)
+    ideas = make_ideas(brands, n_ideas, rng)
+    months = month_range("2024-01", "2024-12")
+    print(f"{n_ideas} ideas, {n_brands} brands")
+
+    start = time.perf_counter()
+    index = VariantIndex(brands)
+    matches = {text: index.match(text) for text in ideas}
+    indexed = time.perf_counter() - start
+    found = sum(match is not None for match in matches.values())
+    print(f"  variant index    {indexed * 1000:9.1f} ms, {found} variants")
+
+    sampled = rng.sample(ideas, sample)
+    start = time.perf_counter()
+    forms = term_forms(brands)
+    scanned = {text: scan_match(brands, text, forms) for text in sampled}
+    per_idea = (time.perf_counter() - start) / sample
+    assert scanned == {text: matches[text] for text in sampled}, "the index must find the matches of the scan"
+    print(f"  per-brand scan   {per_idea * n_ideas * 1000:9.1f} ms (extrapolated from {sample} ideas), "
+          f"{per_idea * n_ideas / indexed:5.1f}x slower")
+
+    volumes = {text: {month: rng.randint(0, 1000) for month in months} for text in ideas}
+    start = time.perf_counter()
+    variants = match_variants(brands, volumes, months)
+    print(f"  match_variants   {(time.perf_counter() - start) * 1000:9.1f} ms, "
+          + ", ".join(f"{count} {kind}" for kind, count in variants["match"].value_counts().items()))
+
+
+if __name__ == "__main__":
+    run(n_ideas=10000)
+    run(n_ideas=50000)
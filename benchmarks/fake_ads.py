@@ -0,0 +1,265 @@
+"""Offline stand-ins for the Keyword Planner responses, service and client used by the benchmarks.
+
+Besides the synthetic FakeKeywordPlanIdeaService, RecordingGoogleAdsClient
+saves the responses of a real client to a directory (one JSON file per
+request) and ReplayKeywordPlanIdeaService serves them back, so a benchmark
+can run on real response shapes and sizes without credentials.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+def synthetic_response(n_ideas, months, seed_keywords, seed=0):
+    """Build a keyword ideas response shaped like the proto-plus GenerateKeywordIdeaResult."""
+    rng = random.Random(seed)
+    texts = list(seed_keywords) + [f"idea {i}" for i in range(n_ideas - len(seed_keywords))]
+    return [
+        SimpleNamespace(
+            text=text,
+            keyword_idea_metrics=SimpleNamespace(
+                monthly_search_volumes=[
+                    # MonthOfYearEnum values are the calendar month + 1
+                    SimpleNamespace(year=year, month=SimpleNamespace(value=month + 1), monthly_searches=rng.randint(0, 10000))
+                    for year, month in months
+                ]
+            ),
+        )
+        for text in texts
+    ]
+
+
+def historical_metrics_response(months, keywords, seed=0):
+    """Build a response shaped like GenerateKeywordHistoricalMetricsResponse for exactly ``keywords``."""
+    rng = random.Random(seed)
+    return SimpleNamespace(results=[
+        SimpleNamespace(
+            text=text,
+            close_variants=[],
+            keyword_metrics=SimpleNamespace(
+                monthly_search_volumes=[
+                    SimpleNamespace(year=year, month=SimpleNamespace(value=month + 1), monthly_searches=rng.randint(0, 10000))
+                    for year, month in months
+                ]
+            ),
+        )
+        for text in keywords
+    ])
+
+
+def to_wire(response):
+    """Serialise a fake response to JSON bytes as a stand-in for the API payload."""
+    return json.dumps(response, default=vars, separators=(",", ":")).encode()
+
+
+def from_wire(payload):
+    """Decode a payload from ``to_wire`` back into attribute-style message objects."""
+    return json.loads(payload, object_hook=lambda fields: SimpleNamespace(**fields))
+
+
+class FakeAdsError(Exception):
+    """Raised by the fake service in place of a GoogleAdsException; ``code`` mimics the gRPC status name."""
+
+    def __init__(self, message, code="INVALID_ARGUMENT"):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeKeywordPlanIdeaService:
+    """KeywordPlanIdeaService replacement that sleeps for ``latency`` seconds per call.
+
+    Requests containing one of ``failing_keywords`` always fail with a
+    permanent error; any request fails with RESOURCE_EXHAUSTED with
+    probability ``quota_error_rate``.
+    """
+
+    def __init__(self, months, latency=0.0, ideas_per_request=200, failing_keywords=(), quota_error_rate=0.0, seed=0):
+        self.months = months
+        self.latency = latency
+        self.ideas_per_request = ideas_per_request
+        self.failing_keywords = set(failing_keywords)
+        self.quota_error_rate = quota_error_rate
+        self.calls = 0
+        self.quota_errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, keywords):
+        with self._lock:
+            self.calls += 1
+            quota_error = self._rng.random() < self.quota_error_rate
+            self.quota_errors += quota_error
+        time.sleep(self.latency)
+        if quota_error:
+            raise FakeAdsError(f"RESOURCE_EXHAUSTED for {keywords}", code="RESOURCE_EXHAUSTED")
+        if self.failing_keywords.intersection(keywords):
+            raise FakeAdsError(f"INVALID_ARGUMENT for {keywords}")
+
+    def generate_keyword_ideas(self, request):
+        keywords = list(request.keyword_seed.keywords)
+        self._call(keywords)
+        return synthetic_response(max(self.ideas_per_request, len(keywords)), self.months, keywords)
+
+    def generate_keyword_historical_metrics(self, request):
+        keywords = list(request.keywords)
+        self._call(keywords)
+        return historical_metrics_response(self.months, keywords)
+
+
+def plain_response(endpoint, response):
+    """Copy the fields the fetch path reads from a (proto-plus or fake) response into plain lists and dicts."""
+    def monthly(metrics):
+        return {"monthly_search_volumes": [
+            {"year": int(volume.year), "month": {"value": int(volume.month.value)},
+             "monthly_searches": int(volume.monthly_searches)}
+            for volume in metrics.monthly_search_volumes
+        ]}
+
+    if endpoint == "historical":
+        return {"results": [
+            {"text": result.text, "close_variants": list(result.close_variants),
+             "keyword_metrics": monthly(result.keyword_metrics)}
+            for result in response.results
+        ]}
+    # Iterating a keyword ideas pager fetches all of its pages
+    return [{"text": result.text, "keyword_idea_metrics": monthly(result.keyword_idea_metrics)} for result in response]
+
+
+def request_fingerprint(endpoint, request):
+    """Identify a request by endpoint, keywords, geo targets, network and month range (not the customer)."""
+    keywords = request.keywords if endpoint == "historical" else request.keyword_seed.keywords
+    year_month_range = request.historical_metrics_options.year_month_range
+    fields = [
+        endpoint,
+        sorted(keywords),
+        list(request.geo_target_constants),
+        int(request.keyword_plan_network),
+        [int(year_month_range.start.year), int(year_month_range.start.month)],
+        [int(year_month_range.end.year), int(year_month_range.end.month)],
+    ]
+    return hashlib.sha1(json.dumps(fields).encode()).hexdigest()
+
+
+class RecordingKeywordPlanIdeaService:
+    """Pass requests on to a real KeywordPlanIdeaService and save each response to ``directory``."""
+
+    def __init__(self, service, directory):
+        self.service = service
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _record(self, endpoint, request, response):
+        plain = plain_response(endpoint, response)
+        keywords = request.keywords if endpoint == "historical" else request.keyword_seed.keywords
+        path = os.path.join(self.directory, f"{request_fingerprint(endpoint, request)}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"endpoint": endpoint, "keywords": list(keywords), "response": plain}, f)
+        # Return the recorded copy so the caller sees exactly what a replay will
+        return from_wire(json.dumps(plain))
+
+    def generate_keyword_ideas(self, request):
+        return self._record("ideas", request, self.service.generate_keyword_ideas(request=request))
+
+    def generate_keyword_historical_metrics(self, request):
+        return self._record("historical", request, self.service.generate_keyword_historical_metrics(request=request))
+
+
+class RecordingGoogleAdsClient:
+    """GoogleAdsClient wrapper whose KeywordPlanIdeaService records its responses to ``directory``."""
+
+    def __init__(self, client, directory):
+        self.client = client
+        self.directory = directory
+
+    def get_service(self, name, *args, **kwargs):
+        service = self.client.get_service(name, *args, **kwargs)
+        if name == "KeywordPlanIdeaService":
+            return RecordingKeywordPlanIdeaService(service, self.directory)
+        return service
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class ReplayKeywordPlanIdeaService:
+    """KeywordPlanIdeaService replacement that answers from a directory written by RecordingGoogleAdsClient.
+
+    Responses are kept as JSON bytes and decoded on every call, like a
+    payload coming off the wire; each call sleeps ``latency`` seconds first.
+    A request that was not recorded fails with NOT_FOUND.
+    """
+
+    def __init__(self, directory, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._payloads = {}
+        for filename in os.listdir(directory):
+            if filename.endswith(".json") and filename != "jobs.json":
+                with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                    recorded = json.load(f)
+                self._payloads[filename[:-len(".json")]] = json.dumps(recorded["response"]).encode()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def _replay(self, endpoint, request):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        payload = self._payloads.get(request_fingerprint(endpoint, request))
+        if payload is None:
+            raise FakeAdsError(f"NOT_FOUND: no recorded {endpoint} response for this request", code="NOT_FOUND")
+        return from_wire(payload)
+
+    def generate_keyword_ideas(self, request):
+        return self._replay("ideas", request)
+
+    def generate_keyword_historical_metrics(self, request):
+        return self._replay("historical", request)
+
+
+class FakeGoogleAdsClient:
+    """Just enough of GoogleAdsClient for fetch_keyword_monthly_volumes, serving requests from ``service``."""
+
+    def __init__(self, service):
+        self.service = service
+        self.enums = SimpleNamespace(
+            KeywordPlanNetworkEnum=SimpleNamespace(GOOGLE_SEARCH=2, GOOGLE_SEARCH_AND_PARTNERS=3),
+            MonthOfYearEnum={name: number + 2 for number, name in enumerate(
+                ["JANUARY", "FEBRUARY", "MARCH", "APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPTEMBER", "OCTOBER",
+                 "NOVEMBER", "DECEMBER"]
+            )}
+        )
+
+    def get_service(self, name):
+        if name == "GoogleAdsService":
+            return SimpleNamespace(geo_target_constant_path=lambda geo_id: f"geoTargetConstants/{geo_id}")
+        return self.service
+
+    def get_type(self, name):
+        month = lambda: SimpleNamespace(year=0, month=0)
+        return SimpleNamespace(
+            keyword_seed=SimpleNamespace(keywords=[]), keywords=[], customer_id=None, keyword_plan_network=0,
+            geo_target_constants=[],
+            historical_metrics_options=SimpleNamespace(year_month_range=SimpleNamespace(start=month(), end=month()))
+        )
+
+
+def fake_google_ads_client(months, latency=0.0, ideas_per_request=200):
+    """Build a FakeGoogleAdsClient over a new FakeKeywordPlanIdeaService; picklable as a worker process client factory."""
+    return FakeGoogleAdsClient(FakeKeywordPlanIdeaService(months, latency=latency, ideas_per_request=ideas_per_request))
+
+
+def ideas_request(keywords):
+    """Build the subset of GenerateKeywordIdeasRequest the fake service reads."""
+    return SimpleNamespace(keyword_seed=SimpleNamespace(keywords=list(keywords)))
+
+
+def historical_metrics_request(keywords):
+    """Build the subset of GenerateKeywordHistoricalMetricsRequest the fake service reads."""
+    return SimpleNamespace(keywords=list(keywords))
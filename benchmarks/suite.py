@@ -0,0 +1,281 @@
+"""Offline benchmark suite for the fetch, aggregation and chart rendering stages of a report.
+
+Every scenario runs the real pipeline against a fake Keyword Planner backend,
+so no credentials are needed:
+
+* fetch: fetch_location_matrices, from request building through response
+  indexing to the brand x month matrix of every location
+* aggregate: aggregate_matrix and to_results_frame per location, stacked
+  with concat_location_frames when there are several
+* render: the share chart figure (charts.share_chart_figure, with its
+  default brand limit) and its JSON payload, which is what Streamlit sends
+  to the browser
+
+The synthetic grid covers 1-500 brands, 1-120 months, one and three
+locations and all three granularities. With ``--replay`` the suite runs the
+jobs of a directory written by ``record`` instead, on the recorded responses.
+
+Each run is stored as ``benchmarks/results/<label>.json`` (the label
+defaults to the current commit), with the best of ``--repeat`` timings per
+benchmark, and ``compare`` lists the benchmarks that got slower between two
+stored runs. Timings depend on the machine, so results are not committed;
+record the baseline on the machine that runs the comparison.
+
+Usage::
+
+    python benchmarks/suite.py run [--quick] [--latency 0.05] [--label NAME]
+    python benchmarks/suite.py record jobs.yaml --secrets secrets.toml --directory benchmarks/recordings/client-a
+    python benchmarks/suite.py run --replay benchmarks/recordings/client-a
+    python benchmarks/suite.py compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_ads import (
+    FakeGoogleAdsClient, FakeKeywordPlanIdeaService, RecordingGoogleAdsClient, ReplayKeywordPlanIdeaService
+)
+from share_of_search.aggregation import month_range
+from share_of_search.charts import share_chart_figure
+from share_of_search.keyword_planner import fetch_location_matrices
+from share_of_search.matrix import aggregate_matrix, concat_location_frames, to_results_frame
+from share_of_search.scheduler import RequestScheduler
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+CUSTOMER_ID = "1234567890"
+
+BRAND_COUNTS = (1, 10, 100, 500)
+MONTH_COUNTS = (1, 12, 60, 120)
+LOCATION_SETS = (("Czech Republic",), ("Czech Republic", "Slovakia", "Poland"))
+GRANULARITIES = ("monthly", "quarterly", "yearly")
+QUICK_BRAND_COUNTS = (10, 100)
+QUICK_MONTH_COUNTS = (12, 60)
+
+# Benchmarks faster than this are too noisy to flag
+NOISE_FLOOR_SECONDS = 0.002
+PALETTE = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f")
+
+
+def best_of(repeat, fn):
+    """Return the fastest of ``repeat`` runs of ``fn`` in seconds and the last run's result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def share_chart_json(results, brand_colors):
+    """Build the app's share chart and serialise it as Streamlit does."""
+    return share_chart_figure(results, brand_colors).to_json()
+
+
+def synthetic_scenarios(quick=False):
+    """Yield (name, brands, settings, locations) for the synthetic grid."""
+    months = month_range("2015-01", "2024-12")
+    for n_brands in QUICK_BRAND_COUNTS if quick else BRAND_COUNTS:
+        brands = [
+            {"name": f"Brand {i}", "keywords": [f"brand {i}", f"brand {i} shop"], "color": PALETTE[i % len(PALETTE)]}
+            for i in range(n_brands)
+        ]
+        for n_months in QUICK_MONTH_COUNTS if quick else MONTH_COUNTS:
+            (first_year, first_month), (last_year, last_month) = months[-n_months], months[-1]
+            settings = {
+                "network": "GOOGLE_SEARCH",
+                "dateFrom": f"{first_year:04d}-{first_month:02d}",
+                "dateTo": f"{last_year:04d}-{last_month:02d}",
+                "maxConcurrentRequests": 4,
+                "backend": "ideas"
+            }
+            for locations in LOCATION_SETS:
+                yield f"brands={n_brands}/months={n_months}/geos={len(locations)}", brands, settings, locations
+
+
+def run_scenario(name, brands, settings, locations, client, repeat, requests_per_second):
+    """Time the three stages of one scenario and return {benchmark name: record}."""
+    records = {}
+
+    def fetch():
+        scheduler = RequestScheduler(
+            requests_per_second=requests_per_second, max_concurrent=settings.get("maxConcurrentRequests", 4)
+        )
+        return fetch_location_matrices(
+            brands, {**settings, "location": locations[0]}, locations, client, CUSTOMER_ID, scheduler=scheduler
+        )
+
+    seconds, (matrices, errors) = best_of(repeat, fetch)
+    if errors:
+        raise RuntimeError(f"{name}: {errors[0].message}")
+    records[f"fetch/{name}"] = {"seconds": seconds}
+
+    brand_colors = {brand["name"]: brand.get("color", PALETTE[0]) for brand in brands}
+    for granularity in GRANULARITIES:
+        def aggregate():
+            frames = {
+                location: to_results_frame(aggregate_matrix(matrix, granularity), colors)
+                for location, (matrix, colors) in matrices.items()
+            }
+            return concat_location_frames(frames) if len(locations) > 1 else frames[locations[0]]
+
+        seconds, results = best_of(repeat, aggregate)
+        records[f"aggregate/{name}/granularity={granularity}"] = {"seconds": seconds, "rows": len(results)}
+        seconds, payload = best_of(repeat, lambda: share_chart_json(results, brand_colors))
+        records[f"render/{name}/granularity={granularity}"] = {"seconds": seconds, "payloadBytes": len(payload)}
+    return records
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    if args.replay:
+        service = ReplayKeywordPlanIdeaService(args.replay, latency=args.latency)
+        with open(os.path.join(args.replay, "jobs.json"), encoding="utf-8") as f:
+            scenarios = [(job["name"], job["brands"], job["settings"], job["locations"]) for job in json.load(f)]
+        clients = {name: FakeGoogleAdsClient(service) for name, *_ in scenarios}
+        backend = {"backend": "replay", "directory": args.replay, "responses": len(service)}
+    else:
+        scenarios = list(synthetic_scenarios(args.quick))
+        clients = {}
+        for name, _, settings, _ in scenarios:
+            months = month_range(settings["dateFrom"], settings["dateTo"])
+            clients[name] = FakeGoogleAdsClient(FakeKeywordPlanIdeaService(
+                months, latency=args.latency, ideas_per_request=args.ideas_per_request
+            ))
+        backend = {"backend": "synthetic", "ideasPerRequest": args.ideas_per_request}
+
+    commit = current_commit()
+    label = args.label or commit or datetime.now().strftime("%Y%m%d-%H%M%S")
+    benchmarks = {}
+    for name, brands, settings, locations in scenarios:
+        records = run_scenario(name, brands, settings, locations, clients[name], args.repeat, args.requests_per_second)
+        benchmarks.update(records)
+        for key, record in records.items():
+            print(f"{key:<60} {record['seconds'] * 1000:10.2f} ms")
+
+    report = {
+        "label": label,
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "config": {
+            **backend, "latency": args.latency, "requestsPerSecond": args.requests_per_second, "repeat": args.repeat,
+            "quick": args.quick
+        },
+        "benchmarks": benchmarks,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(benchmarks)} benchmarks written to {path}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        new = json.load(f)
+    if old["machine"] != new["machine"]:
+        print("warning: the runs come from different machines; timings are not directly comparable")
+    if old["config"] != new["config"]:
+        print("warning: the runs used different suite options; timings are not directly comparable")
+
+    rows = []
+    for key in sorted(old["benchmarks"].keys() & new["benchmarks"].keys()):
+        before, after = old["benchmarks"][key]["seconds"], new["benchmarks"][key]["seconds"]
+        rows.append((after / before if before else float("inf"), key, before, after))
+
+    regressions = [
+        row for row in rows if row[0] >= args.threshold and row[3] - row[2] >= NOISE_FLOOR_SECONDS
+    ]
+    improvements = [row for row in rows if row[0] <= 1 / args.threshold and row[2] - row[3] >= NOISE_FLOOR_SECONDS]
+    for title, selected in (("Slower", regressions), ("Faster", improvements)):
+        if selected:
+            print(f"{title} ({len(selected)}):")
+            for ratio, key, before, after in sorted(selected, reverse=title == "Slower"):
+                print(f"  {key:<60} {before * 1000:10.2f} -> {after * 1000:10.2f} ms  x{ratio:.2f}")
+    print(f"{len(rows)} benchmarks compared ({old['label']} -> {new['label']}), "
+          f"{len(regressions)} slower and {len(improvements)} faster by x{args.threshold} or more")
+    return 1 if regressions else 0
+
+
+def record(args):
+    from share_of_search.batch import expand_jobs, load_job_file, load_secrets
+    from share_of_search.keyword_planner import load_google_ads_client
+
+    jobs = expand_jobs(load_job_file(args.job_file))
+    secrets = load_secrets(args.secrets)
+    client = RecordingGoogleAdsClient(load_google_ads_client(secrets), args.directory)
+    recorded = []
+    for job in jobs:
+        locations = job["settings"].get("locations") or [job["settings"]["location"]]
+        _, errors = fetch_location_matrices(
+            job["brands"], job["settings"], locations, client, secrets["GOOGLE_CUSTOMER_ID"]
+        )
+        for error in errors:
+            print(f"{job['name']}: {error.message}")
+        recorded.append({"name": job["name"], "brands": job["brands"], "settings": job["settings"], "locations": locations})
+    with open(os.path.join(args.directory, "jobs.json"), "w", encoding="utf-8") as f:
+        json.dump(recorded, f, indent=2)
+    print(f"Recorded {len(recorded)} jobs to {args.directory}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of fetch, aggregation and rendering.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and store its results")
+    run_parser.add_argument("--quick", action="store_true", help="run a small subset of the synthetic grid")
+    run_parser.add_argument("--replay", help="run the recorded jobs of this directory instead of the synthetic grid")
+    run_parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake service sleeps per request")
+    run_parser.add_argument("--requests-per-second", type=float, default=1e6,
+                            help="scheduler rate limit; the default leaves requests unthrottled")
+    run_parser.add_argument("--ideas-per-request", type=int, default=20,
+                            help="ideas in each synthetic response (at least the seed keywords)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest is kept")
+    run_parser.add_argument("--label", help="name of the stored result (default: the current commit)")
+    run_parser.add_argument("--output-dir", default=RESULTS_DIR, help="directory of the stored results")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="list benchmarks that changed between two stored runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=1.25,
+                                help="slowdown ratio that counts as a regression")
+    compare_parser.set_defaults(handler=compare)
+
+    record_parser = commands.add_parser("record", help="record the Keyword Planner responses of a job file")
+    record_parser.add_argument("job_file", help="JSON or YAML job file, as for share_of_search.batch")
+    record_parser.add_argument("--secrets", help="secrets.toml with the GOOGLE_* credentials (default: environment)")
+    record_parser.add_argument("--directory", required=True, help="directory for the recorded responses")
+    record_parser.set_defaults(handler=record)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
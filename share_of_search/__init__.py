@@ -0,0 +1,35 @@
+"""Streamlit-independent building blocks of the Share of Brand Search Tool.
+
+The public entry points are importable from the package root; they are
+resolved on first access so that ``import share_of_search`` stays cheap.
+"""
+import importlib
+
+_EXPORTS = {
+    "build_periods": "share_of_search.aggregation",
+    "month_range": "share_of_search.aggregation",
+    "normalize_keyword": "share_of_search.aggregation",
+    "KeywordMetricsCache": "share_of_search.cache",
+    "FetchError": "share_of_search.errors",
+    "export_results": "share_of_search.export",
+    "refresh_search_volumes": "share_of_search.incremental",
+    "COUNTRY_MAPPING": "share_of_search.geo",
+    "GeoTargetIndex": "share_of_search.geo",
+    "fetch_volume_matrix": "share_of_search.keyword_planner",
+    "fetch_location_matrices": "share_of_search.keyword_planner",
+    "get_search_volumes": "share_of_search.keyword_planner",
+    "get_search_volumes_by_location": "share_of_search.keyword_planner",
+    "load_google_ads_client": "share_of_search.keyword_planner",
+    "stream_brand_volumes": "share_of_search.keyword_planner",
+    "aggregate_matrix": "share_of_search.matrix",
+    "compact_results": "share_of_search.matrix",
+    "to_results_frame": "share_of_search.matrix",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'share_of_search' has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -0,0 +1,95 @@
+"""Bucketing of Keyword Planner responses into monthly, quarterly and yearly periods."""
+from datetime import datetime
+
+
+def normalize_keyword(keyword):
+    """Return the form keywords are matched, cached and requested in: lower-cased with single spaces."""
+    return " ".join(keyword.lower().split())
+
+
+def month_range(date_from, date_to):
+    """Return every (year, month) pair between two "YYYY-MM" strings, inclusive."""
+    start = datetime.strptime(date_from, "%Y-%m")
+    end = datetime.strptime(date_to, "%Y-%m")
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        month += 1
+        if month > 12:
+            month = 1
+            year += 1
+    return months
+
+
+def period_label(year, month, granularity):
+    """Return the period label a calendar month falls into for the given granularity."""
+    if granularity == "monthly":
+        return f"{year}-{month:02d}"
+    if granularity == "quarterly":
+        return f"{year}-Q{(month - 1) // 3 + 1}"
+    return str(year)
+
+
+def build_periods(date_from, date_to, granularity):
+    """Group the months of the selected range into ordered (label, months) periods.
+
+    Incomplete quarters and years at either end of the range are kept and only
+    contain the months that fall inside the range.
+    """
+    periods = []
+    for year, month in month_range(date_from, date_to):
+        label = period_label(year, month, granularity)
+        if not periods or periods[-1][0] != label:
+            periods.append((label, []))
+        periods[-1][1].append((year, month))
+    return periods
+
+
+def index_keyword_monthly_volumes(response, keywords):
+    """Walk a keyword ideas response once into a keyword -> {(year, month): volume} table.
+
+    Keys are the normalised seed keywords; ideas that are not seeds are
+    skipped, unless ``keywords`` is None, which keeps every idea.
+    """
+    keyword_set = None if keywords is None else {normalize_keyword(k) for k in keywords}
+    keyword_volumes = {}
+    for result in response:
+        text = normalize_keyword(result.text)
+        if keyword_set is not None and text not in keyword_set:
+            continue
+        monthly_volumes = keyword_volumes.setdefault(text, {})
+        for monthly_search_volume in result.keyword_idea_metrics.monthly_search_volumes:
+            key = (monthly_search_volume.year, monthly_search_volume.month.value - 1)
+            monthly_volumes[key] = monthly_volumes.get(key, 0) + monthly_search_volume.monthly_searches
+    return keyword_volumes
+
+
+def index_historical_metrics(response, keywords):
+    """Index a GenerateKeywordHistoricalMetrics response into a keyword -> {(year, month): volume} table.
+
+    The API merges close variants of the requested keywords into one result,
+    so each result is attributed once: to its text, or to the first requested
+    close variant when the text itself was not requested.
+    """
+    keyword_set = {normalize_keyword(k) for k in keywords}
+    keyword_volumes = {}
+    for result in response.results:
+        candidates = [normalize_keyword(result.text)] + [normalize_keyword(v) for v in result.close_variants]
+        keyword = next((k for k in candidates if k in keyword_set), None)
+        if keyword is None:
+            continue
+        monthly_volumes = keyword_volumes.setdefault(keyword, {})
+        for monthly_search_volume in result.keyword_metrics.monthly_search_volumes:
+            key = (monthly_search_volume.year, monthly_search_volume.month.value - 1)
+            monthly_volumes[key] = monthly_volumes.get(key, 0) + monthly_search_volume.monthly_searches
+    return keyword_volumes
+
+
+def sum_keyword_volumes(keyword_volumes, keywords):
+    """Add up the monthly tables of ``keywords`` into one (year, month) -> volume table."""
+    monthly_volumes = {}
+    for keyword in {normalize_keyword(k) for k in keywords}:
+        for key, volume in keyword_volumes.get(keyword, {}).items():
+            monthly_volumes[key] = monthly_volumes.get(key, 0) + volume
+    return monthly_volumes
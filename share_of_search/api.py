@@ -0,0 +1,472 @@
+"""Async JSON API that serves share-of-search reports to the React frontend.
+
+``POST /api/search-volumes`` takes the frontend's ``{"brands": [...],
+"settings": {...}}`` (the Brand and SearchSettings types of
+src/pages/Index.tsx) and answers ``{"results": [...], "errors": [...]}``,
+where every result has the SearchResult shape (brand, period, volume, share,
+color, plus location when ``compareLocations`` adds markets) and every error
+is a FetchError record.
+
+One process serves every user, so work is shared rather than repeated per
+session:
+
+- Finished reports are kept in an LRU response cache (``cache_ttl``
+  seconds) keyed by a hash of the normalised request. Each carries an ETag of
+  its body; a request whose If-None-Match matches gets an empty 304.
+- Identical reports requested while one is being computed await that
+  computation instead of starting their own.
+- Reports are computed on a bounded thread pool, and the keyword requests of
+  all of them go through one RequestScheduler, SingleFlight and keyword
+  cache. When ``max_pending`` reports are already being computed, new ones
+  are turned away with 503 and Retry-After.
+
+Reports with failed requests are returned but not cached. The caches live in
+the process, so run a single server process. Needs starlette and uvicorn,
+which Streamlit already depends on.
+
+Usage::
+
+    python -m share_of_search.api --port 8000 --secrets .streamlit/secrets.toml
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from share_of_search.cache import KeywordMetricsCache
+from share_of_search.fetch import DEFAULT_MAX_WORKERS
+from share_of_search.geo import COUNTRY_MAPPING, default_geo_index, is_known_location
+from share_of_search.keyword_planner import get_search_volumes, get_search_volumes_by_location, load_google_ads_client
+from share_of_search.pool import DEFAULT_POOL_SIZE, PooledGoogleAdsClient
+from share_of_search.scheduler import DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, RequestScheduler
+from share_of_search.singleflight import SingleFlight
+from share_of_search.stats import Counters
+from share_of_search.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Reports kept in the response cache, and for how many seconds
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 900
+
+# Reports computed at the same time, and how many may be in progress before new ones are refused
+DEFAULT_REPORT_WORKERS = 4
+DEFAULT_MAX_PENDING = 64
+
+# Brands accepted in one request
+MAX_BRANDS = 500
+
+# Most targets one location search returns
+MAX_LOCATION_RESULTS = 50
+
+# The Vite dev server of the React app
+DEFAULT_ALLOWED_ORIGINS = ("http://localhost:8080",)
+
+# Frontend network values -> Keyword Planner networks. Keyword Planner has no partners-only
+# network, so both partner options include Google Search; the app's own values pass through.
+NETWORKS = {
+    "google": "GOOGLE_SEARCH",
+    "google_search_partners": "GOOGLE_SEARCH_AND_PARTNERS",
+    "both": "GOOGLE_SEARCH_AND_PARTNERS",
+    "GOOGLE_SEARCH": "GOOGLE_SEARCH",
+    "GOOGLE_SEARCH_AND_PARTNERS": "GOOGLE_SEARCH_AND_PARTNERS",
+}
+GRANULARITIES = ("monthly", "quarterly", "yearly")
+BACKENDS = ("ideas", "historical")
+
+# "YYYY-MM" or "YYYY-MM-DD"; only the month is used
+_DATE = re.compile(r"^(\d{4})-(\d{2})(?:-\d{2})?$")
+
+
+class ApiStats(Counters):
+    """Thread-safe counters of the report requests the API answered."""
+
+    FIELDS = ("requests", "cache_hits", "coalesced", "computed", "not_modified", "rejected", "failed")
+
+
+class ServiceOverloaded(Exception):
+    """Raised when ``max_pending`` reports are already being computed."""
+
+
+@dataclass(frozen=True)
+class ReportRequest:
+    """A validated report request; ``key`` identifies identical requests."""
+
+    brands: tuple
+    settings: dict
+    locations: tuple
+    key: str
+
+
+@dataclass(frozen=True)
+class Report:
+    """An encoded report body with its ETag."""
+
+    body: bytes
+    etag: str
+    created: float
+    has_errors: bool
+
+
+def _month(value, field):
+    match = _DATE.match(value) if isinstance(value, str) else None
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"settings.{field} must be a date formatted YYYY-MM or YYYY-MM-DD")
+    return f"{match.group(1)}-{match.group(2)}"
+
+
+def parse_report_request(payload, max_concurrent_requests=DEFAULT_MAX_WORKERS):
+    """Validate a request body and return a ReportRequest, raising ValueError when it is malformed.
+
+    Brands without a name or without any non-empty keyword are skipped, as
+    in the Streamlit app; the frontend's ``language`` and the brands' ``id``
+    and ``isOwnBrand`` do not affect the results and are ignored.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("The request body must be a JSON object with brands and settings")
+    raw_brands = payload.get("brands")
+    raw_settings = payload.get("settings") or {}
+    if not isinstance(raw_brands, list) or not isinstance(raw_settings, dict):
+        raise ValueError("brands must be a list and settings an object")
+
+    brands = []
+    for brand in raw_brands:
+        if not isinstance(brand, dict) or not isinstance(brand.get("keywords", []), list):
+            raise ValueError("Every brand must be an object with a name and a list of keywords")
+        name = str(brand.get("name") or "").strip()
+        keywords = [str(keyword).strip() for keyword in brand.get("keywords", []) if str(keyword).strip()]
+        if not name or not keywords:
+            continue
+        entry = {"name": name, "keywords": keywords}
+        if brand.get("color"):
+            entry["color"] = str(brand["color"])
+        brands.append(entry)
+    if not brands:
+        raise ValueError("Add at least one brand with a name and keywords")
+    if len(brands) > MAX_BRANDS:
+        raise ValueError(f"At most {MAX_BRANDS} brands can be requested at once")
+
+    location = raw_settings.get("location", "United States")
+    compare_locations = raw_settings.get("compareLocations") or []
+    if not isinstance(compare_locations, list):
+        raise ValueError("settings.compareLocations must be a list")
+    locations = [location] + [extra for extra in compare_locations if extra != location]
+    unknown = [name for name in locations if not isinstance(name, str) or not is_known_location(name)]
+    if unknown:
+        raise ValueError(f"Unknown location: {', '.join(map(str, unknown))}")
+
+    # Membership checks need hashable values; a list or object is rejected like an unknown name
+    network = raw_settings.get("network", "google")
+    if not isinstance(network, str) or network not in NETWORKS:
+        raise ValueError(f"settings.network must be one of {', '.join(NETWORKS)}")
+    granularity = raw_settings.get("granularity", "monthly")
+    if not isinstance(granularity, str) or granularity not in GRANULARITIES:
+        raise ValueError(f"settings.granularity must be one of {', '.join(GRANULARITIES)}")
+    backend = raw_settings.get("backend", "ideas")
+    if not isinstance(backend, str) or backend not in BACKENDS:
+        raise ValueError(f"settings.backend must be one of {', '.join(BACKENDS)}")
+    date_from = _month(raw_settings.get("dateFrom"), "dateFrom")
+    date_to = _month(raw_settings.get("dateTo"), "dateTo")
+    if date_from > date_to:
+        raise ValueError("settings.dateFrom must not be after settings.dateTo")
+
+    settings = {
+        "location": location,
+        "network": NETWORKS[network],
+        "dateFrom": date_from,
+        "dateTo": date_to,
+        "granularity": granularity,
+        "backend": backend,
+    }
+    key = hashlib.sha256(
+        json.dumps({"brands": brands, "settings": settings, "locations": locations}, sort_keys=True).encode()
+    ).hexdigest()
+    settings["maxConcurrentRequests"] = max_concurrent_requests
+    return ReportRequest(tuple(brands), settings, tuple(locations), key)
+
+
+def encode_report(results, errors):
+    """Encode a result table and its FetchErrors as the JSON response body."""
+    return b"".join((
+        b'{"results":', results.to_json(orient="records").encode(),
+        b',"errors":', json.dumps([error.as_dict() for error in errors]).encode(), b"}"
+    ))
+
+
+def etag_matches(if_none_match, etag):
+    """Return True when an If-None-Match header value lists ``etag`` (weak or strong) or is ``*``."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class ResponseCache:
+    """LRU cache of encoded reports that expire ``ttl`` seconds after they were computed.
+
+    Only used from the event loop thread, so it needs no lock. A size of 0
+    disables it.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        report = self._entries.get(key)
+        if report is None:
+            return None
+        if self._clock() - report.created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return report
+
+    def put(self, key, report):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = report
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ReportService:
+    """Computes reports on a worker pool, caching and coalescing identical requests."""
+
+    def __init__(self, client, customer_id, cache=None, scheduler=None, single_flight=None,
+                 workers=DEFAULT_REPORT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL, clock=time.monotonic):
+        self.client = client
+        self.customer_id = customer_id
+        self.keyword_cache = cache
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.single_flight = single_flight if single_flight is not None else SingleFlight()
+        self.max_pending = max_pending
+        self.stats = ApiStats()
+        self.responses = ResponseCache(cache_size, cache_ttl, clock)
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="api-report")
+        self._in_flight = {}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _compute(self, request):
+        options = {"cache": self.keyword_cache, "scheduler": self.scheduler, "single_flight": self.single_flight}
+        with span("api.report", brands=len(request.brands), locations=len(request.locations)):
+            brands = list(request.brands)
+            if len(request.locations) > 1:
+                results, errors = get_search_volumes_by_location(
+                    brands, request.settings, list(request.locations), self.client, self.customer_id, **options
+                )
+            else:
+                results, errors = get_search_volumes(brands, request.settings, self.client, self.customer_id, **options)
+            body = encode_report(results, errors)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        return Report(body, etag, self._clock(), bool(errors))
+
+    async def _run(self, request):
+        loop = asyncio.get_running_loop()
+        try:
+            # Run in a copy of this context, so an active tracer records the report's spans
+            report = await loop.run_in_executor(self._executor, contextvars.copy_context().run, self._compute, request)
+        except Exception:
+            self.stats.add("failed")
+            raise
+        finally:
+            del self._in_flight[request.key]
+        self.stats.add("computed")
+        if not report.has_errors:
+            self.responses.put(request.key, report)
+        return report
+
+    async def report(self, request):
+        """Return the Report for a ReportRequest from the cache, a computation in progress or a new one."""
+        self.stats.add("requests")
+        report = self.responses.get(request.key)
+        if report is not None:
+            self.stats.add("cache_hits")
+            return report
+
+        task = self._in_flight.get(request.key)
+        if task is None:
+            if len(self._in_flight) >= self.max_pending:
+                self.stats.add("rejected")
+                raise ServiceOverloaded(f"{len(self._in_flight)} reports are already being computed")
+            task = self._in_flight[request.key] = asyncio.ensure_future(self._run(request))
+        else:
+            self.stats.add("coalesced")
+        # A client that disconnects cancels its own wait, not the report other clients are waiting for
+        return await asyncio.shield(task)
+
+    def status(self):
+        return {
+            "api": self.stats.as_dict(),
+            "cachedReports": len(self.responses),
+            "reportsInProgress": len(self._in_flight),
+            "requests": self.scheduler.stats.as_dict(),
+            "coalescing": self.single_flight.stats.as_dict(),
+        }
+
+
+def _error(status_code, message, headers=None):
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+def create_app(service, allowed_origins=DEFAULT_ALLOWED_ORIGINS):
+    """Return the Starlette application serving ``service``."""
+
+    async def search_volumes(request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            return _error(400, "The request body must be JSON")
+        try:
+            # Validating locations queries the geo target index, which must not block the event loop
+            report_request = await run_in_threadpool(
+                parse_report_request, payload, service.scheduler.max_concurrent or DEFAULT_MAX_WORKERS
+            )
+        except ValueError as e:
+            return _error(400, str(e))
+
+        try:
+            report = await service.report(report_request)
+        except ServiceOverloaded as e:
+            return _error(503, str(e), headers={"Retry-After": "1"})
+        except Exception as e:
+            logger.exception("Report failed")
+            return _error(500, str(e))
+
+        headers = {"ETag": report.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), report.etag):
+            service.stats.add("not_modified")
+            return Response(status_code=304, headers=headers)
+        return Response(report.body, media_type="application/json", headers=headers)
+
+    async def locations(request):
+        return JSONResponse(list(COUNTRY_MAPPING))
+
+    async def search_locations(request):
+        query = request.query_params.get("q", "")
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), MAX_LOCATION_RESULTS)
+        except ValueError:
+            return _error(400, "limit must be an integer")
+        targets = await run_in_threadpool(
+            lambda: default_geo_index().search(query, request.query_params.get("country") or None, limit)
+        )
+        return JSONResponse([
+            {"id": target.id, "location": target.location, "label": target.label, "name": target.name,
+             "canonicalName": target.canonical_name, "targetType": target.target_type,
+             "countryCode": target.country_code}
+            for target in targets
+        ])
+
+    async def health(request):
+        return JSONResponse({"status": "ok", **service.status()})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # Open (or build, from the geo targets CSV) the geo target index before the first request needs it
+        await run_in_threadpool(default_geo_index)
+        yield
+        service.close()
+
+    return Starlette(
+        routes=[
+            Route("/api/search-volumes", search_volumes, methods=["POST"]),
+            Route("/api/locations", locations, methods=["GET"]),
+            Route("/api/locations/search", search_locations, methods=["GET"]),
+            Route("/api/health", health, methods=["GET"]),
+        ],
+        middleware=[
+            Middleware(
+                CORSMiddleware,
+                allow_origins=list(allowed_origins),
+                allow_methods=["GET", "POST"],
+                allow_headers=["Content-Type", "If-None-Match"],
+                expose_headers=["ETag"],
+            ),
+            Middleware(GZipMiddleware, minimum_size=1024),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main(argv=None):
+    from share_of_search.batch import load_secrets
+
+    parser = argparse.ArgumentParser(description="Serve share-of-search reports as a JSON API for the React frontend.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--secrets", help="secrets.toml with the GOOGLE_* credentials (default: environment variables)")
+    parser.add_argument("--allow-origin", action="append", dest="allowed_origins",
+                        help=f"origin allowed to call the API (repeatable; default {DEFAULT_ALLOWED_ORIGINS[0]})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_REPORT_WORKERS, help="reports computed at the same time")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="reports in progress before new ones are refused with 503")
+    parser.add_argument("--max-requests", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Keyword Planner requests in flight across all reports")
+    parser.add_argument("--requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="sustained Keyword Planner request rate across all reports")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="retries of quota and transient API errors per request")
+    parser.add_argument("--channels", type=int, default=DEFAULT_POOL_SIZE,
+                        help="gRPC channels kept open per Google Ads service")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="reports kept in the response cache")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL,
+                        help="seconds a cached report is served before it is computed again")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the local keyword cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        secrets = load_secrets(args.secrets)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    import uvicorn
+
+    service = ReportService(
+        PooledGoogleAdsClient(load_google_ads_client(secrets), size=args.channels),
+        secrets["GOOGLE_CUSTOMER_ID"],
+        cache=None if args.no_cache else KeywordMetricsCache(),
+        scheduler=RequestScheduler(
+            requests_per_second=args.requests_per_second,
+            max_concurrent=args.max_requests,
+            max_retries=args.max_retries
+        ),
+        workers=args.workers,
+        max_pending=args.max_pending,
+        cache_size=args.cache_size,
+        cache_ttl=args.cache_ttl
+    )
+    uvicorn.run(create_app(service, args.allowed_origins or DEFAULT_ALLOWED_ORIGINS), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
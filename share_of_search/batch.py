@@ -0,0 +1,282 @@
+"""Headless batch runner for many share-of-search reports in one process.
+
+A job file (JSON or YAML) lists one job per client::
+
+    defaults:
+      location: Czech Republic
+      network: GOOGLE_SEARCH
+      dateFrom: "2024-01"
+      dateTo: "2024-12"
+      granularity: monthly
+    jobs:
+      - name: client-a
+        format: parquet
+        brands:
+          - name: Brand A
+            keywords: [brand a, brand a shop]
+          - name: Competitor
+            keywords: [competitor]
+
+Any setting in ``defaults`` can be overridden per job. A ``locations`` list
+instead of ``location`` fans the job out over several markets and adds a
+``location`` column to its output, and ``priority`` orders a job's requests
+against the other jobs' (lower first). With ``incremental: true`` (or
+``--incremental`` for every job) a job extends its previous output instead of
+rebuilding it: the keyword cells it fetched are kept in ``<name>.cells.<format>``
+(and its brands' keywords, network and backend in ``<name>.cells.json``) next to
+the output, only the months missing from them are requested, and the shares are
+recalculated from the cells. Credentials come from
+the same GOOGLE_* names as the Streamlit secrets, read from the environment or
+from a secrets.toml passed with ``--secrets``.
+
+Usage::
+
+    python -m share_of_search.batch jobs.yaml --output-dir reports --jobs 4
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from share_of_search.cache import KeywordMetricsCache
+from share_of_search.fetch import DEFAULT_MAX_WORKERS
+from share_of_search.incremental import (
+    load_previous_results, load_snapshot, refresh_search_volumes, report_definition, save_snapshot
+)
+from share_of_search.keyword_planner import (
+    CREDENTIAL_KEYS, get_search_volumes, get_search_volumes_by_location, load_google_ads_client
+)
+from share_of_search.pool import DEFAULT_POOL_SIZE, PooledGoogleAdsClient
+from share_of_search.scheduler import (
+    DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, PRIORITY_BATCH, RequestScheduler, SchedulerStats
+)
+from share_of_search.singleflight import SingleFlight
+from share_of_search.tracing import Tracer, activate, span
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("csv", "parquet")
+
+
+def default_settings():
+    """Return the app's default settings: the last twelve complete months, monthly, Czech Republic."""
+    current_date = datetime.now()
+    end_date = datetime(current_date.year, current_date.month, 1) - timedelta(days=1)
+    start_date = datetime(end_date.year - 1, end_date.month, 1)
+    return {
+        "location": "Czech Republic",
+        "network": "GOOGLE_SEARCH",
+        "dateFrom": start_date.strftime("%Y-%m"),
+        "dateTo": end_date.strftime("%Y-%m"),
+        "granularity": "monthly",
+        "maxConcurrentRequests": DEFAULT_MAX_WORKERS,
+        "backend": "ideas"
+    }
+
+
+def load_job_file(path):
+    """Read a JSON or YAML job file into a dict."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML job files requires PyYAML (pip install pyyaml)") from None
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand_jobs(spec):
+    """Validate a job file and return one {name, brands, settings, format} dict per job."""
+    defaults = {**default_settings(), **spec.get("defaults", {})}
+    jobs = []
+    for index, job in enumerate(spec.get("jobs", [])):
+        name = job.get("name")
+        if not name:
+            raise ValueError(f"Job #{index + 1} has no name")
+        if any(existing["name"] == name for existing in jobs):
+            raise ValueError(f"Job name '{name}' is used more than once")
+
+        brands = job.get("brands") or []
+        for brand in brands:
+            if not brand.get("name") or not isinstance(brand.get("keywords"), list):
+                raise ValueError(f"Job '{name}': every brand needs a name and a list of keywords")
+
+        output_format = job.get("format", defaults.get("format", "csv"))
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Job '{name}': format must be one of {', '.join(OUTPUT_FORMATS)}")
+
+        settings = {**defaults, **{k: v for k, v in job.items() if k not in ("name", "brands", "format")}}
+        settings.pop("format", None)
+        jobs.append({"name": name, "brands": brands, "settings": settings, "format": output_format})
+
+    if not jobs:
+        raise ValueError("The job file does not define any jobs")
+    return jobs
+
+
+def load_secrets(path=None):
+    """Return the GOOGLE_* credentials from a secrets.toml file or the environment."""
+    if path:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    names = list(CREDENTIAL_KEYS.values()) + ["GOOGLE_CUSTOMER_ID"]
+    missing = [name for name in names if not os.environ.get(name)]
+    if missing:
+        raise ValueError(f"Missing credentials in the environment: {', '.join(missing)}")
+    return {name: os.environ[name] for name in names}
+
+
+def write_results(results, path, output_format):
+    """Write a result DataFrame as CSV or Parquet."""
+    if output_format == "parquet":
+        results.to_parquet(path, index=False)
+    else:
+        results.to_csv(path, index=False)
+
+
+def run_job(job, client, customer_id, output_dir, cache=None, scheduler=None, single_flight=None):
+    """Run one report and write its output, returning a summary with timing, request counts and errors."""
+    stats = SchedulerStats()
+    options = {
+        "cache": cache,
+        "scheduler": scheduler,
+        "priority": job["settings"].get("priority", PRIORITY_BATCH),
+        "stats": stats,
+        "single_flight": single_flight
+    }
+    path = os.path.join(output_dir, f"{job['name']}.{job['format']}")
+    refreshed_periods = None
+    start = time.perf_counter()
+    if job["settings"].get("incremental"):
+        snapshot_path = os.path.join(output_dir, f"{job['name']}.cells.{job['format']}")
+        options["cache"], definition = load_snapshot(snapshot_path)
+        locations = job["settings"].get("locations") or [job["settings"]["location"]]
+        results, errors, refreshed_periods = refresh_search_volumes(
+            job["brands"], job["settings"], locations, client, customer_id, load_previous_results(path),
+            definition=definition, **options
+        )
+        save_snapshot(options["cache"], snapshot_path, report_definition(job["brands"], job["settings"]))
+    elif job["settings"].get("locations"):
+        results, errors = get_search_volumes_by_location(
+            job["brands"], job["settings"], job["settings"]["locations"], client, customer_id, **options
+        )
+    else:
+        results, errors = get_search_volumes(job["brands"], job["settings"], client, customer_id, **options)
+    fetch_seconds = time.perf_counter() - start
+
+    write_results(results, path, job["format"])
+    return {
+        "name": job["name"],
+        "output": path,
+        "rows": len(results),
+        "fetchSeconds": round(fetch_seconds, 3),
+        "totalSeconds": round(time.perf_counter() - start, 3),
+        "requests": stats.as_dict(),
+        "refreshedPeriods": refreshed_periods,
+        "errors": [error.as_dict() for error in errors]
+    }
+
+
+def run_jobs(jobs, client, customer_id, output_dir, scheduler, parallel_jobs=2, cache=None, single_flight=None):
+    """Run jobs concurrently; one scheduler rate limits and retries the requests of all of them.
+
+    With a SingleFlight, jobs requesting the same keywords at the same time
+    share one request.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run(job):
+        try:
+            with span("report", job=job["name"]):
+                summary = run_job(job, client, customer_id, output_dir, cache, scheduler, single_flight)
+        except Exception as e:
+            summary = {"name": job["name"], "output": None, "rows": 0, "errors": [{"message": str(e)}]}
+        logger.info("%s: %d rows in %ss (%d errors)", summary["name"], summary["rows"],
+                    summary.get("totalSeconds", "-"), len(summary["errors"]))
+        return summary
+
+    # Each job runs in a copy of this context, so an active tracer records its spans
+    with ThreadPoolExecutor(max_workers=max(1, parallel_jobs), thread_name_prefix="report") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run share-of-search reports from a job file without the Streamlit UI.")
+    parser.add_argument("job_file", help="JSON or YAML job file")
+    parser.add_argument("--output-dir", default="reports", help="directory for the per-job outputs and summary.json")
+    parser.add_argument("--secrets", help="secrets.toml with the GOOGLE_* credentials (default: environment variables)")
+    parser.add_argument("--jobs", type=int, default=2, help="reports run at the same time")
+    parser.add_argument("--max-requests", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Keyword Planner requests in flight across all reports")
+    parser.add_argument("--requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="sustained Keyword Planner request rate across all reports")
+    parser.add_argument("--daily-operations", type=int, help="stop sending requests after this many operations today")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="retries of quota and transient API errors per request")
+    parser.add_argument("--channels", type=int, default=DEFAULT_POOL_SIZE,
+                        help="gRPC channels kept open per Google Ads service")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the local keyword cache")
+    parser.add_argument("--trace", help="write timing spans of the run to this file as OpenTelemetry JSON")
+    parser.add_argument("--incremental", action="store_true",
+                        help="extend each job's previous output, fetching only the months it is missing")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        jobs = expand_jobs(load_job_file(args.job_file))
+        if args.incremental:
+            for job in jobs:
+                job["settings"]["incremental"] = True
+        secrets = load_secrets(args.secrets)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    # One client for all jobs, with a pool of service stubs and gRPC channels
+    client = PooledGoogleAdsClient(load_google_ads_client(secrets), size=args.channels)
+    cache = None if args.no_cache else KeywordMetricsCache()
+
+    scheduler = RequestScheduler(
+        requests_per_second=args.requests_per_second,
+        daily_operations=args.daily_operations,
+        max_concurrent=args.max_requests,
+        max_retries=args.max_retries
+    )
+
+    start = time.perf_counter()
+    single_flight = SingleFlight()
+    tracer = Tracer(service_name="share-of-search-batch") if args.trace else None
+    with activate(tracer):
+        summaries = run_jobs(jobs, client, secrets["GOOGLE_CUSTOMER_ID"], args.output_dir, scheduler,
+                             parallel_jobs=args.jobs, cache=cache, single_flight=single_flight)
+    report = {
+        "jobs": summaries,
+        "requests": scheduler.stats.as_dict(),
+        "channels": client.pool.stats.as_dict(),
+        "coalescing": single_flight.stats.as_dict(),
+        "totalSeconds": round(time.perf_counter() - start, 3)
+    }
+    with open(os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if tracer is not None:
+        with open(args.trace, "w", encoding="utf-8") as f:
+            json.dump(tracer.to_otel(), f)
+
+    for summary in summaries:
+        print(f"{summary['name']:<30} {summary['rows']:>6} rows {summary.get('totalSeconds', '-'):>8}s"
+              f"{'  ' + str(len(summary['errors'])) + ' errors' if summary['errors'] else ''}")
+    print(f"{len(summaries)} jobs in {report['totalSeconds']}s; requests: "
+          + ", ".join(f"{count} {field}" for field, count in report["requests"].items()))
+    return 1 if any(summary["errors"] for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""Bulk import of brands and keywords from CSV or Excel files.
+
+A brand file has one row per keyword, or several keywords in one cell, with
+a brand column and optional own brand and colour columns. The whole table is
+normalised, deduplicated and validated with vectorised pandas operations, so
+a competitive set of thousands of keywords turns into brand dicts in one
+step. pandas is imported on first use.
+"""
+import dataclasses
+import io
+import os
+import uuid
+
+# Colours given to imported brands without one, in the order the app assigns them to new brands
+BRAND_COLORS = (
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"
+)
+
+# Keyword Planner rejects keywords longer than 80 characters or 10 words
+MAX_KEYWORD_LENGTH = 80
+MAX_KEYWORD_WORDS = 10
+
+# Accepted (case-insensitive) headers of each column
+COLUMN_ALIASES = {
+    "name": ("brand", "name", "brand name"),
+    "keywords": ("keyword", "keywords", "search term", "search terms"),
+    "isOwnBrand": ("own", "own brand", "isownbrand", "is own brand"),
+    "color": ("color", "colour"),
+}
+
+IMPORT_EXTENSIONS = ("csv", "xlsx", "xls")
+
+# Separators of several keywords in one cell
+_KEYWORD_SEPARATORS = r"[\n\r;|,]"
+_TRUE_VALUES = ("1", "true", "yes", "y", "x", "own", "ano")
+# Issues of one kind list at most this many examples
+_EXAMPLES = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class BrandImport:
+    """The brands read from a file and what was dropped on the way.
+
+    ``brands`` are dicts shaped like the app's brands; ``rows`` counts the
+    rows of the file, ``keywords`` the imported keywords and ``duplicates``
+    the repeated keywords that were left out. ``issues`` describes rows and
+    values that were skipped or replaced.
+    """
+    brands: list
+    rows: int
+    keywords: int
+    duplicates: int
+    issues: tuple = ()
+
+
+def read_brand_table(data, filename):
+    """Read the first sheet of an Excel file, or a CSV file with any common separator, as a table of strings."""
+    import pandas as pd
+
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    if extension not in IMPORT_EXTENSIONS:
+        raise ValueError(f"Unsupported file type '{filename}'; expected one of {', '.join(IMPORT_EXTENSIONS)}")
+    try:
+        if extension != "csv":
+            return pd.read_excel(io.BytesIO(data), sheet_name=0, dtype=str, keep_default_na=False)
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            # Excel on Central European Windows saves CSV files in cp1250
+            text = data.decode("cp1250", errors="replace")
+        return pd.read_csv(io.StringIO(text), sep=None, engine="python", dtype=str, keep_default_na=False)
+    except ImportError as e:
+        raise ValueError(f"Reading {extension} files needs an extra package: {e}") from e
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Could not read '{filename}': {e}") from e
+
+
+def _find_columns(frame):
+    headers = {" ".join(str(column).lower().replace("_", " ").split()): column for column in frame.columns}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        column = next((headers[alias] for alias in aliases if alias in headers), None)
+        if column is not None:
+            columns[field] = column
+    if "name" not in columns:
+        aliases = [f"'{alias}'" for alias in COLUMN_ALIASES["name"]]
+        raise ValueError(f"No brand column found; expected a column named {', '.join(aliases[:-1])} or {aliases[-1]}")
+    return columns
+
+
+def _examples(values):
+    values = list(dict.fromkeys(values))
+    shown = ", ".join(f"'{value}'" for value in values[:_EXAMPLES])
+    return shown + (f" and {len(values) - _EXAMPLES} more" if len(values) > _EXAMPLES else "")
+
+
+def normalize_brand_table(frame):
+    """Turn a table read by read_brand_table into a BrandImport.
+
+    Brand names are trimmed and grouped case-insensitively (the first
+    spelling is kept); keywords are split on commas, semicolons, pipes and
+    line breaks and normalised like normalize_keyword. A brand without
+    keywords is searched by its name. A keyword listed twice for a brand is
+    kept once, and one listed for several brands only for the first of them;
+    keywords over the Keyword Planner limits and rows without a brand are
+    skipped. A brand is an own brand if any of its rows says so.
+    """
+    import pandas as pd
+
+    columns = _find_columns(frame)
+    rows = len(frame)
+    issues = []
+
+    def column(field):
+        if field not in columns:
+            return pd.Series("", index=frame.index, dtype=object)
+        return frame[columns[field]].fillna("").astype(str).str.strip()
+
+    table = pd.DataFrame({
+        "name": column("name").str.replace(r"\s+", " ", regex=True),
+        "keyword": column("keywords"),
+        "own": column("isOwnBrand").str.lower().isin(_TRUE_VALUES),
+        "color": column("color"),
+    })
+
+    unnamed = table["name"] == ""
+    if unnamed.any():
+        issues.append(f"{int(unnamed.sum())} rows without a brand name were skipped.")
+        table = table[~unnamed]
+    table["key"] = table["name"].str.casefold()
+
+    # One row per keyword, normalised like normalize_keyword
+    table["keyword"] = table["keyword"].str.split(_KEYWORD_SEPARATORS, regex=True)
+    table = table.explode("keyword", ignore_index=True)
+    table["keyword"] = table["keyword"].fillna("").str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+
+    # Brand-level attributes come from all of a brand's rows, including those without keywords
+    brand_rows = table.groupby("key", sort=False)
+    names = brand_rows["name"].first()
+    own = brand_rows["own"].any()
+    valid_color = table["color"].str.fullmatch(r"#[0-9a-fA-F]{6}")
+    bad_colors = table.loc[(table["color"] != "") & ~valid_color, "color"]
+    if not bad_colors.empty:
+        issues.append(f"Colours {_examples(bad_colors)} are not #RRGGBB values; default colours were used.")
+    colors = table[valid_color].groupby("key", sort=False)["color"].first()
+
+    # Brands without any keyword are searched by their name
+    named = table["keyword"] != ""
+    missing = names[~named.groupby(table["key"], sort=False).any()]
+    keywords = pd.concat([
+        table.loc[named, ["key", "keyword"]],
+        pd.DataFrame({"key": missing.index, "keyword": missing.str.lower().to_numpy()}),
+    ], ignore_index=True)
+
+    too_long = (keywords["keyword"].str.len() > MAX_KEYWORD_LENGTH) | (
+        keywords["keyword"].str.count(" ") + 1 > MAX_KEYWORD_WORDS
+    )
+    if too_long.any():
+        issues.append(
+            f"Keywords longer than {MAX_KEYWORD_LENGTH} characters or {MAX_KEYWORD_WORDS} words were skipped: "
+            f"{_examples(keywords.loc[too_long, 'keyword'])}."
+        )
+        keywords = keywords[~too_long]
+
+    repeated = keywords.duplicated(["key", "keyword"])
+    shared = keywords.duplicated("keyword") & ~repeated
+    if shared.any():
+        issues.append(
+            f"Keywords listed for several brands were kept for the first brand only: "
+            f"{_examples(keywords.loc[shared, 'keyword'])}."
+        )
+    keywords = keywords[~(repeated | shared)]
+
+    brand_keywords = keywords.groupby("key", sort=False)["keyword"].agg(list)
+    dropped = names.index.difference(brand_keywords.index)
+    if len(dropped):
+        issues.append(f"Brands left without keywords were skipped: {_examples(names[dropped])}.")
+
+    brands = []
+    color_counts = {True: 0, False: 0}
+    for key in names.index:
+        if key not in brand_keywords.index:
+            continue
+        is_own = bool(own[key])
+        color = colors.get(key) or BRAND_COLORS[color_counts[is_own] % len(BRAND_COLORS)]
+        color_counts[is_own] += 1
+        brands.append({
+            "id": str(uuid.uuid4()), "name": names[key], "keywords": brand_keywords[key], "isOwnBrand": is_own,
+            "color": color.lower(),
+        })
+
+    return BrandImport(
+        brands=brands,
+        rows=rows,
+        keywords=len(keywords),
+        duplicates=int((repeated | shared).sum()),
+        issues=tuple(issues),
+    )
+
+
+def import_brand_file(data, filename):
+    """Read a CSV or Excel brand file and return its BrandImport; unreadable files raise ValueError."""
+    return normalize_brand_table(read_brand_table(data, filename))
+
+
+def brands_to_table(brands):
+    """Return brands as a brand file table with one row per keyword, the format import_brand_file reads."""
+    import pandas as pd
+
+    return pd.DataFrame(
+        [
+            (brand["name"], keyword, "yes" if brand["isOwnBrand"] else "no", brand["color"])
+            for brand in brands if brand["name"]
+            for keyword in brand["keywords"] if keyword.strip()
+        ],
+        columns=["brand", "keyword", "own", "color"],
+    )
+
+
+def merge_brands(brands, imported, replace=False):
+    """Return ``brands`` with ``imported`` added, or ``imported`` alone when ``replace`` is set.
+
+    An imported brand with the name of an existing one (ignoring case) adds
+    its new keywords to it; blank brands with no name and no keywords are
+    dropped.
+    """
+    if replace:
+        return list(imported)
+
+    merged = [
+        {**brand, "keywords": list(brand["keywords"])} for brand in brands
+        if brand["name"] or any(k.strip() for k in brand["keywords"])
+    ]
+    by_name = {brand["name"].casefold(): brand for brand in merged if brand["name"]}
+    for brand in imported:
+        existing = by_name.get(brand["name"].casefold())
+        if existing is None:
+            merged.append(brand)
+            by_name[brand["name"].casefold()] = brand
+            continue
+        known = {" ".join(k.lower().split()) for k in existing["keywords"]}
+        existing["keywords"] = [k for k in existing["keywords"] if k.strip()] + [
+            k for k in brand["keywords"] if k not in known
+        ]
+    return merged
@@ -0,0 +1,134 @@
+"""Persistent SQLite cache of per-keyword monthly search volumes.
+
+Cells are keyed by keyword, geo target ID, keyword plan network and month.
+Google keeps revising the most recent months for a while, so cells for those
+months expire after a TTL; older months are treated as final and kept forever.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from share_of_search.aggregation import normalize_keyword
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "KEYWORD_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "keyword_metrics.sqlite")
+)
+
+# Months this close to today are re-fetched once their cells are older than the TTL
+RECENT_MONTHS = 3
+RECENT_TTL_SECONDS = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keyword_volumes (
+    keyword TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    network TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    volume INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (keyword, geo, network, year, month)
+)
+"""
+
+
+def _months_ago(year, month, today):
+    return (today.year - year) * 12 + (today.month - month)
+
+
+class KeywordMetricsCache:
+    """Read-through store for keyword monthly volumes shared by all sessions of the process."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, recent_months=RECENT_MONTHS, ttl_seconds=RECENT_TTL_SECONDS):
+        self.path = path
+        self.recent_months = recent_months
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+
+    def _is_fresh(self, year, month, fetched_at, now, today):
+        if _months_ago(year, month, today) > self.recent_months:
+            return True
+        return now - fetched_at < self.ttl_seconds
+
+    def lookup(self, keywords, geo, network, months):
+        """Return the cached keyword -> {(year, month): volume} cells that are still valid."""
+        keywords = sorted({normalize_keyword(k) for k in keywords})
+        wanted = set(months)
+        if not keywords or not wanted:
+            return {}
+
+        first, last = min(wanted), max(wanted)
+        placeholders = ",".join("?" * len(keywords))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT keyword, year, month, volume, fetched_at FROM keyword_volumes "
+                f"WHERE geo = ? AND network = ? AND keyword IN ({placeholders}) "
+                f"AND year * 12 + month BETWEEN ? AND ?",
+                [geo, network, *keywords, first[0] * 12 + first[1], last[0] * 12 + last[1]]
+            ).fetchall()
+
+        now, today = time.time(), datetime.now()
+        cached = {}
+        for keyword, year, month, volume, fetched_at in rows:
+            if (year, month) in wanted and self._is_fresh(year, month, fetched_at, now, today):
+                cached.setdefault(keyword, {})[(year, month)] = volume
+        return cached
+
+    def store(self, keyword_volumes, keywords, geo, network, months):
+        """Save the fetched cells of ``keywords`` for ``months``; months without data are stored as zero."""
+        fetched_at = time.time()
+        rows = [
+            (keyword, geo, network, year, month, keyword_volumes.get(keyword, {}).get((year, month), 0), fetched_at)
+            for keyword in {normalize_keyword(k) for k in keywords}
+            for year, month in months
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO keyword_volumes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def evict_expired(self):
+        """Delete recent-month cells whose TTL has passed and return how many were removed."""
+        today = datetime.now()
+        cutoff = today.year * 12 + today.month - self.recent_months
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM keyword_volumes WHERE year * 12 + month >= ? AND fetched_at < ?",
+                (cutoff, time.time() - self.ttl_seconds)
+            )
+        return cursor.rowcount
+
+    def export_rows(self):
+        """Return every cell as a (keyword, geo, network, year, month, volume, fetched_at) tuple."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT keyword, geo, network, year, month, volume, fetched_at FROM keyword_volumes "
+                "ORDER BY keyword, geo, network, year, month"
+            ).fetchall()
+
+    def import_rows(self, rows):
+        """Insert cells produced by ``export_rows``, keeping their original fetch times."""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO keyword_volumes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def clear(self):
+        """Remove every cached cell."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM keyword_volumes")
+
+
+def missing_months(cached, keywords, months):
+    """Return the months of ``months`` that at least one of ``keywords`` has no cached cell for."""
+    missing = set()
+    for keyword in {normalize_keyword(k) for k in keywords}:
+        have = cached.get(keyword, {})
+        missing.update(m for m in months if m not in have)
+    return sorted(missing)
@@ -0,0 +1,172 @@
+"""Plotly figures of a result table, kept small enough to send to the browser quickly.
+
+Every brand is one trace per location panel, and the figure JSON repeats the
+period labels of every trace, so the payload grows with brands x periods x
+locations. Above ``max_brands`` the smallest brands by total volume are
+summed into one "Other" series (own brands are always kept), line charts
+with many points switch to WebGL traces, and numeric trace arrays are sent
+as 32-bit typed arrays. The Data Table and the exports keep every brand.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from share_of_search.matrix import compact_results, market_shares
+from share_of_search.tracing import traced
+
+DEFAULT_MAX_CHART_BRANDS = 15
+OTHER_COLOR = "#bdbdbd"
+# Line charts with more points than this are drawn with WebGL (scattergl) traces; stacked
+# areas cannot be, so the Other grouping is what keeps the share chart light
+WEBGL_MIN_POINTS = 1000
+
+
+def other_label(n_brands):
+    """Return the name of the series that sums ``n_brands`` grouped brands."""
+    return f"Other ({n_brands} brands)"
+
+
+def group_long_tail(results, max_brands=DEFAULT_MAX_CHART_BRANDS, keep=()):
+    """Sum all but the largest brands into one "Other" series so at most ``max_brands`` series are drawn.
+
+    Brands are ranked by their total volume over the whole table; brands in
+    ``keep`` are never grouped. Shares of the Other series are recalculated
+    from its volume and the period totals. Returns ``results`` unchanged when
+    there are not more than ``max_brands`` brands or ``max_brands`` is None.
+    """
+    if max_brands is None or results["brand"].nunique() <= max_brands:
+        return results
+    totals = results.groupby("brand", observed=True, sort=False)["volume"].sum()
+    keep = set(keep)
+    kept = [brand for brand in totals.index if brand in keep]
+    others = totals.drop(kept).sort_values(ascending=False, kind="stable")
+    kept += list(others.index[:max(0, max_brands - 1 - len(kept))])
+    grouped = ~results["brand"].isin(kept)
+
+    keys = ["location", "period"] if "location" in results.columns else ["period"]
+    period_totals = results.groupby(keys, observed=True, sort=False)["volume"].sum().rename("total").reset_index()
+    other = (
+        results[grouped].groupby(keys, observed=True, sort=False)["volume"].sum().reset_index()
+        .merge(period_totals, on=keys)
+    )
+    other["share"] = np.round(other["volume"] / other["total"] * 100, 1)
+    other["brand"] = other_label(len(totals) - len(kept))
+    other["color"] = OTHER_COLOR
+
+    combined = pd.concat(
+        [results[~grouped].astype({"brand": str, "color": str}), other[results.columns]], ignore_index=True
+    )
+    return compact_results(combined)
+
+
+def chart_colors(results, brand_colors):
+    """Return the colour map of the charted brands, including the Other series."""
+    return {**brand_colors, **{brand: OTHER_COLOR for brand in results["brand"].unique() if brand not in brand_colors}}
+
+
+def compact_traces(fig):
+    """Send the numeric x/y arrays of every trace as 32-bit typed arrays (plotly encodes numpy arrays as binary)."""
+    for trace in fig.data:
+        for axis in ("x", "y"):
+            values = getattr(trace, axis, None)
+            if values is None:
+                continue
+            values = np.asarray(values)
+            if values.dtype.kind == "f":
+                narrowed = values.astype(np.float32)
+            elif values.dtype.kind in "iu" and (values.size == 0 or np.abs(values).max() < 2**31):
+                narrowed = values.astype(np.int32)
+            else:
+                continue
+            # Plotly ignores assignments that compare equal to the current value, so clear it first
+            trace[axis] = None
+            trace[axis] = narrowed
+    return fig
+
+
+def location_facets(results):
+    """Return the plotly facet arguments and chart height for single or multi-location results."""
+    if "location" not in results.columns:
+        return {}, 600
+    rows = -(-results["location"].nunique() // 3)
+    return {"facet_col": "location", "facet_col_wrap": 3, "facet_row_spacing": 0.08}, max(600, 320 * rows)
+
+
+@traced("chart.build")
+def share_chart_figure(results, brand_colors, max_brands=DEFAULT_MAX_CHART_BRANDS, keep=()):
+    """Build the stacked area chart of share percentages, one panel per location when there are several."""
+    results = group_long_tail(results, max_brands, keep)
+    facets, height = location_facets(results)
+    fig = px.area(
+        results,
+        x="period",
+        y="share",
+        color="brand",
+        color_discrete_map=chart_colors(results, brand_colors),
+        title="Share of Search Over Time (%)",
+        labels={"period": "Time Period", "share": "Share (%)", "brand": "Brand", "location": "Location"},
+        groupnorm="percent",
+        **facets
+    )
+
+    fig.update_layout(
+        xaxis_title="Time Period",
+        yaxis_title="Share of Search (%)",
+        legend_title="Brands",
+        height=height
+    )
+    # Shares travel as float32, so round them for the hover label
+    fig.update_yaxes(hoverformat=".1f")
+    return compact_traces(fig)
+
+
+@traced("chart.build")
+def market_share_chart_figure(results, brand_colors, max_brands=DEFAULT_MAX_CHART_BRANDS, keep=()):
+    """Build the stacked bar chart comparing each brand's share of the whole window across locations."""
+    results = group_long_tail(results, max_brands, keep)
+    fig = px.bar(
+        market_shares(results),
+        x="location",
+        y="share",
+        color="brand",
+        color_discrete_map=chart_colors(results, brand_colors),
+        title="Share of Search by Market (%)",
+        labels={"location": "Location", "share": "Share (%)", "brand": "Brand"}
+    )
+
+    fig.update_layout(
+        xaxis_title="Location",
+        yaxis_title="Share of Search (%)",
+        legend_title="Brands",
+        barmode="stack",
+        height=600
+    )
+    fig.update_yaxes(hoverformat=".1f")
+    return compact_traces(fig)
+
+
+@traced("chart.build")
+def volume_chart_figure(results, brand_colors, max_brands=DEFAULT_MAX_CHART_BRANDS, keep=()):
+    """Build the line chart of absolute search volumes, one panel per location when there are several."""
+    results = group_long_tail(results, max_brands, keep)
+    facets, height = location_facets(results)
+    fig = px.line(
+        results,
+        x="period",
+        y="volume",
+        color="brand",
+        color_discrete_map=chart_colors(results, brand_colors),
+        title="Search Volume Over Time",
+        labels={"period": "Time Period", "volume": "Search Volume", "brand": "Brand", "location": "Location"},
+        markers=True,
+        render_mode="webgl" if len(results) > WEBGL_MIN_POINTS else "svg",
+        **facets
+    )
+
+    fig.update_layout(
+        xaxis_title="Time Period",
+        yaxis_title="Search Volume",
+        legend_title="Brands",
+        height=height
+    )
+    return compact_traces(fig)
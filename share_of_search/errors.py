@@ -0,0 +1,59 @@
+"""Structured description of failed Keyword Planner requests."""
+import sys
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class FetchError:
+    """A request that failed for a group of brands.
+
+    ``code`` is the gRPC status name for Google Ads API errors (for example
+    ``RESOURCE_EXHAUSTED``) and ``None`` for anything else. ``location`` is set
+    when the request was one of several fanned out over locations.
+    """
+
+    brands: tuple
+    message: str
+    details: tuple = field(default_factory=tuple)
+    code: str = None
+    request_id: str = None
+    location: str = None
+
+    def __str__(self):
+        return self.message
+
+    def as_dict(self):
+        """Return the error as a JSON-serialisable dict, as written to batch summaries and API responses."""
+        return {"brands": list(self.brands), "message": self.message, "details": list(self.details),
+                "code": self.code, "location": self.location}
+
+
+def _is_google_ads_exception(error):
+    # google-ads is only imported once a real client exists, so an unloaded module means "not one of its errors"
+    errors_module = sys.modules.get("google.ads.googleads.errors")
+    return errors_module is not None and isinstance(error, errors_module.GoogleAdsException)
+
+
+def error_code(error):
+    """Return the gRPC status name of a Google Ads API error, or the ``code`` attribute of any other error."""
+    if _is_google_ads_exception(error):
+        return error.error.code().name
+    return getattr(error, "code", None)
+
+
+def fetch_error_from_exception(brand_names, error):
+    """Describe an exception raised by a request made for ``brand_names``."""
+    affected = ", ".join(brand_names)
+    if _is_google_ads_exception(error):
+        return FetchError(
+            brands=tuple(brand_names),
+            message=f"Google Ads API error for brands {affected}: {error}",
+            details=tuple(error_detail.message for error_detail in error.failure.errors),
+            code=error_code(error),
+            request_id=error.request_id
+        )
+    return FetchError(
+        brands=tuple(brand_names),
+        message=f"Error retrieving search volume for {affected}: {str(error)}",
+        code=error_code(error)
+    )
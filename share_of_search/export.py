@@ -0,0 +1,48 @@
+"""Encode result tables for download as CSV, Parquet or Arrow IPC.
+
+Parquet and Arrow keep the categorical columns dictionary-encoded, so the
+brand, period and location strings are stored once rather than per row.
+Both need pyarrow, which Streamlit already depends on.
+"""
+import io
+
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def to_csv_bytes(results):
+    """Encode a result table as UTF-8 CSV."""
+    return results.to_csv(index=False).encode("utf-8")
+
+
+def to_parquet_bytes(results):
+    """Encode a result table as a zstd-compressed Parquet file."""
+    buffer = io.BytesIO()
+    results.to_parquet(buffer, index=False, compression="zstd")
+    return buffer.getvalue()
+
+
+def to_arrow_bytes(results):
+    """Encode a result table as an (uncompressed, so any Arrow reader can open it) Arrow IPC file."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def export_results(results, export_format):
+    """Encode a result table in one of EXPORT_FORMATS."""
+    if export_format == "parquet":
+        return to_parquet_bytes(results)
+    if export_format == "arrow":
+        return to_arrow_bytes(results)
+    if export_format == "csv":
+        return to_csv_bytes(results)
+    raise ValueError(f"Unknown export format '{export_format}'; expected one of {', '.join(EXPORT_FORMATS)}")
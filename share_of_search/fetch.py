@@ -0,0 +1,52 @@
+"""Concurrent execution of per-brand Keyword Planner requests.
+
+Jobs run in a copy of the submitting thread's context, so context variables
+such as the active tracer (see share_of_search.tracing) carry over to them.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Parallel Keyword Planner requests per report run
+DEFAULT_MAX_WORKERS = 4
+
+
+def fetch_all(jobs, fetch_one, max_workers=DEFAULT_MAX_WORKERS):
+    """Run ``fetch_one`` for every job on a bounded thread pool.
+
+    Returns ``(job, result, error)`` tuples in the order of ``jobs``. An
+    exception raised for one job is captured in its ``error`` slot and does not
+    affect the others, so callers can report failures per brand.
+    """
+    if not jobs:
+        return []
+
+    max_workers = max(1, min(int(max_workers), len(jobs)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="keyword-planner") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fetch_one, job) for job in jobs]
+
+    outcomes = []
+    for job, future in zip(jobs, futures):
+        error = future.exception()
+        outcomes.append((job, None if error is not None else future.result(), error))
+    return outcomes
+
+
+def iter_fetch(jobs, fetch_one, max_workers=DEFAULT_MAX_WORKERS):
+    """Like fetch_all, but yield ``(job, result, error)`` as each job finishes.
+
+    Closing the generator early (or an exception in the consumer) cancels the
+    jobs that have not started yet; the ones already running are left to
+    finish in the background.
+    """
+    if not jobs:
+        return
+
+    max_workers = max(1, min(int(max_workers), len(jobs)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="keyword-planner")
+    try:
+        futures = {executor.submit(contextvars.copy_context().run, fetch_one, job): job for job in jobs}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error is not None else future.result(), error
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
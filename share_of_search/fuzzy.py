@@ -0,0 +1,48 @@
+"""Text folding and bounded edit distance shared by brand variant discovery and the geo target search."""
+import unicodedata
+
+# Letters that NFKD does not decompose into a base letter and a combining mark
+_LETTER_FOLDS = str.maketrans({
+    "ł": "l", "đ": "d", "ð": "d", "ø": "o", "æ": "ae", "œ": "oe", "ß": "ss", "ı": "i", "þ": "th", "ħ": "h",
+})
+
+
+def fold_text(text):
+    """Return ``text`` without diacritics, case folded, with every run of non-alphanumerics as one space."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold().translate(_LETTER_FOLDS))
+    letters = "".join(
+        char if char.isalnum() else " " for char in decomposed if not unicodedata.combining(char)
+    )
+    return " ".join(letters.split())
+
+
+def max_edits(token):
+    """Return how many edits a token or name tolerates: none below 5 characters, 1 below 9, else 2."""
+    if len(token) < 5:
+        return 0
+    return 1 if len(token) < 9 else 2
+
+
+def edit_distance(a, b, limit):
+    """Return the optimal string alignment distance of ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            # A swap of two adjacent letters counts as one edit
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def trigrams(token):
+    """Return the trigrams of ``token`` padded with two ``#`` on each side."""
+    padded = f"##{token}##"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
@@ -0,0 +1,575 @@
+"""Google Ads geo target constants selectable as a report location.
+
+Countries are listed in COUNTRY_MAPPING. Regions, cities and the other
+sub-national targets come from Google's geo targets CSV, which is compiled
+once into a SQLite GeoTargetIndex on disk; sessions query it for the few
+targets they show instead of loading the whole file. A sub-national location
+is named by its canonical name, for example "Brno,South Moravian Region,Czechia".
+"""
+import array
+import collections
+import csv
+import dataclasses
+import functools
+import os
+import sqlite3
+import threading
+
+from share_of_search.fuzzy import edit_distance, fold_text, max_edits, trigrams
+
+# Dictionary of countries and their geo target IDs
+COUNTRY_MAPPING = {
+    "All Countries": "all",
+    "Afghanistan": "2004",
+    "Albania": "2008",
+    "Algeria": "2012",
+    "American Samoa": "2016",
+    "Andorra": "2020",
+    "Angola": "2024",
+    "Anguilla": "2660",
+    "Antarctica": "2010",
+    "Antigua and Barbuda": "2028",
+    "Argentina": "2032",
+    "Armenia": "2051",
+    "Aruba": "2533",
+    "Australia": "2036",
+    "Austria": "2040",
+    "Azerbaijan": "2031",
+    "Bahamas": "2044",
+    "Bahrain": "2048",
+    "Bangladesh": "2050",
+    "Barbados": "2052",
+    "Belarus": "2112",
+    "Belgium": "2056",
+    "Belize": "2084",
+    "Benin": "2204",
+    "Bermuda": "2060",
+    "Bhutan": "2064",
+    "Bolivia": "2068",
+    "Bosnia and Herzegovina": "2070",
+    "Botswana": "2072",
+    "Bouvet Island": "2074",
+    "Brazil": "2076",
+    "British Indian Ocean Territory": "2086",
+    "Brunei": "2096",
+    "Bulgaria": "2100",
+    "Burkina Faso": "2854",
+    "Burundi": "2108",
+    "Cambodia": "2116",
+    "Cameroon": "2120",
+    "Canada": "2124",
+    "Cape Verde": "2132",
+    "Cayman Islands": "2136",
+    "Central African Republic": "2140",
+    "Chad": "2148",
+    "Chile": "2152",
+    "China": "2156",
+    "Christmas Island": "2162",
+    "Cocos (Keeling) Islands": "2166",
+    "Colombia": "2170",
+    "Comoros": "2174",
+    "Congo": "2178",
+    "Cook Islands": "2184",
+    "Costa Rica": "2188",
+    "Croatia": "2191",
+    "Cuba": "2192",
+    "Cyprus": "2196",
+    "Czech Republic": "2203",
+    "Denmark": "2208",
+    "Djibouti": "2262",
+    "Dominica": "2212",
+    "Dominican Republic": "2214",
+    "East Timor": "2626",
+    "Ecuador": "2218",
+    "Egypt": "2818",
+    "El Salvador": "2222",
+    "Equatorial Guinea": "2226",
+    "Eritrea": "2232",
+    "Estonia": "2233",
+    "Ethiopia": "2231",
+    "Falkland Islands": "2238",
+    "Faroe Islands": "2234",
+    "Fiji": "2242",
+    "Finland": "2246",
+    "France": "2250",
+    "French Guiana": "2254",
+    "French Polynesia": "2258",
+    "French Southern Territories": "2260",
+    "Gabon": "2266",
+    "Gambia": "2270",
+    "Georgia": "2268",
+    "Germany": "2276",
+    "Ghana": "2288",
+    "Gibraltar": "2292",
+    "Greece": "2300",
+    "Greenland": "2304",
+    "Grenada": "2308",
+    "Guadeloupe": "2312",
+    "Guam": "2316",
+    "Guatemala": "2320",
+    "Guinea": "2324",
+    "Guinea-Bissau": "2624",
+    "Guyana": "2328",
+    "Haiti": "2332",
+    "Heard Island and McDonald Islands": "2334",
+    "Honduras": "2340",
+    "Hong Kong": "2344",
+    "Hungary": "2348",
+    "Iceland": "2352",
+    "India": "2356",
+    "Indonesia": "2360",
+    "Iran": "2364",
+    "Iraq": "2368",
+    "Ireland": "2372",
+    "Israel": "2376",
+    "Italy": "2380",
+    "Ivory Coast": "2384",
+    "Jamaica": "2388",
+    "Japan": "2392",
+    "Jordan": "2400",
+    "Kazakhstan": "2398",
+    "Kenya": "2404",
+    "Kiribati": "2296",
+    "Kuwait": "2414",
+    "Kyrgyzstan": "2417",
+    "Laos": "2418",
+    "Latvia": "2428",
+    "Lebanon": "2422",
+    "Lesotho": "2426",
+    "Liberia": "2430",
+    "Libya": "2434",
+    "Liechtenstein": "2438",
+    "Lithuania": "2440",
+    "Luxembourg": "2442",
+    "Macau": "2446",
+    "Macedonia": "2807",
+    "Madagascar": "2450",
+    "Malawi": "2454",
+    "Malaysia": "2458",
+    "Maldives": "2462",
+    "Mali": "2466",
+    "Malta": "2470",
+    "Marshall Islands": "2584",
+    "Martinique": "2474",
+    "Mauritania": "2478",
+    "Mauritius": "2480",
+    "Mayotte": "2175",
+    "Mexico": "2484",
+    "Micronesia": "2583",
+    "Moldova": "2498",
+    "Monaco": "2492",
+    "Mongolia": "2496",
+    "Montenegro": "2499",
+    "Montserrat": "2500",
+    "Morocco": "2504",
+    "Mozambique": "2508",
+    "Myanmar": "2104",
+    "Namibia": "2516",
+    "Nauru": "2520",
+    "Nepal": "2524",
+    "Netherlands": "2528",
+    "Netherlands Antilles": "2530",
+    "New Caledonia": "2540",
+    "New Zealand": "2554",
+    "Nicaragua": "2558",
+    "Niger": "2562",
+    "Nigeria": "2566",
+    "Niue": "2570",
+    "Norfolk Island": "2574",
+    "North Korea": "2408",
+    "Northern Mariana Islands": "2580",
+    "Norway": "2578",
+    "Oman": "2512",
+    "Pakistan": "2586",
+    "Palau": "2585",
+    "Palestine": "2275",
+    "Panama": "2591",
+    "Papua New Guinea": "2598",
+    "Paraguay": "2600",
+    "Peru": "2604",
+    "Philippines": "2608",
+    "Pitcairn": "2612",
+    "Poland": "2616",
+    "Portugal": "2620",
+    "Puerto Rico": "2630",
+    "Qatar": "2634",
+    "Reunion": "2638",
+    "Romania": "2642",
+    "Russia": "2643",
+    "Rwanda": "2646",
+    "Saint Helena": "2654",
+    "Saint Kitts and Nevis": "2659",
+    "Saint Lucia": "2662",
+    "Saint Pierre and Miquelon": "2666",
+    "Saint Vincent and the Grenadines": "2670",
+    "Samoa": "2882",
+    "San Marino": "2674",
+    "Sao Tome and Principe": "2678",
+    "Saudi Arabia": "2682",
+    "Senegal": "2686",
+    "Serbia": "2688",
+    "Seychelles": "2690",
+    "Sierra Leone": "2694",
+    "Singapore": "2702",
+    "Slovakia": "2703",
+    "Slovenia": "2705",
+    "Solomon Islands": "2090",
+    "Somalia": "2706",
+    "South Africa": "2710",
+    "South Georgia and the South Sandwich Islands": "2239",
+    "South Korea": "2410",
+    "Spain": "2724",
+    "Sri Lanka": "2144",
+    "Sudan": "2736",
+    "Suriname": "2740",
+    "Svalbard and Jan Mayen": "2744",
+    "Swaziland": "2748",
+    "Sweden": "2752",
+    "Switzerland": "2756",
+    "Syria": "2760",
+    "Taiwan": "2158",
+    "Tajikistan": "2762",
+    "Tanzania": "2834",
+    "Thailand": "2764",
+    "Togo": "2768",
+    "Tokelau": "2772",
+    "Tonga": "2776",
+    "Trinidad and Tobago": "2780",
+    "Tunisia": "2788",
+    "Turkey": "2792",
+    "Turkmenistan": "2795",
+    "Turks and Caicos Islands": "2796",
+    "Tuvalu": "2798",
+    "Uganda": "2800",
+    "Ukraine": "2804",
+    "United Arab Emirates": "2784",
+    "United Kingdom": "2826",
+    "United States": "2840",
+    "United States Minor Outlying Islands": "2581",
+    "Uruguay": "2858",
+    "Uzbekistan": "2860",
+    "Vanuatu": "2548",
+    "Vatican": "2336",
+    "Venezuela": "2862",
+    "Vietnam": "2704",
+    "Virgin Islands, British": "2092",
+    "Virgin Islands, U.S.": "2850",
+    "Wallis and Futuna": "2876",
+    "Western Sahara": "2732",
+    "Yemen": "2887",
+    "Zambia": "2894",
+    "Zimbabwe": "2716"
+}
+
+# Geo target used when a location name is not in the mapping (United States)
+DEFAULT_LOCATION_ID = "2840"
+
+
+# Google's geo targets file (https://developers.google.com/google-ads/api/data/geotargets); without it
+# only the countries of COUNTRY_MAPPING are indexed
+DEFAULT_GEO_TARGETS_CSV = os.environ.get(
+    "GEO_TARGETS_CSV", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "geotargets.csv")
+)
+DEFAULT_GEO_INDEX_PATH = os.environ.get(
+    "GEO_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "geo_targets.sqlite")
+)
+
+COUNTRY = "Country"
+
+# Search results list countries first, then large subdivisions, then cities and smaller targets
+TARGET_TYPE_RANKS = {
+    "Country": 0,
+    "State": 1, "Region": 1, "Province": 1, "Territory": 1, "Autonomous Community": 1, "Prefecture": 1,
+    "Department": 1, "Governorate": 1, "Canton": 1, "Okrug": 1, "Union Territory": 1,
+    "County": 2, "City Region": 2,
+    "City": 3,
+    "Municipality": 4, "District": 4, "Borough": 4, "Neighborhood": 5,
+    "Postal Code": 7,
+}
+OTHER_TARGET_TYPE_RANK = 6
+
+# Bumped whenever the index layout changes, so older index files are rebuilt
+_INDEX_VERSION = "1"
+# At most this many trigram candidates are compared by edit distance per fuzzy search
+_MAX_FUZZY_CANDIDATES = 200
+
+_GEO_SCHEMA = """
+CREATE TABLE geo_targets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    canonical_name TEXT NOT NULL,
+    parent_id INTEGER,
+    country_code TEXT NOT NULL,
+    target_type TEXT NOT NULL,
+    type_rank INTEGER NOT NULL,
+    folded TEXT NOT NULL
+);
+CREATE INDEX geo_targets_folded ON geo_targets (folded);
+CREATE INDEX geo_targets_canonical ON geo_targets (canonical_name);
+CREATE INDEX geo_targets_parent ON geo_targets (parent_id);
+CREATE TABLE geo_trigrams (trigram TEXT PRIMARY KEY, ids BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE geo_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# Location names of the COUNTRY_MAPPING countries by geo target ID, which stay valid whatever Google calls them
+_COUNTRY_NAMES = {geo_id: name for name, geo_id in COUNTRY_MAPPING.items() if geo_id.isdigit()}
+
+
+@dataclasses.dataclass(frozen=True)
+class GeoTarget:
+    """One geo target constant; ``location`` is the name reports and settings refer to it by."""
+    id: str
+    name: str
+    canonical_name: str
+    parent_id: str
+    country_code: str
+    target_type: str
+
+    @property
+    def location(self):
+        if self.target_type == COUNTRY:
+            return _COUNTRY_NAMES.get(self.id, self.name)
+        return self.canonical_name
+
+    @property
+    def label(self):
+        """Return the name with its parents and type, for example "Brno (City), South Moravian Region, Czechia"."""
+        if self.target_type == COUNTRY:
+            return self.location
+        return ", ".join([f"{self.name} ({self.target_type})", *self.canonical_name.split(",")[1:]])
+
+
+def _source_signature(csv_path):
+    if csv_path and os.path.exists(csv_path):
+        stat = os.stat(csv_path)
+        return f"{_INDEX_VERSION}:{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{_INDEX_VERSION}:countries:{len(_COUNTRY_NAMES)}"
+
+
+def _read_geo_targets(csv_path):
+    """Yield (id, name, canonical name, parent ID, country code, target type) of the active targets."""
+    if not (csv_path and os.path.exists(csv_path)):
+        for geo_id, name in _COUNTRY_NAMES.items():
+            yield geo_id, name, name, "", "", COUNTRY
+        return
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            if row.get("Status", "Active") == "Active":
+                yield (
+                    row["Criteria ID"], row["Name"], row["Canonical Name"], row["Parent ID"], row["Country Code"],
+                    row["Target Type"]
+                )
+
+
+def build_geo_index(csv_path, index_path):
+    """Compile a geo targets CSV (or, when there is none, the countries) into the SQLite index at ``index_path``.
+
+    The index is written to a temporary file and moved into place, so
+    processes reading the old index are not disturbed and concurrent builds
+    do not clash.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    temporary = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    conn = sqlite3.connect(temporary)
+    try:
+        with conn:
+            conn.executescript(_GEO_SCHEMA)
+            rows = []
+            postings = collections.defaultdict(lambda: array.array("i"))
+            for geo_id, name, canonical_name, parent_id, country_code, target_type in _read_geo_targets(csv_path):
+                folded = fold_text(name)
+                rows.append((
+                    int(geo_id), name, canonical_name, int(parent_id) if parent_id else None, country_code,
+                    target_type, TARGET_TYPE_RANKS.get(target_type, OTHER_TARGET_TYPE_RANK), folded
+                ))
+                for trigram in trigrams(folded):
+                    postings[trigram].append(int(geo_id))
+            conn.executemany("INSERT OR REPLACE INTO geo_targets VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # Each trigram's posting list is stored as one blob of 32-bit IDs
+            conn.executemany("INSERT INTO geo_trigrams VALUES (?, ?)", (
+                (trigram, ids.tobytes()) for trigram, ids in postings.items()
+            ))
+            conn.executemany("INSERT INTO geo_meta VALUES (?, ?)", [
+                ("source", _source_signature(csv_path)),
+                ("subdivisions", str(sum(row[5] != COUNTRY for row in rows))),
+            ])
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(temporary, index_path)
+
+
+class GeoTargetIndex:
+    """Read-only SQLite index of geo targets with prefix and fuzzy name search and the parent hierarchy.
+
+    The index file is (re)built from ``csv_path`` when it is missing or was
+    built from a different file. It is memory-mapped, so the processes of one
+    server share its pages, and nothing is loaded until it is queried.
+    """
+
+    def __init__(self, path=DEFAULT_GEO_INDEX_PATH, csv_path=DEFAULT_GEO_TARGETS_CSV):
+        self.path = path
+        self.csv_path = csv_path
+        if self._stored_signature() != _source_signature(csv_path):
+            build_geo_index(csv_path, path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute("PRAGMA mmap_size = 268435456")
+        self.subdivisions = int(self._query("SELECT value FROM geo_meta WHERE key = 'subdivisions'")[0][0])
+        self._countries = None
+
+    def _stored_signature(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT value FROM geo_meta WHERE key = 'source'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+    def _targets(self, where, parameters=(), order="type_rank, length(folded), name", limit=None):
+        rows = self._query(
+            f"SELECT id, name, canonical_name, parent_id, country_code, target_type FROM geo_targets WHERE {where} "
+            f"ORDER BY {order}" + (f" LIMIT {int(limit)}" if limit else ""),
+            parameters
+        )
+        return [
+            GeoTarget(str(geo_id), name, canonical_name, str(parent_id) if parent_id else "", country_code, target_type)
+            for geo_id, name, canonical_name, parent_id, country_code, target_type in rows
+        ]
+
+    def get(self, geo_id):
+        """Return the target with a geo target ID, or None."""
+        if not str(geo_id).isdigit():
+            return None
+        targets = self._targets("id = ?", (int(geo_id),))
+        return targets[0] if targets else None
+
+    def resolve(self, location):
+        """Return the target a location names (country name, canonical name or numeric ID), or None."""
+        if location in COUNTRY_MAPPING:
+            geo_id = COUNTRY_MAPPING[location]
+            return self.get(geo_id) or (
+                GeoTarget(geo_id, location, location, "", "", COUNTRY) if geo_id.isdigit() else None
+            )
+        if location.isdigit():
+            return self.get(location)
+        targets = self._targets("canonical_name = ?", (location,), limit=1)
+        return targets[0] if targets else None
+
+    def countries(self):
+        """Return the countries ordered by location name."""
+        if self._countries is None:
+            self._countries = sorted(self._targets("target_type = ?", (COUNTRY,)), key=lambda target: target.location)
+        return self._countries
+
+    def children(self, geo_id, limit=None):
+        """Return the targets whose parent is ``geo_id``, larger subdivisions first."""
+        return self._targets("parent_id = ?", (int(geo_id),), limit=limit)
+
+    def ancestors(self, geo_id):
+        """Return the parents of a target, nearest first and its country last."""
+        chain = []
+        target = self.get(geo_id)
+        while target is not None and target.parent_id and len(chain) < 10:
+            target = self.get(target.parent_id)
+            if target is not None:
+                chain.append(target)
+        return chain
+
+    def country_of(self, geo_id):
+        """Return the country a target lies in (the target itself for a country), or None."""
+        target = self.get(geo_id)
+        if target is None or target.target_type == COUNTRY:
+            return target
+        return next((parent for parent in self.ancestors(geo_id) if parent.target_type == COUNTRY), None)
+
+    def search(self, query, country_code=None, limit=20):
+        """Return targets whose name starts with ``query``, then ones within a few typos of it.
+
+        Prefix matches come first (exact names before longer ones, larger
+        target types before smaller); if they do not fill ``limit``, names
+        within max_edits(query) edits found through the trigram postings are
+        added, closest first. ``country_code`` restricts the search to one
+        country.
+        """
+        folded = fold_text(query)
+        if not folded:
+            return []
+
+        country_filter, country_parameters = (" AND country_code = ?", (country_code,)) if country_code else ("", ())
+        # The folded name index answers prefix queries as a range scan
+        results = self._targets(
+            "folded >= ? AND folded < ?" + country_filter, (folded, folded + "\uffff", *country_parameters, folded),
+            order="folded != ?, type_rank, length(folded), name", limit=limit
+        )
+
+        limit_edits = max_edits(folded)
+        if len(results) >= limit or not limit_edits:
+            return results
+
+        # A name within d edits of the query shares at least 4d fewer distinct padded trigrams than the query has
+        query_trigrams = list(trigrams(folded))
+        placeholders = ",".join("?" * len(query_trigrams))
+        counts = collections.Counter()
+        for (ids,) in self._query(f"SELECT ids FROM geo_trigrams WHERE trigram IN ({placeholders})", query_trigrams):
+            counts.update(array.array("i", ids))
+        threshold = len(query_trigrams) - 4 * limit_edits
+        candidates = [geo_id for geo_id, count in counts.most_common(_MAX_FUZZY_CANDIDATES) if count >= threshold]
+        if not candidates:
+            return results
+
+        seen = {target.id for target in results}
+        fuzzy = []
+        placeholders = ",".join("?" * len(candidates))
+        for target in self._targets(f"id IN ({placeholders})" + country_filter, (*candidates, *country_parameters)):
+            if target.id not in seen:
+                edits = edit_distance(folded, fold_text(target.name), limit_edits)
+                if edits <= limit_edits:
+                    fuzzy.append((edits, TARGET_TYPE_RANKS.get(target.target_type, OTHER_TARGET_TYPE_RANK), target))
+        fuzzy.sort(key=lambda match: match[:2])
+        return results + [target for _, _, target in fuzzy[:limit - len(results)]]
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def default_geo_index():
+    """Open (building it on first use) the process-wide index at DEFAULT_GEO_INDEX_PATH."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = GeoTargetIndex()
+        return _default_index
+
+
+@functools.lru_cache(maxsize=4096)
+def location_id(location):
+    """Return the geo target ID of a location, falling back to the United States.
+
+    A location is a COUNTRY_MAPPING country, the canonical name of a region
+    or city, or a numeric geo target ID; only names outside COUNTRY_MAPPING
+    open the geo target index.
+    """
+    if location in COUNTRY_MAPPING:
+        return COUNTRY_MAPPING[location]
+    target = default_geo_index().resolve(location)
+    return target.id if target is not None else DEFAULT_LOCATION_ID
+
+
+def is_known_location(location):
+    """Return whether a location names a country or a target of the geo target index."""
+    return location in COUNTRY_MAPPING or default_geo_index().resolve(location) is not None
+
@@ -0,0 +1,215 @@
+"""Incremental refresh of a saved report.
+
+A report run incrementally keeps a snapshot of its keyword cells (keyword,
+geo, network, month, volume and fetch time) next to its output, together with
+the report definition (network, backend and each brand's keywords) in a JSON
+file beside it. On the next run the snapshot is loaded as an in-memory
+KeywordMetricsCache, so only the keyword/geo/network months it does not hold
+yet (or whose recent months have expired) are requested. The shares of every
+period are then recalculated from the cells, which needs no requests, so
+periods stay consistent when brands or their keywords change. The periods
+that are counted as refreshed are the ones holding newly requested months, or
+every period when the definition differs from the snapshot's.
+"""
+import json
+import os
+
+from share_of_search.aggregation import build_periods, month_range, period_label
+from share_of_search.cache import KeywordMetricsCache, missing_months
+from share_of_search.geo import location_id
+from share_of_search.keyword_planner import fetch_location_matrices
+from share_of_search.planner import brand_keywords, unique_keywords
+from share_of_search.scheduler import PRIORITY_NORMAL
+
+SNAPSHOT_COLUMNS = ["keyword", "geo", "network", "year", "month", "volume", "fetched_at"]
+# Columns of snapshots and outputs read back as written, so keywords and brands like "NA" or "2024" stay strings
+_TEXT_COLUMNS = ("keyword", "geo", "network", "brand", "location", "period", "color")
+_NUMERIC_COLUMNS = ("year", "month", "volume", "fetched_at", "share")
+
+
+def _read_table(path):
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(
+        path, dtype=dict.fromkeys(_TEXT_COLUMNS, str), keep_default_na=False,
+        na_values=dict.fromkeys(_NUMERIC_COLUMNS, [""])
+    )
+
+
+def _reported_brands(brands):
+    return [brand for brand in brands if brand["name"] and any(k.strip() for k in brand["keywords"])]
+
+
+def _definition_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def report_definition(brands, settings):
+    """Return what the cells of a report depend on: its network, fetch backend and each brand's keywords."""
+    return {
+        "network": settings["network"],
+        "backend": settings.get("backend", "ideas"),
+        "brands": {brand["name"]: sorted(set(brand_keywords(brand))) for brand in _reported_brands(brands)},
+    }
+
+
+def load_snapshot(path):
+    """Load a snapshot into an in-memory cache and return it with the report definition saved with it.
+
+    A missing file gives an empty cache, and a missing definition None.
+    """
+    cache = KeywordMetricsCache(":memory:")
+    if os.path.exists(path):
+        frame = _read_table(path)[SNAPSHOT_COLUMNS]
+        cache.import_rows(
+            (keyword, str(geo), network, int(year), int(month), int(volume), float(fetched_at))
+            for keyword, geo, network, year, month, volume, fetched_at in frame.itertuples(index=False, name=None)
+        )
+    definition = None
+    if os.path.exists(_definition_path(path)):
+        with open(_definition_path(path), encoding="utf-8") as f:
+            definition = json.load(f)
+    return cache, definition
+
+
+def save_snapshot(cache, path, definition):
+    """Write every cell of ``cache`` to a CSV or Parquet snapshot and ``definition`` to the JSON file beside it."""
+    import pandas as pd
+
+    frame = pd.DataFrame(cache.export_rows(), columns=SNAPSHOT_COLUMNS)
+    if path.endswith(".parquet"):
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+    with open(_definition_path(path), "w", encoding="utf-8") as f:
+        json.dump(definition, f, indent=2, ensure_ascii=False)
+
+
+def load_previous_results(path):
+    """Read a previous report output, or return None if there is none yet."""
+    return _read_table(path) if os.path.exists(path) else None
+
+
+def stale_periods(cache, brands, settings, locations):
+    """Return {location: period labels} of the periods holding months that are not in ``cache``."""
+    months = month_range(settings["dateFrom"], settings["dateTo"])
+    keywords = unique_keywords(brand_keywords(brand) for brand in _reported_brands(brands))
+    stale = {}
+    for location in locations:
+        cached = cache.lookup(keywords, location_id(location), settings["network"], months)
+        stale[location] = {
+            period_label(year, month, settings["granularity"]) for year, month in missing_months(cached, keywords, months)
+        }
+    return stale
+
+
+def window_periods(settings):
+    """Return the period labels of the report window in order."""
+    return [label for label, _ in build_periods(settings["dateFrom"], settings["dateTo"], settings["granularity"])]
+
+
+def affected_periods(previous, stale, settings, locations, changed=False):
+    """Return {location: labels} of the window periods whose volumes are refreshed.
+
+    A period is affected when it holds a stale month or has no rows in the
+    previous result set, so a widened date range or a first run refreshes
+    everything it has not reported before. When the report definition
+    ``changed``, every period is affected.
+    """
+    labels = window_periods(settings)
+    if changed:
+        return {location: set(labels) for location in locations}
+    reported = set()
+    if previous is not None:
+        previous_locations = previous["location"] if len(locations) > 1 else [locations[0]] * len(previous)
+        reported = set(zip(previous_locations, previous["period"].astype(str)))
+    return {
+        location: {label for label in labels if label in stale[location] or (location, label) not in reported}
+        for location in locations
+    }
+
+
+def merge_results(previous, fresh, affected, window, brand_names, locations):
+    """Replace the affected periods of ``previous`` with ``fresh`` rows.
+
+    Previous rows outside the current window or for brands no longer in the
+    report are dropped; the result keeps the report's brand and period order.
+    """
+    import pandas as pd
+
+    from share_of_search.matrix import compact_results
+
+    multi_location = len(locations) > 1
+    columns = list(fresh.columns)
+    if previous is None or previous.empty:
+        merged = fresh
+    else:
+        previous_locations = previous["location"] if multi_location else [locations[0]] * len(previous)
+        window = set(window)
+        brands = set(brand_names)
+        keep = [
+            location in affected and brand in brands and period in window and period not in affected[location]
+            for location, brand, period in zip(previous_locations, previous["brand"], previous["period"].astype(str))
+        ]
+        merged = pd.concat([previous[keep][columns].astype({"period": str}), fresh], ignore_index=True)
+
+    merged = compact_results(merged)
+    order = {
+        "_location": (
+            merged["location"].astype(str).map({location: i for i, location in enumerate(locations)})
+            if multi_location else 0
+        ),
+        "_brand": merged["brand"].astype(str).map({brand: i for i, brand in enumerate(brand_names)}),
+    }
+    return (
+        merged.assign(**order)
+        .sort_values(["_location", "_brand", "period"], kind="stable")
+        .drop(columns=list(order))
+        .reset_index(drop=True)
+    )
+
+
+def refresh_search_volumes(brands, settings, locations, client, customer_id, previous, cache, definition=None,
+                           scheduler=None, priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Bring a previous result set up to date, fetching only the cells that are missing.
+
+    ``cache`` and ``definition`` usually come from load_snapshot. The cache is
+    read to find the stale months and receives the newly fetched cells; if
+    the definition was saved for another fetch backend, its cells are
+    dropped and fetched again. The shares of every period of a fetched
+    location are recalculated from the full brand x month matrix; a location
+    whose fetch failed keeps its previous rows. Returns the merged results,
+    the FetchError records and the number of (location, period) pairs that
+    were refreshed.
+    """
+    import pandas as pd
+
+    from share_of_search.matrix import RESULT_COLUMNS, aggregate_matrix, concat_location_frames, to_results_frame
+
+    current = report_definition(brands, settings)
+    if definition is not None and definition.get("backend") != current["backend"]:
+        cache.clear()
+    stale = stale_periods(cache, brands, settings, locations)
+    affected = affected_periods(previous, stale, settings, locations, changed=definition != current)
+    matrices, errors = fetch_location_matrices(
+        brands, settings, locations, client, customer_id,
+        cache=cache, scheduler=scheduler, priority=priority, stats=stats, single_flight=single_flight
+    )
+
+    frames = {
+        location: to_results_frame(aggregate_matrix(matrix, settings["granularity"]), colors)
+        for location, (matrix, colors) in matrices.items()
+    }
+    # A fetched location replaces all of its rows; one whose fetch failed keeps its previous rows
+    window = window_periods(settings)
+    replaced = {location: set(window) if location in matrices else set() for location in locations}
+    if len(locations) > 1:
+        fresh = concat_location_frames(frames)
+    else:
+        fresh = frames.get(locations[0], pd.DataFrame(columns=RESULT_COLUMNS))
+
+    brand_names = [brand["name"] for brand in _reported_brands(brands)]
+    merged = merge_results(previous, fresh, replaced, window, brand_names, locations)
+    return merged, errors, sum(len(affected[location]) for location in matrices)
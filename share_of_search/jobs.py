@@ -0,0 +1,533 @@
+"""Background report jobs that outlive the Streamlit script run that started them.
+
+Generating a report enqueues a job in a SQLite job table and a process pool
+fetches it, so no script thread waits on Keyword Planner requests, and a
+rerun, a closed tab or a reconnecting browser does not lose the run. Every
+brand is written to the table as soon as its requests finish; that is what
+the UI polls for its progress bar and partial chart, and the records of the
+finished job are what the session keeps as its monthly volumes.
+
+Jobs are keyed by the brands, keywords, locations, network, endpoint and
+month range they fetch. Enqueueing a job identical to one that is queued,
+running, or finished without errors less than ``reuse_seconds`` ago returns
+that job instead of adding another one.
+
+Worker processes are started with spawn (forking the threaded Streamlit
+server is not safe) and each builds one Google Ads client, request scheduler,
+single-flight layer and keyword cache for all the jobs it runs. The request
+rate and daily budget are split evenly between the workers, and the keyword
+cache is shared through its SQLite file. With ``processes=False`` the jobs
+run on threads of the calling process instead, sharing one of each.
+
+A running job is leased to the worker that started it, which renews the
+lease with a heartbeat ``HEARTBEATS_PER_LEASE`` times per lease. Creating a
+queue starts the queued jobs again, and every queue takes over running jobs
+once their lease has expired (their server stopped), so a restarted server
+resumes them while a rebuilt queue or a second server sharing the job table
+never runs a job twice. A worker that lost its lease stops, and its late
+writes are ignored.
+"""
+import contextlib
+import dataclasses
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from share_of_search.aggregation import month_range
+from share_of_search.cache import DEFAULT_CACHE_PATH, KeywordMetricsCache
+from share_of_search.errors import FetchError
+from share_of_search.fetch import DEFAULT_MAX_WORKERS
+from share_of_search.keyword_planner import BrandVolumes, load_google_ads_client, stream_brand_volumes
+from share_of_search.planner import brand_keywords
+from share_of_search.pool import DEFAULT_KEEPALIVE_SECONDS, DEFAULT_POOL_SIZE, PooledGoogleAdsClient
+from share_of_search.scheduler import DEFAULT_REQUESTS_PER_SECOND, PRIORITY_INTERACTIVE, RequestScheduler, SchedulerStats
+from share_of_search.singleflight import SingleFlight
+from share_of_search.tracing import Tracer, activate, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_PATH = os.environ.get(
+    "REPORT_JOBS_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "report_jobs.sqlite")
+)
+
+# Worker processes, and how long a finished job answers identical new ones
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_REUSE_SECONDS = 900
+
+# Finished jobs older than this are deleted when a queue is created
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+# A running job whose lease was not renewed for DEFAULT_LEASE_SECONDS is considered abandoned and queued again;
+# its worker renews the lease HEARTBEATS_PER_LEASE times per lease, and queues look for expired leases as often
+DEFAULT_LEASE_SECONDS = 60
+HEARTBEATS_PER_LEASE = 6
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    brands TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    locations TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    failed_brands INTEGER NOT NULL DEFAULT 0,
+    requests TEXT,
+    spans TEXT,
+    error TEXT,
+    owner TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (key, created_at);
+CREATE TABLE IF NOT EXISTS job_brands (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    brand TEXT NOT NULL,
+    location TEXT NOT NULL,
+    color TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    volumes TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+_JOB_COLUMNS = ("id, key, status, brands, settings, locations, total, created_at, started_at, finished_at, "
+                "cancel_requested, failed_brands, requests, spans, error, owner, heartbeat_at")
+# Columns added after the first release of the job table, with their types
+_ADDED_COLUMNS = (("owner", "TEXT"), ("heartbeat_at", "REAL"))
+
+
+@dataclasses.dataclass(frozen=True)
+class Job:
+    """One row of the job table; ``fetched`` counts the brand records written so far.
+
+    ``owner`` identifies the run of a worker holding a running job's lease,
+    which it last renewed at ``heartbeat_at``.
+    """
+
+    id: str
+    key: str
+    status: str
+    brands: list
+    settings: dict
+    locations: list
+    total: int
+    created_at: float
+    started_at: float = None
+    finished_at: float = None
+    cancel_requested: bool = False
+    failed_brands: int = 0
+    requests: dict = None
+    spans: list = None
+    error: str = None
+    owner: str = None
+    heartbeat_at: float = None
+    fetched: int = 0
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+
+def job_key(brands, settings, locations):
+    """Return the key under which identical report jobs are deduplicated.
+
+    Debug timings are part of the key, as only a job started with them
+    records the fetch spans.
+    """
+    return hashlib.sha256(json.dumps([
+        [[brand["name"], brand_keywords(brand)] for brand in brands],
+        list(locations),
+        settings["network"],
+        settings.get("backend", "ideas"),
+        settings["dateFrom"],
+        settings["dateTo"],
+        settings.get("useCache", True),
+        bool(settings.get("debugTimings")),
+    ]).encode()).hexdigest()
+
+
+def _fetch_error(payload):
+    if payload is None:
+        return None
+    fields = json.loads(payload)
+    return FetchError(
+        brands=tuple(fields["brands"]), message=fields["message"], details=tuple(fields["details"]),
+        code=fields["code"], location=fields["location"]
+    )
+
+
+class JobStore:
+    """The SQLite job table; one instance per process, safe to share between its threads."""
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in _ADDED_COLUMNS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _job(self, row, fetched):
+        (job_id, key, status, brands, settings, locations, total, created_at, started_at, finished_at,
+         cancel_requested, failed_brands, requests, spans, error, owner, heartbeat_at) = row
+        return Job(
+            id=job_id, key=key, status=status, brands=json.loads(brands), settings=json.loads(settings),
+            locations=json.loads(locations), total=total, created_at=created_at, started_at=started_at,
+            finished_at=finished_at, cancel_requested=bool(cancel_requested), failed_brands=failed_brands,
+            requests=json.loads(requests) if requests else None, spans=json.loads(spans) if spans else None,
+            error=error, owner=owner, heartbeat_at=heartbeat_at, fetched=fetched
+        )
+
+    def get(self, job_id):
+        """Return the Job with ``job_id``, or None when there is none."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            fetched = self._conn.execute("SELECT COUNT(*) FROM job_brands WHERE job_id = ?", (job_id,)).fetchone()[0]
+        return self._job(row, fetched)
+
+    def create(self, brands, settings, locations, reuse_seconds=DEFAULT_REUSE_SECONDS):
+        """Add a queued job, or return an identical one; returns ``(job, created)``."""
+        key = job_key(brands, settings, locations)
+        now = time.time()
+        with self._lock, self._conn:
+            existing = self._conn.execute(
+                "SELECT id FROM jobs WHERE key = ? AND cancel_requested = 0 AND "
+                "(status IN (?, ?) OR (status = ? AND failed_brands = 0 AND finished_at >= ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, QUEUED, RUNNING, DONE, now - reuse_seconds)
+            ).fetchone()
+            if existing is None:
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, key, status, brands, settings, locations, total, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, QUEUED, json.dumps(brands), json.dumps(settings), json.dumps(list(locations)),
+                     len(brands) * len(locations), now)
+                )
+        if existing is not None:
+            return self.get(existing[0]), False
+        return self.get(job_id), True
+
+    def start(self, job_id):
+        """Mark a queued job as running under a new lease and return it; None when it was cancelled or already taken.
+
+        The returned job's ``owner`` is the lease the worker passes to
+        heartbeat, add_record and finish.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = ? AND cancel_requested = 0",
+                (RUNNING, now, uuid.uuid4().hex, now, job_id, QUEUED)
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                    (CANCELLED, time.time(), job_id, QUEUED)
+                )
+                return None
+        return self.get(job_id)
+
+    def heartbeat(self, job_id, owner):
+        """Renew the lease of a running job; returns False when ``owner`` no longer holds it."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (time.time(), job_id, RUNNING, owner)
+            )
+        return cursor.rowcount == 1
+
+    def add_record(self, job_id, seq, record, owner=None):
+        """Store the BrandVolumes record of one brand and location; returns True when the worker should stop.
+
+        With ``owner`` the record is only stored (and the lease renewed)
+        while that lease holds the job; a worker whose job was taken over is
+        told to stop, as it is when cancelling was requested.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT cancel_requested, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or (owner is not None and row[1] != owner):
+                return True
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_brands VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, seq, record.brand, record.location, record.color, record.seconds,
+                 json.dumps(list(record.volumes), default=int),
+                 json.dumps(record.error.as_dict()) if record.error is not None else None)
+            )
+            if owner is not None:
+                self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            return bool(row[0])
+
+    def records(self, job_id):
+        """Return the BrandVolumes records of a job in the order they arrived."""
+        with self._lock:
+            job = self._conn.execute("SELECT settings FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            rows = self._conn.execute(
+                "SELECT brand, location, color, seconds, volumes, error FROM job_brands WHERE job_id = ? ORDER BY seq",
+                (job_id,)
+            ).fetchall()
+        if job is None:
+            return []
+        settings = json.loads(job[0])
+        months = tuple(month_range(settings["dateFrom"], settings["dateTo"]))
+        # Brands of one failed request share one FetchError object, as they do when streamed
+        errors = {}
+        return [
+            BrandVolumes(
+                brand=brand, location=location, color=color, months=months, volumes=tuple(json.loads(volumes)),
+                seconds=seconds, error=errors.setdefault(error, _fetch_error(error)) if error else None
+            )
+            for brand, location, color, seconds, volumes, error in rows
+        ]
+
+    def finish(self, job_id, status, requests=None, spans=None, error=None, owner=None):
+        """Record the outcome of a running job; with ``owner``, only while that lease holds it."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, requests = ?, spans = ?, error = ?, "
+                "failed_brands = (SELECT COUNT(*) FROM job_brands WHERE job_id = ? AND error IS NOT NULL) "
+                "WHERE id = ? AND status IN (?, ?) AND (? IS NULL OR owner = ?)",
+                (status, time.time(), json.dumps(requests) if requests is not None else None,
+                 json.dumps(spans, default=str) if spans is not None else None, error, job_id, job_id, QUEUED, RUNNING,
+                 owner, owner)
+            )
+
+    def request_cancel(self, job_id):
+        """Ask the worker to stop a job after the brand it is fetching; a queued job never starts."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)", (job_id, QUEUED, RUNNING)
+            )
+
+    def requeue_expired(self, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Queue the running jobs whose lease expired again and return the IDs of those this call requeued.
+
+        A running job whose worker renewed its lease in the last
+        ``lease_seconds`` is left alone.
+        """
+        expired = time.time() - lease_seconds
+        requeued = []
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)", (RUNNING, expired)
+            ).fetchall()
+            for (job_id,) in rows:
+                # Another queue may have taken the job over since the query
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                    "WHERE id = ? AND status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                    (QUEUED, job_id, RUNNING, expired)
+                )
+                if cursor.rowcount == 1:
+                    self._conn.execute("DELETE FROM job_brands WHERE job_id = ?", (job_id,))
+                    requeued.append(job_id)
+        return requeued
+
+    def queued(self):
+        """Return the IDs of the queued jobs, oldest first.
+
+        They may also be submitted by another live queue; start lets only one
+        worker take each of them.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def purge(self, max_age=DEFAULT_RETENTION_SECONDS):
+        """Delete finished jobs older than ``max_age`` seconds and return how many were removed."""
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM job_brands WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)", (cutoff,)
+            )
+            cursor = self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        return cursor.rowcount
+
+
+def pooled_google_ads_client(secrets, size=DEFAULT_POOL_SIZE, keepalive_seconds=DEFAULT_KEEPALIVE_SECONDS):
+    """Build a pooled Google Ads client from credentials, for use as the ``client_factory`` of a JobQueue."""
+    return PooledGoogleAdsClient(load_google_ads_client(secrets), size=size, keepalive_seconds=keepalive_seconds)
+
+
+# Per worker process: the job table, client, scheduler, single-flight layer and keyword cache set up by _init_worker
+_worker = {}
+
+
+def _init_worker(client_factory, customer_id, path, requests_per_second, daily_operations, max_concurrent,
+                 keyword_cache_path, lease_seconds):
+    _worker.update(
+        store=JobStore(path),
+        heartbeat_seconds=lease_seconds / HEARTBEATS_PER_LEASE,
+        client=client_factory(),
+        customer_id=customer_id,
+        scheduler=RequestScheduler(
+            requests_per_second=requests_per_second, daily_operations=daily_operations, max_concurrent=max_concurrent
+        ),
+        single_flight=SingleFlight(),
+        keyword_cache=KeywordMetricsCache(keyword_cache_path) if keyword_cache_path else None,
+    )
+
+
+def run_job(job_id):
+    """Fetch one job in a worker process, writing each brand as it arrives and the outcome at the end."""
+    store = _worker["store"]
+    job = store.start(job_id)
+    if job is None:
+        return
+
+    # Renew the lease while the job runs, so no other queue takes it over
+    stopped = threading.Event()
+
+    def renew_lease():
+        while not stopped.wait(_worker["heartbeat_seconds"]):
+            if not store.heartbeat(job_id, job.owner):
+                logger.warning("Report job %s was taken over by another worker", job_id)
+                return
+
+    threading.Thread(target=renew_lease, name=f"report-job-lease-{job_id[:8]}", daemon=True).start()
+    stats = SchedulerStats()
+    tracer = Tracer() if job.settings.get("debugTimings") else None
+    status, error = DONE, None
+    try:
+        with activate(tracer):
+            stream = stream_brand_volumes(
+                job.brands,
+                job.settings,
+                job.locations,
+                _worker["client"],
+                _worker["customer_id"],
+                cache=_worker["keyword_cache"] if job.settings.get("useCache", True) else None,
+                scheduler=_worker["scheduler"],
+                priority=PRIORITY_INTERACTIVE,
+                stats=stats,
+                single_flight=_worker["single_flight"]
+            )
+            with span("fetch.report", brands=len(job.brands), locations=len(job.locations)), contextlib.closing(stream):
+                for seq, record in enumerate(stream):
+                    if store.add_record(job_id, seq, record, job.owner):
+                        # Closing the stream drops the requests that have not started
+                        status = CANCELLED
+                        break
+    except Exception as e:
+        logger.exception("Report job %s failed", job_id)
+        status, error = FAILED, str(e)
+    finally:
+        stopped.set()
+    store.finish(job_id, status, stats.as_dict(), tracer.spans() if tracer is not None else None, error, job.owner)
+
+
+class JobQueue:
+    """Runs report jobs on a process pool and tracks them in a JobStore.
+
+    ``client_factory`` is called once in every worker process to build its
+    Google Ads client, so it must be picklable (a module-level function or a
+    functools.partial of one, such as ``pooled_google_ads_client``). Only one
+    queue with ``processes=False`` can exist per process. Every queue sharing
+    ``path`` must use the same ``lease_seconds``.
+    """
+
+    def __init__(self, client_factory, customer_id, path=DEFAULT_JOBS_PATH, workers=DEFAULT_JOB_WORKERS,
+                 processes=True, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, daily_operations=None,
+                 max_concurrent=DEFAULT_MAX_WORKERS, keyword_cache_path=DEFAULT_CACHE_PATH,
+                 reuse_seconds=DEFAULT_REUSE_SECONDS, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.store = JobStore(path)
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.reuse_seconds = reuse_seconds
+        self.lease_seconds = lease_seconds
+        # Every worker process gets its share of the request rate, daily budget and requests in flight
+        shares = self.workers if processes else 1
+        self._initargs = (
+            client_factory, customer_id, path, requests_per_second / shares,
+            daily_operations // shares if daily_operations else None,
+            max(1, max_concurrent // shares) if max_concurrent else None, keyword_cache_path, lease_seconds
+        )
+        if not processes:
+            _init_worker(*self._initargs)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self.store.purge()
+        self.store.requeue_expired(lease_seconds)
+        for job_id in self.store.queued():
+            self._submit(job_id)
+        self._closed = threading.Event()
+        threading.Thread(target=self._take_over_expired, name="report-job-leases", daemon=True).start()
+
+    def _new_executor(self):
+        if not self.processes:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-job")
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=self._initargs
+        )
+
+    def _take_over_expired(self):
+        # A server that stopped mid-job leaves it running; the job is resumed here once its lease expires
+        while not self._closed.wait(self.lease_seconds / HEARTBEATS_PER_LEASE):
+            for job_id in self.store.requeue_expired(self.lease_seconds):
+                self._submit(job_id)
+
+    def _submit(self, job_id):
+        with self._lock:
+            try:
+                future = self._executor.submit(run_job, job_id)
+            except BrokenProcessPool:
+                # A worker died (and took the pool with it); later jobs get a fresh pool
+                self._executor = self._new_executor()
+                future = self._executor.submit(run_job, job_id)
+        future.add_done_callback(lambda done: self._job_done(job_id, done))
+
+    def _job_done(self, job_id, future):
+        error = future.exception() if not future.cancelled() else None
+        if error is not None:
+            # run_job records its own failures, so this is a worker that could not start or crashed
+            self.store.finish(job_id, FAILED, error=f"The report worker stopped: {error}")
+
+    def enqueue(self, brands, settings, locations):
+        """Queue a report job, or return the identical job that is queued, running or recently finished."""
+        job, created = self.store.create(brands, settings, locations, self.reuse_seconds)
+        if created:
+            self._submit(job.id)
+        return job
+
+    def job(self, job_id):
+        return self.store.get(job_id)
+
+    def records(self, job_id):
+        return self.store.records(job_id)
+
+    def cancel(self, job_id):
+        self.store.request_cancel(job_id)
+
+    def close(self):
+        self._closed.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
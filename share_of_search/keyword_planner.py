@@ -0,0 +1,403 @@
+"""Keyword Planner requests and the fetch pipeline behind get_search_volumes.
+
+Nothing here depends on Streamlit: the caller passes the Google Ads client,
+customer ID and optional keyword cache, and failures come back as FetchError
+records, so the same pipeline serves the app, the batch CLI and benchmarks.
+google-ads, pandas and NumPy are imported on first use, which keeps importing
+this module cheap.
+"""
+import calendar
+import dataclasses
+import time
+from datetime import datetime
+
+from share_of_search.aggregation import (
+    index_historical_metrics, index_keyword_monthly_volumes, month_range, sum_keyword_volumes
+)
+from share_of_search.cache import missing_months
+from share_of_search.errors import fetch_error_from_exception
+from share_of_search.fetch import DEFAULT_MAX_WORKERS, fetch_all, iter_fetch
+from share_of_search.geo import location_id
+from share_of_search.planner import BATCH_SIZES, brand_keywords, plan_keyword_batches, unique_keywords
+from share_of_search.scheduler import PRIORITY_NORMAL, LimitedScheduler, RequestScheduler
+from share_of_search.singleflight import request_key
+from share_of_search.tracing import span
+
+# Secret / environment variable names of the Google Ads credentials
+CREDENTIAL_KEYS = {
+    "developer_token": "GOOGLE_DEVELOPER_TOKEN",
+    "client_id": "GOOGLE_CLIENT_ID",
+    "client_secret": "GOOGLE_CLIENT_SECRET",
+    "refresh_token": "GOOGLE_REFRESH_TOKEN",
+    "login_customer_id": "GOOGLE_LOGIN_CUSTOMER_ID",
+}
+
+# Colour of brands that do not define one
+DEFAULT_BRAND_COLOR = "#7f7f7f"
+
+
+def load_google_ads_client(secrets):
+    """Create a Google Ads API client from a mapping of GOOGLE_* credential names."""
+    from google.ads.googleads.client import GoogleAdsClient
+
+    credentials = {option: secrets[key] for option, key in CREDENTIAL_KEYS.items()}
+    credentials["use_proto_plus"] = True
+    return GoogleAdsClient.load_from_dict(credentials)
+
+
+def configure_keyword_request(client, request, customer_id, settings, first_month, last_month):
+    """Fill in the customer, geo target, network and historical month range of a Keyword Planner request."""
+    start_date = datetime(first_month[0], first_month[1], 1)
+    end_date = datetime(last_month[0], last_month[1], 1)
+
+    request.customer_id = customer_id
+
+    # Add geo target constants if not "All Countries"
+    if settings["location"] != "All Countries":
+        googleads_service = client.get_service("GoogleAdsService")
+        request.geo_target_constants.append(googleads_service.geo_target_constant_path(location_id(settings["location"])))
+
+    # Set network based on settings
+    if settings["network"] == "GOOGLE_SEARCH":
+        request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH
+    else:  # GOOGLE_SEARCH_AND_PARTNERS
+        request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH_AND_PARTNERS
+
+    year_month_range = request.historical_metrics_options.year_month_range
+
+    year_month_range.start.year = start_date.year
+    year_month_range.start.month = client.enums.MonthOfYearEnum[calendar.month_name[start_date.month].upper()]
+
+    # End date +1 logic
+    end_month = end_date.month + 1
+    end_year = end_date.year
+    if end_month > 12:
+        end_month = 1
+        end_year += 1
+    year_month_range.end.year = end_year
+    year_month_range.end.month = client.enums.MonthOfYearEnum[calendar.month_name[end_month].upper()]
+
+    return request
+
+
+def fetch_keyword_monthly_volumes(client, customer_id, keywords, settings, first_month, last_month):
+    """Request metrics for a batch of keywords and return a keyword -> {(year, month): volume} table."""
+    keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
+
+    if settings.get("backend", "ideas") == "historical":
+        # Historical metrics only return the requested keywords
+        with span("request.build", keywords=len(keywords)):
+            request = client.get_type("GenerateKeywordHistoricalMetricsRequest")
+            request.keywords.extend(keywords)
+            configure_keyword_request(client, request, customer_id, settings, first_month, last_month)
+        with span("rpc.generate_keyword_historical_metrics", keywords=len(keywords)):
+            response = keyword_plan_idea_service.generate_keyword_historical_metrics(request=request)
+        with span("response.index", keywords=len(keywords)):
+            return index_historical_metrics(response, keywords)
+
+    # Keyword ideas return the seeds among many related ideas
+    with span("request.build", keywords=len(keywords)):
+        request = client.get_type("GenerateKeywordIdeasRequest")
+        request.keyword_seed.keywords.extend(keywords)
+        configure_keyword_request(client, request, customer_id, settings, first_month, last_month)
+    with span("rpc.generate_keyword_ideas", keywords=len(keywords)):
+        response = keyword_plan_idea_service.generate_keyword_ideas(request=request)
+
+    # Walk the response once into a keyword -> (year, month) -> volume table
+    with span("response.index", keywords=len(keywords)):
+        return index_keyword_monthly_volumes(response, keywords)
+
+
+def fetch_keyword_ideas(client, customer_id, keywords, settings, first_month, last_month):
+    """Request keyword ideas for a batch of seed keywords and return every idea's {(year, month): volume} table.
+
+    Unlike fetch_keyword_monthly_volumes, the ideas that are not seeds are
+    kept; brand variant discovery looks for misspellings and longer queries
+    among them.
+    """
+    keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
+    with span("request.build", keywords=len(keywords)):
+        request = client.get_type("GenerateKeywordIdeasRequest")
+        request.keyword_seed.keywords.extend(keywords)
+        configure_keyword_request(client, request, customer_id, settings, first_month, last_month)
+    with span("rpc.generate_keyword_ideas", keywords=len(keywords)):
+        response = keyword_plan_idea_service.generate_keyword_ideas(request=request)
+    with span("response.index", keywords=len(keywords)):
+        return index_keyword_monthly_volumes(response, None)
+
+
+@dataclasses.dataclass(frozen=True)
+class BrandVolumes:
+    """Monthly volumes of one brand in one location, as yielded by stream_brand_volumes.
+
+    ``volumes`` is aligned with ``months`` and empty when ``error`` (a
+    FetchError) is set; ``seconds`` is the time from the start of the stream
+    until the brand's last request finished.
+    """
+    brand: str
+    location: str
+    color: str
+    months: tuple
+    volumes: tuple
+    seconds: float
+    error: object = None
+
+
+def _plan_location(brands, settings, location, cache):
+    """Work out which keywords and months of one location have to be requested."""
+    # Cache cells are keyed by keyword, geo target, network and month
+    months = month_range(settings["dateFrom"], settings["dateTo"])
+    geo = location_id(location)
+
+    # Collect the normalised keywords of each valid brand
+    brand_jobs = [
+        (brand, brand_keywords(brand)) for brand in brands
+        if brand["name"] and any(k.strip() for k in brand["keywords"])
+    ]
+    all_keywords = unique_keywords(keywords for _, keywords in brand_jobs)
+
+    # Only keywords with cells missing from the cache need to be requested
+    with span("cache.lookup", location=location, keywords=len(all_keywords)):
+        keyword_volumes = cache.lookup(all_keywords, geo, settings["network"], months) if cache else {}
+    stale_keywords = [k for k in all_keywords if missing_months(keyword_volumes, [k], months)]
+
+    brands_of_keyword = {}
+    for index, (_, keywords) in enumerate(brand_jobs):
+        for keyword in keywords:
+            brands_of_keyword.setdefault(keyword, []).append(index)
+
+    return {
+        "location": location,
+        "settings": {**settings, "location": location},
+        "geo": geo,
+        "months": months,
+        "brand_jobs": brand_jobs,
+        "brands_of_keyword": brands_of_keyword,
+        "keyword_volumes": keyword_volumes,
+        "stale_keywords": set(stale_keywords),
+        "stale_months": missing_months(keyword_volumes, stale_keywords, months),
+        # Fetch the stale keywords of all brands in as few batched requests as possible
+        "batches": plan_keyword_batches(stale_keywords, BATCH_SIZES[settings.get("backend", "ideas")]),
+    }
+
+
+def _iter_brand_volumes(plans, settings, client, customer_id, cache, scheduler, priority, stats, single_flight):
+    """Run the batches of every plan and yield ``(plan, brand index, error, seconds)`` as brands complete.
+
+    A brand is complete once every batch holding one of its keywords has
+    finished; brands served entirely from the cache are yielded first. The
+    fetched cells are added to each plan's ``keyword_volumes`` (and ``cache``)
+    on the consuming thread.
+    """
+    start = time.perf_counter()
+    remaining = [[len(plan["stale_keywords"].intersection(keywords)) for _, keywords in plan["brand_jobs"]] for plan in plans]
+    failures = [{} for _ in plans]
+
+    for plan, counts in zip(plans, remaining):
+        for index, count in enumerate(counts):
+            if count == 0:
+                yield plan, index, None, 0.0
+
+    def send(plan, batch):
+        args = (client, customer_id, batch, plan["settings"], plan["stale_months"][0], plan["stale_months"][-1])
+        if scheduler is None:
+            return fetch_keyword_monthly_volumes(*args)
+        return scheduler.call(fetch_keyword_monthly_volumes, *args, priority=priority, stats=stats)
+
+    def fetch_batch(job):
+        plan, batch = plans[job[0]], job[1]
+        with span("fetch.batch", location=plan["location"], keywords=len(batch)) as attributes:
+            if single_flight is None:
+                return send(plan, batch)
+
+            # Identical requests already in flight for another session or job are awaited instead of sent
+            key = request_key(customer_id, plan["settings"], batch, plan["stale_months"][0], plan["stale_months"][-1])
+            fetched, coalesced = single_flight.call(key, send, plan, batch)
+            if attributes is not None:
+                attributes["coalesced"] = coalesced
+            if coalesced and stats is not None:
+                stats.add("coalesced")
+            return fetched
+
+    jobs = [(number, batch) for number, plan in enumerate(plans) for batch in plan["batches"]]
+    for (number, batch), fetched, error in iter_fetch(
+        jobs, fetch_batch, max_workers=settings.get("maxConcurrentRequests", DEFAULT_MAX_WORKERS)
+    ):
+        plan = plans[number]
+        if error is not None:
+            error = fetch_error_from_exception(
+                [brand["name"] for brand, keywords in plan["brand_jobs"] if set(keywords) & set(batch)], error
+            )
+        else:
+            for keyword in batch:
+                plan["keyword_volumes"].setdefault(keyword, {}).update(
+                    (month, fetched.get(keyword, {}).get(month, 0)) for month in plan["stale_months"]
+                )
+            if cache:
+                with span("cache.store", location=plan["location"], keywords=len(batch)):
+                    cache.store(fetched, batch, plan["geo"], settings["network"], plan["stale_months"])
+
+        for keyword in batch:
+            for index in plan["brands_of_keyword"][keyword]:
+                if error is not None:
+                    failures[number].setdefault(index, error)
+                remaining[number][index] -= 1
+                if remaining[number][index] == 0:
+                    yield plan, index, failures[number].get(index), time.perf_counter() - start
+
+
+def fetch_volume_matrix(brands, settings, client, customer_id, cache=None, scheduler=None,
+                        priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Retrieve monthly search volumes for the valid brands.
+
+    Returns the brand x month matrix, the colour of each matrix row and a list
+    of FetchError records; brands touched by a failed request are left out of
+    the matrix. ``cache`` is an optional KeywordMetricsCache. With a
+    RequestScheduler every request is rate limited, prioritised and retried
+    by it, and its throttled/retried/failed counts are added to ``stats``.
+    With a SingleFlight, requests identical to one already in flight wait for
+    its result and are counted as ``coalesced``.
+    """
+    from share_of_search.matrix import build_volume_matrix
+
+    plan = _plan_location(brands, settings, settings["location"], cache)
+    errors = []
+    failed = set()
+    for _, index, error, _ in _iter_brand_volumes(
+        [plan], settings, client, customer_id, cache, scheduler, priority, stats, single_flight
+    ):
+        if error is not None:
+            failed.add(index)
+            if not any(error is known for known in errors):
+                errors.append(error)
+
+    # Route the keyword tables back to the brands that were fetched completely
+    fetched_brands = [job for index, job in enumerate(plan["brand_jobs"]) if index not in failed]
+    matrix = build_volume_matrix(
+        plan["keyword_volumes"],
+        [brand["name"] for brand, _ in fetched_brands],
+        [keywords for _, keywords in fetched_brands],
+        plan["months"]
+    )
+    return matrix, [brand.get("color", DEFAULT_BRAND_COLOR) for brand, _ in fetched_brands], errors
+
+
+def stream_brand_volumes(brands, settings, locations, client, customer_id, cache=None, scheduler=None,
+                         priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Yield a BrandVolumes record for every brand and location as soon as its requests finish.
+
+    The batches of all locations share one pool of ``maxConcurrentRequests``
+    workers. Closing the generator cancels the requests that have not
+    started; what was already fetched stays in ``cache``.
+    """
+    plans = [_plan_location(brands, settings, location, cache) for location in locations]
+    located_errors = {}
+    for plan, index, error, seconds in _iter_brand_volumes(
+        plans, settings, client, customer_id, cache, scheduler, priority, stats, single_flight
+    ):
+        brand, keywords = plan["brand_jobs"][index]
+        if error is not None:
+            # Brands of one failed batch share one error record
+            if id(error) not in located_errors:
+                located_errors[id(error)] = dataclasses.replace(
+                    error, location=plan["location"],
+                    message=f"{plan['location']}: {error.message}" if len(locations) > 1 else error.message
+                )
+            error = located_errors[id(error)]
+            volumes = ()
+        else:
+            monthly = sum_keyword_volumes(plan["keyword_volumes"], keywords)
+            volumes = tuple(monthly.get(month, 0) for month in plan["months"])
+        yield BrandVolumes(
+            brand=brand["name"],
+            location=plan["location"],
+            color=brand.get("color", DEFAULT_BRAND_COLOR),
+            months=tuple(plan["months"]),
+            volumes=volumes,
+            seconds=seconds,
+            error=error
+        )
+
+
+def get_search_volumes(brands, settings, client, customer_id, cache=None, scheduler=None,
+                       priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Retrieve share-of-search results for the brands.
+
+    Returns a long brand/period/volume/share/color DataFrame and the list of
+    FetchError records for requests that failed.
+    """
+    from share_of_search.matrix import aggregate_matrix, to_results_frame
+
+    matrix, colors, errors = fetch_volume_matrix(
+        brands, settings, client, customer_id, cache=cache, scheduler=scheduler, priority=priority, stats=stats,
+        single_flight=single_flight
+    )
+
+    # Sum the months into periods and calculate share percentages for each period
+    return to_results_frame(aggregate_matrix(matrix, settings["granularity"]), colors), errors
+
+
+def fetch_location_matrices(brands, settings, locations, client, customer_id, cache=None, scheduler=None,
+                            priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Fetch the brand x month matrix of every location concurrently.
+
+    All locations go through one RequestScheduler with at most
+    ``maxConcurrentRequests`` of their requests in flight (a shared scheduler
+    is wrapped in a LimitedScheduler), so fanning out does not multiply the
+    request rate or concurrency, and each location only requests the cells
+    missing from ``cache``.
+    Returns {location: (matrix, colors)} in the order of ``locations`` and the
+    FetchError records of all locations.
+    """
+    max_requests = settings.get("maxConcurrentRequests", DEFAULT_MAX_WORKERS)
+    if scheduler is None:
+        scheduler = RequestScheduler(max_concurrent=max_requests)
+    else:
+        scheduler = LimitedScheduler(scheduler, max_requests)
+
+    outcomes = fetch_all(
+        list(locations),
+        lambda location: fetch_volume_matrix(
+            brands, {**settings, "location": location}, client, customer_id,
+            cache=cache, scheduler=scheduler, priority=priority, stats=stats,
+            single_flight=single_flight
+        ),
+        max_workers=max_requests
+    )
+
+    matrices = {}
+    errors = []
+    for location, fetched, error in outcomes:
+        if error is not None:
+            names = [brand["name"] for brand in brands if brand["name"]]
+            errors.append(dataclasses.replace(fetch_error_from_exception(names, error), location=location))
+            continue
+        matrix, colors, location_errors = fetched
+        matrices[location] = (matrix, colors)
+        errors.extend(
+            dataclasses.replace(
+                error, location=location, message=f"{location}: {error.message}" if len(locations) > 1 else error.message
+            )
+            for error in location_errors
+        )
+    return matrices, errors
+
+
+def get_search_volumes_by_location(brands, settings, locations, client, customer_id, cache=None, scheduler=None,
+                                   priority=PRIORITY_NORMAL, stats=None, single_flight=None):
+    """Retrieve share-of-search results for several locations as one long table with a ``location`` column.
+
+    Shares are calculated within each location. Returns the table and the
+    list of FetchError records.
+    """
+    from share_of_search.matrix import aggregate_matrix, concat_location_frames, to_results_frame
+
+    matrices, errors = fetch_location_matrices(
+        brands, settings, locations, client, customer_id, cache=cache, scheduler=scheduler, priority=priority, stats=stats,
+        single_flight=single_flight
+    )
+    frames = {
+        location: to_results_frame(aggregate_matrix(matrix, settings["granularity"]), colors)
+        for location, (matrix, colors) in matrices.items()
+    }
+    return concat_location_frames(frames), errors
@@ -0,0 +1,173 @@
+"""Columnar brand x month volume matrix and the vectorised share-of-search calculations on it.
+
+Result tables are compact: brand, period, colour and location are
+categoricals (integer codes plus one copy of each string) and volumes are
+integers, so a long multi-location table costs little more than its numbers.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from share_of_search.aggregation import month_range, normalize_keyword, period_label
+from share_of_search.tracing import traced
+
+RESULT_COLUMNS = ["brand", "period", "volume", "share", "color"]
+CATEGORICAL_COLUMNS = ("location", "brand", "period", "color")
+
+
+@traced("matrix.build")
+def build_volume_matrix(keyword_volumes, brand_names, brand_keyword_lists, months):
+    """Sum keyword tables into a brand x month DataFrame of integer volumes.
+
+    ``keyword_volumes`` maps normalised keywords to {(year, month): volume};
+    ``brand_keyword_lists`` holds the keywords of each brand in ``brand_names``.
+    Columns are the (year, month) pairs of ``months`` in order.
+    """
+    keywords = list(dict.fromkeys(normalize_keyword(k) for keywords in brand_keyword_lists for k in keywords))
+    keyword_index = {keyword: i for i, keyword in enumerate(keywords)}
+
+    # Keyword x month volumes
+    empty = {}
+    keyword_matrix = np.array(
+        [[cells.get(month, 0) for month in months] for cells in (keyword_volumes.get(k, empty) for k in keywords)],
+        dtype=np.int64
+    ).reshape(len(keywords), len(months))
+
+    # Each brand row is the sum of its (deduplicated) keyword rows
+    brand_rows, keyword_rows = [], []
+    for row, brand_keywords in enumerate(brand_keyword_lists):
+        for keyword in {normalize_keyword(k) for k in brand_keywords}:
+            brand_rows.append(row)
+            keyword_rows.append(keyword_index[keyword])
+    brand_matrix = np.zeros((len(brand_names), len(months)), dtype=np.int64)
+    np.add.at(brand_matrix, np.asarray(brand_rows, dtype=np.intp), keyword_matrix[np.asarray(keyword_rows, dtype=np.intp)])
+
+    return pd.DataFrame(
+        brand_matrix,
+        index=pd.Index(brand_names, name="brand"),
+        columns=pd.MultiIndex.from_tuples(months, names=["year", "month"]) if months else None
+    )
+
+
+@traced("matrix.build")
+def stack_brand_volumes(brand_names, volume_rows, months):
+    """Build a brand x month matrix from per-brand volume rows aligned with ``months``."""
+    return pd.DataFrame(
+        np.asarray(volume_rows, dtype=np.int64).reshape(len(brand_names), len(months)),
+        index=pd.Index(brand_names, name="brand"),
+        columns=pd.MultiIndex.from_tuples(months, names=["year", "month"]) if months else None
+    )
+
+
+def slice_months(matrix, date_from, date_to):
+    """Keep only the month columns between two "YYYY-MM" strings, inclusive."""
+    window = set(month_range(date_from, date_to))
+    return matrix.loc[:, [month in window for month in matrix.columns]]
+
+
+@traced("aggregate.periods")
+def aggregate_matrix(matrix, granularity):
+    """Sum the monthly columns of a volume matrix into monthly, quarterly or yearly period columns."""
+    labels = [period_label(year, month, granularity) for year, month in matrix.columns]
+    return matrix.T.groupby(labels, sort=False).sum().T.rename_axis(columns="period")
+
+
+def share_matrix(period_matrix):
+    """Return each brand's percentage of its period total, rounded to one decimal."""
+    totals = period_matrix.sum(axis=0).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(totals > 0, period_matrix.to_numpy() / totals * 100, 0.0)
+    return pd.DataFrame(np.round(shares, 1), index=period_matrix.index, columns=period_matrix.columns)
+
+
+@traced("aggregate.shares")
+def to_results_frame(period_matrix, colors):
+    """Flatten a period matrix into long brand/period/volume/share/color rows, dropping empty cells."""
+    if period_matrix.empty:
+        return compact_results(pd.DataFrame(columns=RESULT_COLUMNS))
+
+    n_brands, n_periods = period_matrix.shape
+    volumes = period_matrix.to_numpy().ravel()
+    keep = volumes > 0
+    brand_rows = np.repeat(np.arange(n_brands), n_periods)[keep]
+    return pd.DataFrame({
+        "brand": _categorical(period_matrix.index.to_numpy(), brand_rows),
+        "period": _categorical(period_matrix.columns.to_numpy(), np.tile(np.arange(n_periods), n_brands)[keep]),
+        "volume": volumes[keep],
+        "share": share_matrix(period_matrix).to_numpy().ravel()[keep],
+        "color": _categorical(np.asarray(colors, dtype=object), brand_rows),
+    })
+
+
+def _categorical(values, positions):
+    """Return ``values[positions]`` as a categorical of the values that occur, in first-seen order."""
+    codes, categories = pd.factorize(values)
+    codes = codes[positions]
+    used = np.zeros(len(categories), dtype=bool)
+    used[codes] = True
+    if not used.all():
+        codes = (np.cumsum(used) - 1)[codes]
+        categories = categories[used]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def concat_location_frames(frames):
+    """Stack per-location result frames into one long table keyed by a leading ``location`` column.
+
+    Categorical columns stay categorical, with the categories of all locations.
+    """
+    if not frames:
+        return compact_results(pd.DataFrame(columns=["location"] + RESULT_COLUMNS))
+    lengths = [len(frame) for frame in frames.values()]
+    columns = {
+        "location": pd.Categorical.from_codes(np.repeat(np.arange(len(frames)), lengths), categories=list(frames))
+    }
+    for column in RESULT_COLUMNS:
+        parts = [frame[column] for frame in frames.values()]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            # Period labels sort chronologically, so sorted categories keep periods in order
+            columns[column] = union_categoricals(parts, sort_categories=column == "period")
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return compact_results(pd.DataFrame(columns))
+
+
+def compact_results(results):
+    """Return a result table with categorical label columns and integer volumes.
+
+    Accepts tables read back from CSV/Parquet or built row by row; columns
+    that are already compact are left alone.
+    """
+    converted = {
+        column: results[column].astype(str).astype("category")
+        for column in CATEGORICAL_COLUMNS
+        if column in results.columns and not isinstance(results[column].dtype, pd.CategoricalDtype)
+    }
+    if "volume" in results.columns and not pd.api.types.is_integer_dtype(results["volume"].dtype):
+        converted["volume"] = results["volume"].fillna(0).astype(np.int64)
+    if "share" in results.columns and results["share"].dtype != np.float64:
+        converted["share"] = results["share"].astype(np.float64)
+    return results.assign(**converted) if converted else results
+
+
+def market_shares(results):
+    """Return each brand's share of the whole window's volume per location."""
+    totals = results.groupby(["location", "brand"], sort=False, observed=True)["volume"].sum().reset_index()
+    totals["share"] = (
+        totals["volume"] / totals.groupby("location", observed=True)["volume"].transform("sum") * 100
+    ).round(1)
+    return totals
+
+
+@traced("results.pivot")
+def pivot_results(results):
+    """Build the period x brand table with volume_<brand> and share_<brand> columns.
+
+    Multi-location results are indexed by location and period.
+    """
+    index = ["location", "period"] if "location" in results.columns else "period"
+    # Brand columns are ordered by name, not by the brand category order
+    results = results.assign(brand=results["brand"].astype(str))
+    pivot_df = results.pivot(index=index, columns="brand", values=["volume", "share"])
+    pivot_df.columns = [f"{value}_{brand}" for value, brand in pivot_df.columns]
+    return pivot_df.sort_index().reset_index()
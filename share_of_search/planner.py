@@ -0,0 +1,29 @@
+"""Planning of batched Keyword Planner requests across all brands of a report."""
+from share_of_search.aggregation import normalize_keyword
+
+# A GenerateKeywordIdeas KeywordSeed accepts at most 20 keywords
+MAX_SEED_KEYWORDS = 20
+
+# GenerateKeywordHistoricalMetrics accepts at most 10,000 keywords per request
+MAX_HISTORICAL_METRICS_KEYWORDS = 10000
+
+# Request batch size per fetch backend
+BATCH_SIZES = {
+    "ideas": MAX_SEED_KEYWORDS,
+    "historical": MAX_HISTORICAL_METRICS_KEYWORDS,
+}
+
+
+def brand_keywords(brand):
+    """Return the unique normalised keywords of a brand in the order they were entered."""
+    return list(dict.fromkeys(normalize_keyword(k) for k in brand["keywords"] if k.strip()))
+
+
+def unique_keywords(keyword_lists):
+    """Merge several keyword lists into one list of unique keywords in first-seen order."""
+    return list(dict.fromkeys(k for keywords in keyword_lists for k in keywords))
+
+
+def plan_keyword_batches(keywords, batch_size=MAX_SEED_KEYWORDS):
+    """Pack keywords into as few requests as the seed limit allows."""
+    return [keywords[i:i + batch_size] for i in range(0, len(keywords), batch_size)]
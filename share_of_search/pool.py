@@ -0,0 +1,160 @@
+"""Process-wide pool of Google Ads service stubs and their gRPC channels.
+
+``GoogleAdsClient.get_service`` opens a new gRPC channel on every call, so
+fetching batch after batch (and session after session in the app) kept
+opening and tearing down connections. A ServicePool keeps up to ``size``
+stubs per service and hands them out round-robin; gRPC stubs are thread-safe,
+so one stub serves concurrent requests from any session or worker thread and
+the pool size caps the channels the process keeps open.
+
+``get_service`` does not accept channel options, so keepalive is done by
+the pool itself: a stub that has been idle for ``keepalive_seconds`` is
+health checked (its channel must become ready within
+``health_check_timeout``) before it is handed out again, and replaced when
+the check fails.
+"""
+import threading
+import time
+
+from share_of_search.stats import Counters
+
+# Stubs (and gRPC channels) kept per service
+DEFAULT_POOL_SIZE = 4
+
+# Idle time after which a stub's channel is checked before reuse
+DEFAULT_KEEPALIVE_SECONDS = 60.0
+
+# Seconds an idle channel gets to become ready before it is replaced
+DEFAULT_HEALTH_CHECK_TIMEOUT = 5.0
+
+
+class PoolStats(Counters):
+    """Thread-safe counters of stubs created, handed out, health checked and replaced."""
+
+    FIELDS = ("created", "leased", "health_checks", "replaced")
+
+
+class _Slot:
+    __slots__ = ("stub", "last_used", "lock")
+
+    def __init__(self, stub, now):
+        self.stub = stub
+        self.last_used = now
+        self.lock = threading.Lock()
+
+
+class ServicePool:
+    """Round-robin pool of up to ``size`` stubs per service name, shared by all threads.
+
+    ``create(name)`` builds a stub, ``health_check(stub)`` returns whether an
+    idle stub can still be used and ``close(stub)`` releases a replaced one.
+    """
+
+    def __init__(self, create, size=DEFAULT_POOL_SIZE, keepalive_seconds=DEFAULT_KEEPALIVE_SECONDS,
+                 health_check=None, close=None, clock=time.monotonic):
+        self.size = max(1, int(size))
+        self.keepalive_seconds = keepalive_seconds
+        self.stats = PoolStats()
+        self._create = create
+        self._health_check = health_check
+        self._close = close
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next = {}
+
+    def get_service(self, name):
+        """Return a pooled stub for ``name``, creating or replacing one when needed."""
+        with self._lock:
+            slots = self._slots.setdefault(name, [])
+            if len(slots) < self.size:
+                # Grow lazily, so idle deployments only open the channels they use
+                slot = _Slot(self._create(name), self._clock())
+                slots.append(slot)
+                self.stats.add("created")
+            else:
+                index = self._next.get(name, 0)
+                self._next[name] = (index + 1) % len(slots)
+                slot = slots[index]
+
+        with slot.lock:
+            now = self._clock()
+            if self._health_check is not None and now - slot.last_used >= self.keepalive_seconds:
+                self.stats.add("health_checks")
+                if not self._health_check(slot.stub):
+                    self._discard(slot.stub)
+                    slot.stub = self._create(name)
+                    self.stats.add("created")
+                    self.stats.add("replaced")
+            slot.last_used = now
+            self.stats.add("leased")
+            return slot.stub
+
+    def close(self):
+        """Close every pooled stub; the pool creates new ones if it is used again."""
+        with self._lock:
+            slots = [slot for name_slots in self._slots.values() for slot in name_slots]
+            self._slots.clear()
+            self._next.clear()
+        for slot in slots:
+            self._discard(slot.stub)
+
+    def _discard(self, stub):
+        if self._close is not None:
+            try:
+                self._close(stub)
+            except Exception:
+                pass
+
+
+def channel_is_healthy(stub, timeout=DEFAULT_HEALTH_CHECK_TIMEOUT):
+    """Return True when the stub's gRPC channel becomes ready within ``timeout`` seconds.
+
+    Stubs without a gRPC transport (e.g. benchmark fakes) are always healthy.
+    """
+    channel = getattr(getattr(stub, "transport", None), "grpc_channel", None)
+    if channel is None:
+        return True
+
+    import grpc
+
+    try:
+        grpc.channel_ready_future(channel).result(timeout=timeout)
+        return True
+    except grpc.FutureTimeoutError:
+        return False
+
+
+def close_stub(stub):
+    """Close the transport, and with it the gRPC channel, of a service stub."""
+    transport = getattr(stub, "transport", None)
+    if transport is not None:
+        transport.close()
+
+
+class PooledGoogleAdsClient:
+    """GoogleAdsClient stand-in whose ``get_service`` hands out pooled stubs.
+
+    Everything else (``get_type``, ``enums``, ...) is delegated to the wrapped
+    client, so it can be passed wherever the fetch pipeline expects a client.
+    """
+
+    def __init__(self, client, size=DEFAULT_POOL_SIZE, keepalive_seconds=DEFAULT_KEEPALIVE_SECONDS,
+                 health_check_timeout=DEFAULT_HEALTH_CHECK_TIMEOUT):
+        self.client = client
+        self.pool = ServicePool(
+            client.get_service,
+            size=size,
+            keepalive_seconds=keepalive_seconds,
+            health_check=lambda stub: channel_is_healthy(stub, health_check_timeout),
+            close=close_stub
+        )
+
+    def get_service(self, name):
+        return self.pool.get_service(name)
+
+    def close(self):
+        self.pool.close()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,188 @@
+"""Quota-aware scheduling of Keyword Planner requests.
+
+Every request goes through a RequestScheduler, which
+
+* spaces requests with a token bucket (requests per second plus a burst),
+* enforces an optional daily operations budget,
+* caps the requests in flight,
+* serves waiting requests by priority (lower numbers first), and
+* retries retryable API errors with exponential backoff and full jitter.
+
+Counters for throttled, retried and failed requests are kept per scheduler and
+optionally per run through a SchedulerStats passed to ``call``.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from datetime import date
+
+from share_of_search.errors import error_code
+from share_of_search.stats import Counters
+from share_of_search.tracing import span
+
+# gRPC status codes worth retrying; quota and transient server errors
+RETRYABLE_CODES = frozenset({"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "ABORTED", "INTERNAL"})
+
+# Request priorities; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BATCH = 10
+
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+DEFAULT_MAX_RETRIES = 4
+
+
+class DailyQuotaExceeded(Exception):
+    """Raised instead of sending a request once the daily operations budget is used up."""
+
+    code = "DAILY_QUOTA_EXCEEDED"
+
+
+class SchedulerStats(Counters):
+    """Thread-safe counters of the requests that went through a scheduler.
+
+    ``coalesced`` counts requests that were not sent because an identical one
+    was already in flight (see share_of_search.singleflight).
+    """
+
+    FIELDS = ("requests", "throttled", "retried", "failed", "rejected", "coalesced")
+
+
+class RequestScheduler:
+    """Central gate for API calls with rate limiting, a daily budget, priorities and retries."""
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=None, daily_operations=None,
+                 max_concurrent=None, max_retries=DEFAULT_MAX_RETRIES, base_delay=1.0, max_delay=30.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=None):
+        if not requests_per_second > 0:
+            raise ValueError(f"requests_per_second must be positive, got {requests_per_second!r}")
+        self.rate = float(requests_per_second)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self.daily_operations = daily_operations
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = SchedulerStats()
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+
+        self._condition = threading.Condition()
+        self._tokens = self.capacity
+        self._refilled_at = clock()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._day = date.today()
+        self._operations_today = 0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _take_daily_operation(self):
+        today = date.today()
+        if today != self._day:
+            self._day, self._operations_today = today, 0
+        if self.daily_operations is not None and self._operations_today >= self.daily_operations:
+            raise DailyQuotaExceeded(f"Daily budget of {self.daily_operations} operations is used up")
+        self._operations_today += 1
+
+    def _acquire(self, priority):
+        """Block until this request may be sent; return True if it had to wait for a token or slot."""
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            throttled = False
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == ticket:
+                        self._refill()
+                        slot_free = self.max_concurrent is None or self._in_flight < self.max_concurrent
+                        if self._tokens >= 1 and slot_free:
+                            self._take_daily_operation()
+                            self._tokens -= 1
+                            self._in_flight += 1
+                            return throttled
+                        if self._tokens < 1:
+                            timeout = (1 - self._tokens) / self.rate
+                    throttled = True
+                    self._condition.wait(timeout)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def backoff_delay(self, attempt, error=None):
+        """Return the wait before retry ``attempt`` (0-based): full jitter, or the server's retry delay if longer."""
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_delay_hint(error) or 0)
+
+    def call(self, fn, *args, priority=PRIORITY_NORMAL, stats=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` under the scheduler's limits, retrying retryable errors."""
+        counters = [self.stats] + ([stats] if stats is not None else [])
+
+        def count(field):
+            for counter in counters:
+                counter.add(field)
+
+        attempt = 0
+        while True:
+            try:
+                with span("scheduler.wait", priority=priority, attempt=attempt):
+                    throttled = self._acquire(priority)
+            except DailyQuotaExceeded:
+                count("rejected")
+                raise
+            count("requests")
+            if throttled:
+                count("throttled")
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if error_code(e) not in RETRYABLE_CODES or attempt >= self.max_retries:
+                    count("failed")
+                    raise
+                delay = self.backoff_delay(attempt, e)
+            finally:
+                self._release()
+            count("retried")
+            attempt += 1
+            with span("scheduler.backoff", attempt=attempt, seconds=round(delay, 3)):
+                self._sleep(delay)
+
+
+class LimitedScheduler:
+    """A shared RequestScheduler seen by one report, which may have at most ``max_concurrent`` calls in it.
+
+    Calls over the cap wait here before queueing at the shared scheduler,
+    whose rate limit, budget and own in-flight cap still apply.
+    """
+
+    def __init__(self, scheduler, max_concurrent):
+        self.scheduler = scheduler
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def call(self, fn, *args, **kwargs):
+        with self._slots:
+            return self.scheduler.call(fn, *args, **kwargs)
+
+
+def retry_delay_hint(error):
+    """Return the retry delay in seconds a Google Ads quota error asks for, if any."""
+    failure = getattr(error, "failure", None)
+    for error_detail in getattr(failure, "errors", []):
+        retry_delay = getattr(getattr(getattr(error_detail, "details", None), "quota_error_details", None), "retry_delay", None)
+        if retry_delay is not None and (retry_delay.seconds or retry_delay.nanos):
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    return None
@@ -0,0 +1,80 @@
+"""Single-flight coalescing of identical Keyword Planner requests.
+
+When several sessions (or batch jobs) ask for the same keyword batch for the
+same customer, geo target, network, endpoint and month range at the same
+time, only the first request is sent; the others wait for it and share its
+result or exception. A request that arrives after the first one finished is
+sent again (and usually answered by the keyword cache before it gets here).
+"""
+import threading
+
+from share_of_search.stats import Counters
+
+
+class SingleFlightStats(Counters):
+    """Thread-safe counters of the calls that went through a SingleFlight."""
+
+    FIELDS = ("calls", "executed", "coalesced")
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and fan its outcome out to every concurrent caller.
+
+    Waiters receive the very object the first call returned, so results must
+    be treated as read-only.
+    """
+
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def call(self, key, fn, *args, **kwargs):
+        """Return ``(result, coalesced)``, where ``coalesced`` is True when another caller's request was awaited."""
+        self.stats.add("calls")
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self.stats.add("coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        self.stats.add("executed")
+        try:
+            flight.result = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+def request_key(customer_id, settings, keywords, first_month, last_month):
+    """Return the key under which identical Keyword Planner requests are coalesced."""
+    return (
+        str(customer_id),
+        settings.get("backend", "ideas"),
+        settings["location"],
+        settings["network"],
+        tuple(first_month),
+        tuple(last_month),
+        tuple(sorted(keywords)),
+    )
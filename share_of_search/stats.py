@@ -0,0 +1,20 @@
+"""Thread-safe named counters shared by the scheduler, pool, single-flight and API statistics."""
+import threading
+
+
+class Counters:
+    """Thread-safe counters of the names in ``FIELDS``; subclasses only define ``FIELDS``."""
+
+    FIELDS = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counts)
@@ -0,0 +1,179 @@
+"""Lightweight timing spans for the fetch and report pipeline.
+
+Spans are only recorded while a Tracer is active (``with activate(tracer):``);
+otherwise ``span()`` costs a context variable lookup. The active tracer and
+the current span live in context variables, and fetch.fetch_all/iter_fetch
+run each job in a copy of the submitting context, so spans opened on worker
+threads nest under the span that started the fetch.
+
+A tracer exports its spans as plain JSON records, as an OpenTelemetry
+OTLP/JSON document (``to_otel``) that collectors and trace viewers accept,
+or as per-name totals (``summary``).
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+_active_tracer = contextvars.ContextVar("share_of_search_tracer", default=None)
+_current_span = contextvars.ContextVar("share_of_search_span", default=None)
+
+
+class Tracer:
+    """Collects the finished spans of one trace; safe to use from several threads."""
+
+    def __init__(self, service_name="share-of-search"):
+        self.service_name = service_name
+        self.trace_id = os.urandom(16).hex()
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def record(self, span_record):
+        with self._lock:
+            self._spans.append(span_record)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def spans(self):
+        """Return the finished spans ordered by start time."""
+        with self._lock:
+            return sorted(self._spans, key=lambda record: record["start"])
+
+    def to_json(self):
+        """Return the spans as JSON records with start offsets and durations in milliseconds."""
+        spans = self.spans()
+        origin = spans[0]["start"] if spans else 0
+        return json.dumps({
+            "traceId": self.trace_id,
+            "spans": [
+                {
+                    "name": record["name"],
+                    "spanId": record["spanId"],
+                    "parentSpanId": record["parentSpanId"],
+                    "thread": record["thread"],
+                    "startMs": round((record["start"] - origin) / 1e6, 3),
+                    "durationMs": round((record["end"] - record["start"]) / 1e6, 3),
+                    "attributes": record["attributes"],
+                }
+                for record in spans
+            ],
+        }, indent=2, default=str)
+
+    def to_otel(self):
+        """Return the spans as an OpenTelemetry OTLP/JSON ``resourceSpans`` document."""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otel_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "share_of_search"},
+                    "spans": [
+                        {
+                            "traceId": self.trace_id,
+                            "spanId": record["spanId"],
+                            "parentSpanId": record["parentSpanId"] or "",
+                            "name": record["name"],
+                            # SPAN_KIND_INTERNAL
+                            "kind": 1,
+                            "startTimeUnixNano": str(record["start"]),
+                            "endTimeUnixNano": str(record["end"]),
+                            "attributes": [
+                                _otel_attribute(key, value)
+                                for key, value in {**record["attributes"], "thread.name": record["thread"]}.items()
+                            ],
+                        }
+                        for record in self.spans()
+                    ],
+                }],
+            }]
+        }
+
+    def summary(self):
+        """Return one row per span name with its count and total/mean/max milliseconds, slowest first."""
+        totals = {}
+        for record in self.spans():
+            duration = (record["end"] - record["start"]) / 1e6
+            count, total, longest = totals.get(record["name"], (0, 0.0, 0.0))
+            totals[record["name"]] = (count + 1, total + duration, max(longest, duration))
+        return [
+            {"span": name, "count": count, "totalMs": round(total, 3), "meanMs": round(total / count, 3),
+             "maxMs": round(longest, 3)}
+            for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1])
+        ]
+
+
+def _otel_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@contextlib.contextmanager
+def activate(tracer):
+    """Record the spans opened in this context (and the fetch workers it starts) into ``tracer``."""
+    token = _active_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active_tracer.reset(token)
+
+
+def set_active_tracer(tracer):
+    """Make ``tracer`` (or None) the active tracer of the current context until it is set again.
+
+    For callers that cannot wrap their work in ``activate``, such as a
+    Streamlit script run.
+    """
+    _active_tracer.set(tracer)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span of the active tracer.
+
+    Yields the span's attribute dict (or None when tracing is off) so callers
+    can add attributes that are only known at the end, such as result sizes.
+    """
+    tracer = _active_tracer.get()
+    if tracer is None:
+        yield None
+        return
+
+    span_id = os.urandom(8).hex()
+    record = {
+        "name": name,
+        "spanId": span_id,
+        "parentSpanId": _current_span.get(),
+        "thread": threading.current_thread().name,
+        "attributes": attributes,
+    }
+    token = _current_span.set(span_id)
+    record["start"] = time.time_ns()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record["end"] = time.time_ns()
+        _current_span.reset(token)
+        tracer.record(record)
+
+
+def traced(name):
+    """Decorator that times every call of a function as a span called ``name``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
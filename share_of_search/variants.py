@@ -0,0 +1,222 @@
+"""Discovery of brand variants among the keyword ideas a report fetch discards.
+
+GenerateKeywordIdeas returns hundreds of related ideas per request, but the
+fetch only keeps the seed keywords. Among the rest are diacritic and spacing
+variants ("skoda" for "škoda"), misspellings ("addidas") and brand + product
+queries ("nike air max") that belong to a brand's volume. Idea texts are
+folded to plain lower-case ASCII-like tokens and matched against the terms of
+all brands at once through a VariantIndex: terms are looked up by their first
+token, spacing variants are terms of their own (tokens joined or one token
+split in two), and tokens that are not spelled exactly like a brand token are
+matched through a trigram index and a bounded edit distance, once per
+distinct token.
+"""
+import collections
+import itertools
+
+from share_of_search.aggregation import month_range
+from share_of_search.errors import fetch_error_from_exception
+from share_of_search.fetch import DEFAULT_MAX_WORKERS, fetch_all
+from share_of_search.fuzzy import edit_distance, fold_text, max_edits, trigrams
+from share_of_search.geo import location_id
+from share_of_search.keyword_planner import fetch_keyword_ideas
+from share_of_search.planner import BATCH_SIZES, brand_keywords, plan_keyword_batches, unique_keywords
+from share_of_search.scheduler import PRIORITY_INTERACTIVE
+from share_of_search.tracing import span
+
+# Match kinds, from the closest to the loosest
+SPELLING_VARIANT = "spelling variant"
+MISSPELLING = "misspelling"
+BRAND_WITH_WORDS = "brand + words"
+MISSPELLING_WITH_WORDS = "misspelling + words"
+MATCH_KINDS = (SPELLING_VARIANT, MISSPELLING, BRAND_WITH_WORDS, MISSPELLING_WITH_WORDS)
+
+# Shortest part of a brand token written apart ("lulu lemon"); single letters split off are not variants
+MIN_SPLIT_LENGTH = 2
+
+
+def split_forms(term):
+    """Return the forms of a term (a tuple of tokens) with one of its tokens split in two."""
+    return {
+        term[:position] + (token[:split], token[split:]) + term[position + 1:]
+        for position, token in enumerate(term)
+        for split in range(MIN_SPLIT_LENGTH, len(token) - MIN_SPLIT_LENGTH + 1)
+    }
+
+
+class VariantIndex:
+    """Match folded keyword texts against the terms of many brands at once.
+
+    Every brand name and keyword is a term; multi-word terms are also added
+    without their spaces ("coca cola" also matches "cocacola"), and every
+    term with one of its tokens split in two ("lululemon" also matches "lulu
+    lemon"; the two parts must be spelled exactly). ``match`` returns the
+    brand index and match kind of a text, or None when the text matches no
+    brand or the terms of several brands.
+    """
+
+    def __init__(self, brands):
+        self.brands = brands
+        # First token -> [(brand index, term tokens)]
+        self._terms = {}
+        # Tokens of the brand terms as written or joined; the parts of split tokens are only matched exactly
+        fuzzy_tokens = set()
+        seen = set()
+        for index, brand in enumerate(brands):
+            for text in [brand["name"], *brand_keywords(brand)]:
+                tokens = tuple(fold_text(text).split())
+                forms = {tokens, ("".join(tokens),)} if len(tokens) > 1 else {tokens}
+                fuzzy_tokens.update(token for term in forms for token in term)
+                for term in forms | {split for term in forms for split in split_forms(term)}:
+                    if term and (index, term) not in seen:
+                        seen.add((index, term))
+                        self._terms.setdefault(term[0], []).append((index, term))
+
+        # Trigram -> brand tokens that tolerate edits, for the fuzzy token lookup
+        self._tokens = {token for terms in self._terms.values() for _, term in terms for token in term}
+        self._trigrams = {}
+        # Brand token -> (edits it tolerates, distinct trigrams)
+        self._limits = {}
+        self._max_length = max((len(token) for token in fuzzy_tokens), default=0)
+        for token in fuzzy_tokens:
+            if max_edits(token):
+                token_trigrams = trigrams(token)
+                self._limits[token] = (max_edits(token), len(token_trigrams))
+                for trigram in token_trigrams:
+                    self._trigrams.setdefault(trigram, []).append(token)
+        self._token_matches = {}
+
+    def token_matches(self, token):
+        """Return ``{brand token: edits}`` for the brand tokens ``token`` is a spelling of, memoised per token."""
+        matches = self._token_matches.get(token)
+        if matches is not None:
+            return matches
+
+        matches = {token: 0} if token in self._tokens else {}
+        # A token is at most max_edits(candidate) <= 2 letters longer than a brand token it is a spelling of
+        if len(token) > self._max_length + 2:
+            self._token_matches[token] = matches
+            return matches
+
+        # An edit changes at most three of a token's padded trigrams and a swap of adjacent letters four, so a
+        # token within d edits of a brand token shares all but at most 4d of the distinct trigrams of either
+        token_trigrams = trigrams(token)
+        shared = collections.Counter(itertools.chain.from_iterable(
+            self._trigrams.get(trigram, ()) for trigram in token_trigrams
+        ))
+        for candidate, count in shared.items():
+            limit, candidate_trigrams = self._limits[candidate]
+            if candidate != token and count >= max(len(token_trigrams), candidate_trigrams) - 4 * limit:
+                edits = edit_distance(token, candidate, limit)
+                if edits <= limit:
+                    matches[candidate] = edits
+        self._token_matches[token] = matches
+        return matches
+
+    def _match_term(self, tokens, start, term, first_edits):
+        """Return the edits needed for ``term`` to match ``tokens`` from ``start``, or None."""
+        if start + len(term) > len(tokens):
+            return None
+        edits = first_edits
+        for offset in range(1, len(term)):
+            token_edits = self.token_matches(tokens[start + offset]).get(term[offset])
+            if token_edits is None:
+                return None
+            edits += token_edits
+        return edits
+
+    def match(self, text):
+        """Return ``(brand index, match kind)`` for a keyword text, or None."""
+        tokens = fold_text(text).split()
+        best = {}
+        for start, token in enumerate(tokens):
+            for brand_token, first_edits in self.token_matches(token).items():
+                for index, term in self._terms.get(brand_token, ()):
+                    edits = self._match_term(tokens, start, term, first_edits)
+                    if edits is None:
+                        continue
+                    # Prefer the term that leaves the fewest extra words, then the fewest edits
+                    rank = (len(tokens) - len(term), edits)
+                    if index not in best or rank < best[index]:
+                        best[index] = rank
+        if len(best) != 1:
+            return None
+
+        (index, (extra_words, edits)), = best.items()
+        if extra_words:
+            return index, MISSPELLING_WITH_WORDS if edits else BRAND_WITH_WORDS
+        return index, MISSPELLING if edits else SPELLING_VARIANT
+
+
+def match_variants(brands, idea_volumes, months):
+    """Match fetched ideas against the brands and return their variants as a DataFrame.
+
+    ``idea_volumes`` maps normalised idea texts to {(year, month): volume}.
+    Ideas that are already a keyword of some brand are left out. The result
+    has one row per variant with its brand, match kind and total volume over
+    ``months``, ordered by brand and falling volume.
+    """
+    import pandas as pd
+
+    tracked = set(unique_keywords(brand_keywords(brand) for brand in brands))
+    index = VariantIndex(brands)
+    rows = []
+    with span("variants.match", ideas=len(idea_volumes)):
+        for text, volumes in idea_volumes.items():
+            if text in tracked:
+                continue
+            matched = index.match(text)
+            if matched is None:
+                continue
+            brand_index, kind = matched
+            rows.append((brand_index, brands[brand_index]["name"], text, kind, sum(volumes.get(m, 0) for m in months)))
+
+    variants = pd.DataFrame(rows, columns=["order", "brand", "keyword", "match", "volume"])
+    variants = variants.sort_values(["order", "volume", "keyword"], ascending=[True, False, True], kind="stable")
+    return variants.drop(columns="order").reset_index(drop=True)
+
+
+def discover_brand_variants(brands, settings, client, customer_id, cache=None, scheduler=None, stats=None):
+    """Request keyword ideas for the keywords of ``brands`` and propose the ideas that are variants of a brand.
+
+    Ideas are requested in the report's location and network with the same
+    seed batches as a keyword ideas report, at interactive priority when a
+    RequestScheduler is given. The monthly volumes of the seed keywords and
+    the proposed variants are stored in ``cache`` (a KeywordMetricsCache), so
+    the next report and adding variants to a brand cost no further request. Returns the variants DataFrame (see
+    match_variants) and a list of FetchError records.
+    """
+    months = month_range(settings["dateFrom"], settings["dateTo"])
+    brands = [brand for brand in brands if brand["name"] and any(k.strip() for k in brand["keywords"])]
+    keywords = unique_keywords(brand_keywords(brand) for brand in brands)
+
+    def fetch_one(batch):
+        args = (client, customer_id, batch, settings, months[0], months[-1])
+        with span("variants.batch", keywords=len(batch)):
+            if scheduler is None:
+                return fetch_keyword_ideas(*args)
+            return scheduler.call(fetch_keyword_ideas, *args, priority=PRIORITY_INTERACTIVE, stats=stats)
+
+    outcomes = fetch_all(
+        plan_keyword_batches(keywords, BATCH_SIZES["ideas"]), fetch_one,
+        max_workers=settings.get("maxConcurrentRequests", DEFAULT_MAX_WORKERS)
+    )
+
+    idea_volumes, errors, fetched_keywords = {}, [], []
+    for batch, fetched, error in outcomes:
+        if error is not None:
+            batch_keywords = set(batch)
+            errors.append(fetch_error_from_exception(
+                [brand["name"] for brand in brands if batch_keywords.intersection(brand_keywords(brand))], error
+            ))
+            continue
+        fetched_keywords.extend(batch)
+        for text, volumes in fetched.items():
+            idea_volumes.setdefault(text, volumes)
+
+    variants = match_variants(brands, idea_volumes, months)
+    if cache:
+        store_keywords = fetched_keywords + list(variants["keyword"])
+        with span("cache.store", keywords=len(store_keywords)):
+            cache.store(idea_volumes, store_keywords, location_id(settings["location"]), settings["network"], months)
+    return variants, errors
@@ -0,0 +1,37 @@
+import type { Brand, SearchResult, SearchSettings } from "@/pages/Index";
+
+// Base URL of the share_of_search.api server, e.g. http://localhost:8000; unset means no backend
+export const API_URL: string | undefined = import.meta.env.VITE_API_URL;
+
+type SearchVolumesResponse = {
+  results: SearchResult[];
+  errors: { brands: string[]; message: string }[];
+};
+
+// Responses already received, by request body, so a repeated request only revalidates its ETag
+const responseCache = new Map<string, { etag: string; response: SearchVolumesResponse }>();
+
+export async function fetchSearchVolumes(brands: Brand[], settings: SearchSettings): Promise<SearchVolumesResponse> {
+  const body = JSON.stringify({ brands, settings });
+  const cached = responseCache.get(body);
+  const headers: Record<string, string> = { "Content-Type": "application/json" };
+  if (cached) {
+    headers["If-None-Match"] = cached.etag;
+  }
+
+  const response = await fetch(`${API_URL}/api/search-volumes`, { method: "POST", headers, body });
+  if (response.status === 304 && cached) {
+    return cached.response;
+  }
+  if (!response.ok) {
+    const detail = await response.json().catch(() => ({ error: response.statusText }));
+    throw new Error(detail.error || `Request failed with status ${response.status}`);
+  }
+
+  const data: SearchVolumesResponse = await response.json();
+  const etag = response.headers.get("ETag");
+  if (etag) {
+    responseCache.set(body, { etag, response: data });
+  }
+  return data;
+}
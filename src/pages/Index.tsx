@@ -6,6 +6,7 @@ import SettingsForm from "@/components/SettingsForm";
 import ResultsSection from "@/components/ResultsSection";
 import SetupGuide from "@/components/SetupGuide";
 import { toast } from "sonner";
+import { API_URL, fetchSearchVolumes } from "@/lib/api";
 import { Search, BarChart3 } from "lucide-react";
 
 // Define types for our data
@@ -104,15 +105,20 @@ const Index = () => {
 
     setIsLoading(true);
     
-    // In a real app, we would make an API call here to fetch data from Google Ads
-    // For now, we'll simulate the API call with a timeout and mock data
+    // Fetch from the share_of_search API when VITE_API_URL points at one, otherwise show mock data
     try {
-      // Simulate API call delay
-      await new Promise(resolve => setTimeout(resolve, 1500));
-      
-      // Create mock data based on the brands and time range
-      const mockResults = generateMockResults(brands, searchSettings);
-      setResults(mockResults);
+      if (API_URL) {
+        const response = await fetchSearchVolumes(brands, searchSettings);
+        response.errors.forEach(error => toast.error(error.message));
+        setResults(response.results);
+      } else {
+        // Simulate API call delay
+        await new Promise(resolve => setTimeout(resolve, 1500));
+
+        // Create mock data based on the brands and time range
+        const mockResults = generateMockResults(brands, searchSettings);
+        setResults(mockResults);
+      }
       setStep('results');
     } catch (error) {
       console.error("Error generating analysis:", error);